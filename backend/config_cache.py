@@ -0,0 +1,103 @@
+"""In-process cache for the Jira/LLM/template config tables"""
+import os
+import time
+import asyncio
+import threading
+from typing import Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from database import get_db
+from metrics import CACHE_REQUESTS
+from models import JiraConfigRecord, LLMConfigRecord, LLMProviderRecord, TemplateConfigRecord
+
+# How long a worker trusts its cached copy before checking the version counter.
+# Writes made by this worker invalidate immediately; other workers' writes are
+# picked up within this window.
+CONFIG_CACHE_RECHECK_SECONDS = float(os.getenv("CONFIG_CACHE_RECHECK_SECONDS", "5"))
+
+# name -> (table, record model, whether the table holds a list of rows)
+_TABLES: Dict[str, Tuple[str, Type[BaseModel], bool]] = {
+    "jira": ("jira_config", JiraConfigRecord, False),
+    "llm": ("llm_config", LLMConfigRecord, False),
+    "template": ("template_config", TemplateConfigRecord, False),
+    "llm_providers": ("llm_providers", LLMProviderRecord, True),
+}
+
+class ConfigCache:
+    """Loads each config row once and reloads it only when its version changes"""
+
+    def __init__(self, recheck_seconds: float = CONFIG_CACHE_RECHECK_SECONDS):
+        self.recheck_seconds = recheck_seconds
+        self._lock = threading.Lock()
+        # name -> (record or None, version, checked_at)
+        self._entries: Dict[str, Tuple[Optional[BaseModel], int, float]] = {}
+
+    def _read_version(self, conn, name: str) -> int:
+        row = conn.execute("SELECT version FROM config_version WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def _load(self, name: str, known: Optional[Tuple[Optional[BaseModel], int, float]]):
+        table, model, many = _TABLES[name]
+        conn = get_db()
+        try:
+            version = self._read_version(conn, name)
+            if known is not None and known[1] == version:
+                return known[0], version
+            if many:
+                rows = conn.execute(f"SELECT * FROM {table} ORDER BY id").fetchall()
+                return [model(**dict(row)) for row in rows], version
+            row = conn.execute(f"SELECT * FROM {table} LIMIT 1").fetchone()
+            return (model(**dict(row)) if row else None), version
+        finally:
+            conn.close()
+
+    def get(self, name: str) -> Optional[BaseModel]:
+        """Return the cached config record for `name`, or None if not configured"""
+        entry = self._entries.get(name)
+        if entry is not None and time.monotonic() - entry[2] < self.recheck_seconds:
+            CACHE_REQUESTS.inc(cache="config", result="hit")
+            return entry[0]
+        CACHE_REQUESTS.inc(cache="config", result="recheck")
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and time.monotonic() - entry[2] < self.recheck_seconds:
+                return entry[0]
+            record, version = self._load(name, entry)
+            self._entries[name] = (record, version, time.monotonic())
+            return record
+
+    async def aget(self, name: str) -> Optional[BaseModel]:
+        """get() for async callers: hits are served inline, rechecks read SQLite on a worker thread"""
+        entry = self._entries.get(name)
+        if entry is not None and time.monotonic() - entry[2] < self.recheck_seconds:
+            CACHE_REQUESTS.inc(cache="config", result="hit")
+            return entry[0]
+        return await asyncio.to_thread(self.get, name)
+
+    async def refresh(self, *names: str):
+        """Revalidate configs off the event loop so the sync accessors below are served from memory"""
+        for name in names:
+            await self.aget(name)
+
+    def invalidate(self, name: Optional[str] = None):
+        """Drop one cached config (or all of them) after a write"""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def jira(self) -> Optional[JiraConfigRecord]:
+        return self.get("jira")
+
+    def llm(self) -> Optional[LLMConfigRecord]:
+        return self.get("llm")
+
+    def template(self) -> Optional[TemplateConfigRecord]:
+        return self.get("template")
+
+    def llm_providers(self) -> List[LLMProviderRecord]:
+        return self.get("llm_providers") or []
+
+config_cache = ConfigCache()
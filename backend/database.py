@@ -1,14 +1,179 @@
 import sqlite3
+import threading
+import zlib
+from collections import Counter
 from pathlib import Path
 import os
 
 DB_PATH = os.getenv("DATABASE_PATH", "./app.db")
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+SQLITE_STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE", "256"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Compressing plan content roughly halves the database, but every content read
+# then pays for inflating it (about 2x the read time in bench_storage.py). Set 0 to
+# store new plans as plain text; compressed rows stay readable either way.
+CONTENT_COMPRESSION = os.getenv("CONTENT_COMPRESSION", "1") == "1"
+CONTENT_COMPRESSION_LEVEL = int(os.getenv("CONTENT_COMPRESSION_LEVEL", "6"))
+# A shared dictionary is trained once this many plans exist; until then rows are
+# compressed without one. 32 KB is the largest dictionary deflate can use.
+CONTENT_DICT_MIN_SAMPLES = int(os.getenv("CONTENT_DICT_MIN_SAMPLES", "20"))
+# A fresh dictionary is trained after this many more plans, so it follows the way
+# plans drift (0 disables retraining). Older rows keep the dictionary they name.
+CONTENT_DICT_RETRAIN_EVERY = int(os.getenv("CONTENT_DICT_RETRAIN_EVERY", "500"))
+CONTENT_DICT_SIZE = 32 * 1024
+
+# Compressed content is stored as a BLOB: codec byte, dictionary id, deflate stream.
+# Rows written before compression are plain TEXT and read back unchanged.
+CODEC_ZLIB = 1
+
+def train_dictionary(samples: list, size: int = CONTENT_DICT_SIZE) -> bytes:
+    """Build a deflate dictionary from the lines most shared across sample plans"""
+    counts = Counter()
+    for sample in samples:
+        counts.update(set(line for line in sample.splitlines(keepends=True) if len(line.strip()) > 3))
+    # Lines seen in at least two plans, weighted by the bytes they would save
+    common = [line for line, n in counts.items() if n > 1]
+    common.sort(key=lambda line: counts[line] * len(line), reverse=True)
+    picked, total = [], 0
+    for line in common:
+        encoded = line.encode()
+        if total + len(encoded) > size:
+            continue
+        picked.append(encoded)
+        total += len(encoded)
+    # Deflate matches recent bytes most cheaply, so the most valuable lines go last
+    return b"".join(reversed(picked))
+
+class ContentCodec:
+    """Compresses generated plan content with zlib and a trained, versioned dictionary"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._dictionaries = {0: b""}
+        self._active_id = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Read dictionaries on a private connection (this may run inside an SQL function)"""
+        conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+        try:
+            rows = conn.execute("SELECT id, dictionary FROM content_dictionaries ORDER BY id").fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+        finally:
+            conn.close()
+        with self._lock:
+            for row_id, dictionary in rows:
+                self._dictionaries[row_id] = dictionary
+            self._active_id = rows[-1][0] if rows else 0
+
+    def reset(self):
+        """Forget the active dictionary so the next compress() picks up a newly trained one"""
+        self._active_id = None
+
+    def compress(self, text: str) -> bytes:
+        if self._active_id is None:
+            self._load()
+        dictionary_id = self._active_id
+        if dictionary_id:
+            compressor = zlib.compressobj(CONTENT_COMPRESSION_LEVEL, zdict=self._dictionaries[dictionary_id])
+        else:
+            compressor = zlib.compressobj(CONTENT_COMPRESSION_LEVEL)
+        body = compressor.compress(text.encode()) + compressor.flush()
+        return bytes([CODEC_ZLIB]) + dictionary_id.to_bytes(4, "big") + body
+
+    def decompress(self, value):
+        """Return stored content as text; legacy TEXT rows pass through"""
+        if value is None or isinstance(value, str):
+            return value
+        value = bytes(value)
+        if value[0] != CODEC_ZLIB:
+            raise ValueError(f"Unknown content codec {value[0]}")
+        dictionary_id = int.from_bytes(value[1:5], "big")
+        if dictionary_id not in self._dictionaries:
+            self._load()
+        if dictionary_id:
+            decompressor = zlib.decompressobj(zdict=self._dictionaries[dictionary_id])
+        else:
+            decompressor = zlib.decompressobj()
+        return (decompressor.decompress(value[5:]) + decompressor.flush()).decode()
+
+class ManagedConnection(sqlite3.Connection):
+    """Persistent per-thread connection; close() releases it back to the manager"""
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def shutdown(self):
+        """Actually close the underlying connection"""
+        super().close()
+
+class ConnectionManager:
+    """Hands out one long-lived, tuned SQLite connection per thread"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self.codec = ContentCodec(db_path)
+
+    def _connect(self) -> ManagedConnection:
+        conn = sqlite3.connect(
+            self.db_path,
+            factory=ManagedConnection,
+            cached_statements=SQLITE_STATEMENT_CACHE,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        # WAL lets export/config reads proceed while history writes commit
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        # Lets SQL (the FTS index, ad-hoc queries) read compressed plan content
+        conn.create_function("plan_text", 1, self.codec.decompress, deterministic=True)
+        return conn
+
+    def connection(self) -> ManagedConnection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close_all(self):
+        """Close every connection opened by this manager"""
+        with self._lock:
+            for conn in self._connections:
+                conn.shutdown()
+            self._connections.clear()
+        self._local = threading.local()
+
+db_manager = ConnectionManager(DB_PATH)
 
 def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get this thread's database connection"""
+    return db_manager.connection()
+
+def close_db():
+    """Close all pooled database connections"""
+    db_manager.close_all()
+
+def compress_content(text: str):
+    """Encode plan content for generation_history.generated_content"""
+    if not CONTENT_COMPRESSION:
+        return text
+    return db_manager.codec.compress(text)
+
+def decompress_content(value) -> str:
+    """Decode generation_history.generated_content (compressed BLOB or legacy TEXT)"""
+    return db_manager.codec.decompress(value)
 
 def init_db():
     """Initialize database with schema from gemini.md"""
@@ -45,6 +210,26 @@ def init_db():
         )
     ''')
     
+    # LLM Providers Table (extra providers/models for the router; same settings as llm_config)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_providers (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            provider TEXT NOT NULL,
+            grok_api_key TEXT,
+            grok_model TEXT DEFAULT 'grok-2',
+            grok_temperature REAL DEFAULT 0.7,
+            grok_max_tokens INTEGER DEFAULT 2000,
+            ollama_url TEXT DEFAULT 'http://localhost:11434',
+            ollama_model TEXT,
+            weight REAL NOT NULL DEFAULT 1.0,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            connection_status TEXT DEFAULT 'untested',
+            last_tested_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
     # Template Config Table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS template_config (
@@ -73,8 +258,287 @@ def init_db():
         )
     ''')
     
+    # Per-generation accounting columns (added after the original schema)
+    ensure_columns(cursor, "generation_history", {
+        "model_used": "TEXT",
+        "cache_status": "TEXT",
+        "prompt_tokens": "INTEGER",
+        "completion_tokens": "INTEGER",
+        "time_to_first_token_seconds": "REAL",
+        "tokens_per_second": "REAL",
+        "prompt_eval_seconds": "REAL",
+        "cached_prompt_tokens": "INTEGER"
+    })
+    
+    # History indexes for filtered, keyset-paginated listing
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_generation_history_created
+        ON generation_history (created_at DESC, id DESC)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_generation_history_issue
+        ON generation_history (jira_issue_id, created_at DESC, id DESC)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_generation_history_provider
+        ON generation_history (provider_used, created_at DESC, id DESC)
+    ''')
+    
+    # Stable key for the FTS index. The implicit rowid of a table with a TEXT primary
+    # key may be renumbered by VACUUM, which would point index entries at other rows.
+    ensure_columns(cursor, "generation_history", {"search_rowid": "INTEGER"})
+    cursor.execute("UPDATE generation_history SET search_rowid = rowid WHERE search_rowid IS NULL")
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_generation_history_search_rowid
+        ON generation_history (search_rowid)
+    ''')
+    
+    # Full-text index over history, kept in sync by triggers
+    fts_sql = cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'generation_history_fts'"
+    ).fetchone()
+    if fts_sql and "content_rowid='search_rowid'" not in fts_sql[0]:
+        # Index built over the raw table before content was compressed, or keyed on rowid
+        for trigger in ("insert", "delete", "update"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS generation_history_fts_{trigger}")
+        cursor.execute("DROP TABLE generation_history_fts")
+        cursor.execute("DROP VIEW IF EXISTS generation_history_text")
+        fts_sql = None
+    
+    # Decompressed view of history; the FTS index reads plan text through it
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS generation_history_text AS
+        SELECT search_rowid, jira_issue_id, jira_summary,
+               plan_text(generated_content) AS generated_content
+        FROM generation_history
+    ''')
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS generation_history_fts USING fts5(
+            jira_issue_id, jira_summary, generated_content,
+            content='generation_history_text', content_rowid='search_rowid'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS generation_history_fts_insert AFTER INSERT ON generation_history BEGIN
+            UPDATE generation_history
+            SET search_rowid = (SELECT COALESCE(MAX(search_rowid), 0) + 1 FROM generation_history)
+            WHERE rowid = new.rowid AND search_rowid IS NULL;
+            INSERT INTO generation_history_fts (rowid, jira_issue_id, jira_summary, generated_content)
+            SELECT search_rowid, new.jira_issue_id, new.jira_summary, plan_text(new.generated_content)
+            FROM generation_history WHERE rowid = new.rowid;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS generation_history_fts_delete AFTER DELETE ON generation_history BEGIN
+            INSERT INTO generation_history_fts (generation_history_fts, rowid, jira_issue_id, jira_summary, generated_content)
+            VALUES ('delete', old.search_rowid, old.jira_issue_id, old.jira_summary, plan_text(old.generated_content));
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS generation_history_fts_update
+        AFTER UPDATE OF jira_issue_id, jira_summary, generated_content ON generation_history BEGIN
+            INSERT INTO generation_history_fts (generation_history_fts, rowid, jira_issue_id, jira_summary, generated_content)
+            VALUES ('delete', old.search_rowid, old.jira_issue_id, old.jira_summary, plan_text(old.generated_content));
+            INSERT INTO generation_history_fts (rowid, jira_issue_id, jira_summary, generated_content)
+            VALUES (new.search_rowid, new.jira_issue_id, new.jira_summary, plan_text(new.generated_content));
+        END
+    ''')
+    if not fts_sql:
+        # Index rows written before the FTS table existed
+        cursor.execute("INSERT INTO generation_history_fts (generation_history_fts) VALUES ('rebuild')")
+    
+    # Content Dictionaries Table (deflate dictionaries for compressed plan content;
+    # never deleted, since stored rows name the dictionary they were written with)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS content_dictionaries (
+            id INTEGER PRIMARY KEY,
+            dictionary BLOB NOT NULL,
+            sample_count INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # LLM Response Cache Table (content-addressed by provider/model/params/prompt)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_response_cache (
+            cache_key TEXT PRIMARY KEY,
+            provider TEXT,
+            model TEXT,
+            content TEXT NOT NULL,
+            hit_count INTEGER DEFAULT 0,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_llm_response_cache_last_used
+        ON llm_response_cache (last_used_at)
+    ''')
+    
+    # Generation Jobs Table (background generation queue)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS generation_jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'queued',
+            priority INTEGER NOT NULL DEFAULT 0,
+            jira_issue_id TEXT,
+            request_json TEXT NOT NULL,
+            result_json TEXT,
+            generation_id TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker_id TEXT,
+            lease_expires_at REAL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL
+        )
+    ''')
+    # Failed attempts are requeued with backoff; not claimable before this time
+    ensure_columns(cursor, "generation_jobs", {"not_before": "REAL"})
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_generation_jobs_claim
+        ON generation_jobs (status, priority DESC, created_at)
+    ''')
+    
+    # Jira Issue Cache Table (normalized issues stamped with Jira's `updated`)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jira_issue_cache (
+            domain TEXT NOT NULL,
+            issue_key TEXT NOT NULL,
+            issue_json TEXT NOT NULL,
+            updated TEXT,
+            checked_at REAL NOT NULL,
+            PRIMARY KEY (domain, issue_key)
+        )
+    ''')
+    
+    # Rendered exports are tracked by the export cache directory alone
+    # (EXPORT_CACHE_DIR/<generation id>/...); the old export_artifacts table went unread
+    cursor.execute('DROP TABLE IF EXISTS export_artifacts')
+    
+    # Config Version Table (bumped on every config write; lets each worker's
+    # in-memory config cache notice changes made by other workers)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS config_version (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    
+    # Idempotency Keys Table (Idempotency-Key header -> the original response)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            scope TEXT NOT NULL,
+            idempotency_key TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            status TEXT NOT NULL,
+            response BLOB,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (scope, idempotency_key)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created
+        ON idempotency_keys (created_at)
+    ''')
+    
     conn.commit()
     conn.close()
+    
+    train_content_dictionary()
+    compress_history()
+
+def ensure_columns(cursor, table: str, columns: dict):
+    """Add any missing columns to an existing table"""
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    for name, definition in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+def _dictionary_due(cursor, retrain_after: int) -> bool:
+    """Whether enough plans exist for a first dictionary, or were saved since the latest one"""
+    latest = cursor.execute(
+        "SELECT created_at FROM content_dictionaries ORDER BY id DESC LIMIT 1"
+    ).fetchone()
+    if latest is None:
+        needed, query, params = CONTENT_DICT_MIN_SAMPLES, "SELECT 1 FROM generation_history LIMIT ?", ()
+    elif retrain_after:
+        needed = retrain_after
+        query, params = "SELECT 1 FROM generation_history WHERE created_at > ? LIMIT ?", (latest[0],)
+    else:
+        return False
+    return cursor.execute(f"SELECT COUNT(*) FROM ({query})", params + (needed,)).fetchone()[0] >= needed
+
+def train_content_dictionary(force: bool = False, samples: int = 200, retrain_after: int = 0) -> bool:
+    """Train a shared dictionary from recent plans if none exists yet, once `retrain_after`
+    plans were saved since the latest one, or if forced"""
+    if not CONTENT_COMPRESSION:
+        return False
+    conn = get_db()
+    cursor = conn.cursor()
+    # IMMEDIATE: several workers may start at once and only one should train
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        if not force and not _dictionary_due(cursor, retrain_after):
+            return False
+        rows = cursor.execute(
+            "SELECT generated_content FROM generation_history ORDER BY created_at DESC LIMIT ?",
+            (samples,)
+        ).fetchall()
+        if len(rows) < CONTENT_DICT_MIN_SAMPLES:
+            return False
+        dictionary = train_dictionary([decompress_content(row[0]) for row in rows])
+        cursor.execute(
+            "INSERT INTO content_dictionaries (dictionary, sample_count) VALUES (?, ?)",
+            (dictionary, len(rows))
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    db_manager.codec.reset()
+    return True
+
+def retrain_content_dictionary_if_due() -> bool:
+    """After history inserts: train a first or fresh dictionary when one is due"""
+    conn = get_db()
+    latest = conn.execute("SELECT MAX(id) FROM content_dictionaries").fetchone()[0]
+    due = CONTENT_COMPRESSION and _dictionary_due(conn.cursor(), CONTENT_DICT_RETRAIN_EVERY)
+    conn.close()
+    if latest and db_manager.codec._active_id not in (None, latest):
+        db_manager.codec.reset()  # trained by another worker process
+    # Checked above without the write lock; train_content_dictionary checks again under it
+    return due and train_content_dictionary(retrain_after=CONTENT_DICT_RETRAIN_EVERY)
+
+def compress_history(batch_size: int = 500) -> int:
+    """Compress history rows still stored as plain TEXT; returns the number migrated"""
+    if not CONTENT_COMPRESSION:
+        return 0
+    conn = get_db()
+    migrated = 0
+    while True:
+        rows = conn.execute('''
+            SELECT id, generated_content FROM generation_history
+            WHERE typeof(generated_content) = 'text' LIMIT ?
+        ''', (batch_size,)).fetchall()
+        if not rows:
+            break
+        conn.executemany(
+            "UPDATE generation_history SET generated_content = ? WHERE id = ?",
+            [(compress_content(row[1]), row[0]) for row in rows]
+        )
+        conn.commit()
+        migrated += len(rows)
+    conn.close()
+    return migrated
+
+def bump_config_version(cursor, name: str):
+    """Record a change to a config table; call inside the writing transaction"""
+    cursor.execute("""
+        INSERT INTO config_version (name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    """, (name,))
 
 if __name__ == "__main__":
     init_db()
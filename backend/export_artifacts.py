@@ -0,0 +1,218 @@
+"""Export rendering - artifacts rendered in a process pool, eagerly after generation or on request"""
+import os
+import time
+import shutil
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from database import get_db
+from services.export_service import ExportService, content_hash, parse_markdown, EXPORT_CACHE_DIR
+from metrics import CACHE_REQUESTS, ERRORS, EXPORT_PRERENDER_SECONDS, EXPORT_RENDER_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Off by default: rendering every plan eagerly costs CPU even if nobody downloads it
+EXPORT_PRERENDER = os.getenv("EXPORT_PRERENDER", "0") == "1"
+EXPORT_PRERENDER_FORMATS = tuple(
+    fmt.strip() for fmt in os.getenv("EXPORT_PRERENDER_FORMATS", "pdf,docx").split(",") if fmt.strip()
+)
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+# Disk cache bounds, enforced by a periodic sweep: artifacts older than the age cap
+# go first, then the least recently served until the cache fits the size cap
+EXPORT_CACHE_MAX_MB = float(os.getenv("EXPORT_CACHE_MAX_MB", "1024"))
+EXPORT_CACHE_MAX_AGE_DAYS = float(os.getenv("EXPORT_CACHE_MAX_AGE_DAYS", "30"))
+EXPORT_CACHE_PRUNE_SECONDS = float(os.getenv("EXPORT_CACHE_PRUNE_SECONDS", "600"))
+
+ArtifactKey = Tuple[str, str, str]
+
+def _render_in_worker(generation_id: str, fmt: str, markdown_content: str,
+                      blocks: Optional[tuple]) -> Tuple[Optional[str], float]:
+    """Pool entry point: the artifact's path and how long producing it took. Metrics
+    recorded in a worker process never reach the app's registry, so the app records them."""
+    started = time.perf_counter()
+    path = ExportService.render_artifact(generation_id, fmt, markdown_content, blocks)
+    return path, time.perf_counter() - started
+
+class ExportPrerenderer:
+    """Renders exports off the event loop and request threads, tracking in-flight renders"""
+
+    def __init__(self, enabled: bool = EXPORT_PRERENDER, workers: int = EXPORT_WORKERS,
+                 formats: tuple = EXPORT_PRERENDER_FORMATS):
+        self.enabled = enabled
+        self.workers = workers
+        self.formats = formats
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight: Dict[ArtifactKey, Future] = {}
+        # One event-loop future per in-flight render that requests await (shielded),
+        # so a request that goes away stops waiting without cancelling the render
+        self._waiters: Dict[ArtifactKey, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn, not fork: the parent holds SQLite connections and event-loop threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _submit(self, key: ArtifactKey, markdown_content: str, blocks: Optional[tuple]) -> Future:
+        """Start rendering an artifact in the pool, or join the render already in flight"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+            future = self._pool().submit(_render_in_worker, key[0], key[1], markdown_content, blocks)
+            self._in_flight[key] = future
+        submitted = time.perf_counter()
+        future.add_done_callback(lambda f: self._finished(key, f, submitted))
+        return future
+
+    def schedule(self, generation_id: str, markdown_content: str):
+        """Queue background renders of a freshly saved generation"""
+        if not self.enabled:
+            return
+        digest = content_hash(markdown_content)
+        missing = [fmt for fmt in self.formats
+                   if not os.path.exists(ExportService.artifact_path(generation_id, fmt, digest))]
+        # Parsed once here and shared by the workers rendering each format
+        blocks = parse_markdown(markdown_content) if missing else None
+        for fmt in missing:
+            self._submit((generation_id, fmt, digest), markdown_content, blocks)
+
+    def _finished(self, key: ArtifactKey, future: Future, submitted: float):
+        # Renders run in worker processes, so they are timed here rather than in ExportService
+        EXPORT_PRERENDER_SECONDS.observe(time.perf_counter() - submitted, format=key[1])
+        with self._lock:
+            self._in_flight.pop(key, None)
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.error(f"Render of {key[1]} for {key[0]} failed: {future.exception()}")
+            ERRORS.inc(component="export")
+            return
+        path, render_seconds = future.result()
+        EXPORT_RENDER_SECONDS.observe(render_seconds, format=key[1])
+        if path is None:
+            ERRORS.inc(component="export")
+
+    async def render(self, generation_id: str, fmt: str, markdown_content: str) -> Optional[str]:
+        """Return the path of a cached artifact, rendering it in the pool (or joining
+        the render already in flight) if needed; None if rendering failed"""
+        key = (generation_id, fmt, content_hash(markdown_content))
+        path = ExportService.artifact_path(*key)
+        if os.path.exists(path):
+            CACHE_REQUESTS.inc(cache="export", result="hit")
+            ExportService.touch_artifact(path)
+            return path
+        CACHE_REQUESTS.inc(cache="export", result="miss")
+        try:
+            path, _ = await asyncio.shield(await self._waiter(key, markdown_content))
+            return path
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return None
+
+    async def _waiter(self, key: ArtifactKey, markdown_content: str) -> asyncio.Future:
+        """The shared future of this artifact's render, submitting the render if needed"""
+        waiter = self._waiters.get(key)
+        if waiter is not None:
+            return waiter
+        with self._lock:
+            joining = key in self._in_flight
+        # The parse cache lives in this process; workers get the parsed tree
+        blocks = None if joining or key[1] == "md" else await asyncio.to_thread(parse_markdown, markdown_content)
+        waiter = self._waiters.get(key)  # another request may have submitted meanwhile
+        if waiter is None:
+            waiter = asyncio.wrap_future(self._submit(key, markdown_content, blocks))
+            self._waiters[key] = waiter
+            waiter.add_done_callback(lambda done: self._waiter_done(key, done))
+        return waiter
+
+    def _waiter_done(self, key: ArtifactKey, waiter: asyncio.Future):
+        if self._waiters.get(key) is waiter:
+            del self._waiters[key]
+        if not waiter.cancelled():
+            waiter.exception()  # retrieved here; every request may have stopped waiting
+
+    def shutdown(self):
+        """Stop the render pool, abandoning queued renders"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+export_prerenderer = ExportPrerenderer()
+
+def remove_artifacts(generation_id: str):
+    """Delete every rendered export of a generation"""
+    shutil.rmtree(os.path.join(EXPORT_CACHE_DIR, generation_id), ignore_errors=True)
+
+def _existing_generations(generation_ids: List[str]) -> set:
+    conn = get_db()
+    existing = set()
+    for i in range(0, len(generation_ids), 500):
+        chunk = generation_ids[i:i + 500]
+        rows = conn.execute(
+            f"SELECT id FROM generation_history WHERE id IN ({','.join('?' * len(chunk))})", chunk
+        ).fetchall()
+        existing.update(row[0] for row in rows)
+    conn.close()
+    return existing
+
+def prune_export_cache(max_mb: float = EXPORT_CACHE_MAX_MB, max_age_days: float = EXPORT_CACHE_MAX_AGE_DAYS) -> Dict:
+    """Remove artifacts of deleted generations, then those over the age cap, then the
+    least recently served until the cache fits the size cap"""
+    if not os.path.isdir(EXPORT_CACHE_DIR):
+        return {"removed": 0, "bytes": 0}
+    generation_ids = [name for name in os.listdir(EXPORT_CACHE_DIR)
+                      if os.path.isdir(os.path.join(EXPORT_CACHE_DIR, name))]
+    existing = _existing_generations(generation_ids)
+    removed = 0
+    files = []  # (last served, size, path)
+    for generation_id in generation_ids:
+        if generation_id not in existing:
+            remove_artifacts(generation_id)
+            removed += 1
+            continue
+        directory = os.path.join(EXPORT_CACHE_DIR, generation_id)
+        for name in os.listdir(directory):
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, os.path.join(directory, name)))
+
+    now = time.time()
+    total = sum(size for _, size, _ in files)
+    max_bytes = max_mb * 1024 * 1024
+    evicted = 0
+    for served, size, path in sorted(files):
+        if now - served <= max_age_days * 86400 and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        evicted += 1
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass  # other artifacts remain
+    return {"removed": removed + evicted, "bytes": total}
+
+async def prune_periodically(interval: float = EXPORT_CACHE_PRUNE_SECONDS):
+    """Keep the export cache within its bounds for the app's lifetime"""
+    while True:
+        try:
+            result = await asyncio.to_thread(prune_export_cache)
+            if result["removed"]:
+                logger.info(f"Export cache pruned: {result['removed']} removed, {result['bytes']} bytes kept")
+        except Exception as e:
+            logger.error(f"Export cache prune error: {e}")
+        await asyncio.sleep(interval)
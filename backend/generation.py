@@ -0,0 +1,504 @@
+"""Test plan generation pipeline shared by the single, streaming and batch endpoints"""
+import os
+import re
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from database import get_db, compress_content, retrain_content_dictionary_if_due
+from config_cache import config_cache
+from response_cache import response_cache
+from export_artifacts import export_prerenderer
+from llm_router import llm_router, provider_semaphore
+from similarity import (
+    similarity_index, load_plan, trim_example, SIMILARITY_ENABLED,
+    SIMILARITY_REUSE_THRESHOLD, SIMILARITY_EXAMPLE_THRESHOLD
+)
+from metrics import GENERATION_STAGE_SECONDS
+from models import GenerateTestPlanRequest, JiraIssue, LLMConfigRecord
+from services.llm_service import LLMService
+from services.template_service import TemplateService
+
+logger = logging.getLogger(__name__)
+
+# Identity recorded for plans served from a similar past generation
+REUSE_IDENTITY = {"provider": "reuse", "model": None}
+# Warm Ollama models on startup and whenever the LLM or template configuration is saved
+LLM_WARM_UP = os.getenv("LLM_WARM_UP", "1") == "1"
+
+def build_prompt_prefix(template_outline: str) -> str:
+    """Static instructions and template structure.
+
+    Identical for every story using the same template, so it comes first:
+    Ollama reuses the evaluated prefix of a loaded model and Groq caches
+    matching prompt prefixes.
+    """
+    return f"""You are a QA expert creating a professional test plan.
+
+Generate a comprehensive, professional test plan in Markdown format that:
+1. Covers positive, negative, and edge case scenarios
+2. Includes specific test steps and expected results
+3. Addresses all acceptance criteria
+4. Uses professional QA terminology
+5. Is ready for immediate use by QA engineers
+
+TEMPLATE STRUCTURE (follow these sections, fields and table columns):
+{template_outline if template_outline else "[Default template: Create test plan with Overview, Scope, Test Scenarios, Exit Criteria]"}"""
+
+def build_test_plan_prompt(jira_details: JiraIssue, template_outline: str, example: Optional[str] = None) -> str:
+    """Build the LLM prompt: the static prefix, then an optional past example, then the Jira details"""
+    example_section = f"""
+
+EXAMPLE PLAN FOR A SIMILAR STORY (match its structure and depth; do not copy story-specific details):
+{example}""" if example else ""
+    return f"""{build_prompt_prefix(template_outline)}{example_section}
+
+JIRA ISSUE:
+- Key: {jira_details.key}
+- Summary: {jira_details.summary}
+- Description: {jira_details.description}
+- Acceptance Criteria: {jira_details.acceptanceCriteria}
+- Priority: {jira_details.priority}
+
+Write the test plan for this issue."""
+
+def llm_service_from_config(config: LLMConfigRecord) -> LLMService:
+    """Build an LLMService from the cached LLM config row"""
+    return LLMService(config.provider, **config.model_dump(exclude={"provider"}))
+
+async def load_configured_template() -> Tuple[str, str]:
+    """Return (template_used, template_outline) for the configured template"""
+    with GENERATION_STAGE_SECONDS.time(stage="template_load"):
+        template_config = await config_cache.aget("template")
+        if not template_config:
+            return "default", ""
+        template_outline = await asyncio.to_thread(
+            TemplateService.load_outline, template_config.file_path
+        ) or ""
+    return template_config.file_path, template_outline
+
+async def warm_up_llm() -> List[Dict]:
+    """Load every routed Ollama model and evaluate the current prompt prefix on it"""
+    _, template_outline = await load_configured_template()
+    prefix = build_prompt_prefix(template_outline)
+    await config_cache.refresh("llm", "llm_providers")
+    results = []
+    for target in llm_router.targets():
+        service = llm_router.service_for(target)
+        if service.provider != "ollama":
+            continue
+        async with provider_semaphore(service.provider, target[0]):
+            result = await service.warm_up(prefix)
+        logger.info(f"LLM warm-up {target[0]}: {result}")
+        results.append({"name": target[0], **result})
+    return results
+
+_background_tasks = set()
+
+def schedule_warm_up():
+    """Warm the models in the background, e.g. after the LLM or template config changed"""
+    if not LLM_WARM_UP:
+        return
+    task = asyncio.create_task(warm_up_llm())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+def routed_identities() -> List[Dict]:
+    """Cache identities of every provider the router may use; raises if none is configured"""
+    targets = llm_router.targets()
+    if not targets:
+        raise RuntimeError("LLM not configured")
+    return [llm_router.service_for(target).cache_identity() for target in targets]
+
+def cached_response(identities: List[Dict], prompt: str) -> Tuple[Optional[str], Optional[Dict]]:
+    """Return (content, identity) of a cached answer from any routable provider, or (None, None)"""
+    for identity in identities:
+        cached = response_cache.get(response_cache.key_for(identity, prompt))
+        if cached:
+            return cached, identity
+    return None, None
+
+def cache_plan(identity: Dict, content: str, prompt: str, base_prompt: Optional[str] = None):
+    """Cache an answer under its prompt and, when it differs, the prompt without the example"""
+    response_cache.put(response_cache.key_for(identity, prompt), identity, content)
+    if base_prompt and base_prompt != prompt:
+        response_cache.put(response_cache.key_for(identity, base_prompt), identity, content)
+
+def story_text(jira_details: JiraIssue) -> str:
+    return f"{jira_details.summary}\n{jira_details.description}\n{jira_details.acceptanceCriteria}"
+
+async def find_similar_plans(jira_details: JiraIssue, allow_reuse: bool) -> Tuple[Optional[str], Optional[str], Dict]:
+    """Return (reusable content, few-shot example, similarity metadata) from past plans like
+    this story; the story's own earlier plans are skipped so regenerating it keeps its prompt"""
+    if not SIMILARITY_ENABLED:
+        return None, None, {}
+    try:
+        with GENERATION_STAGE_SECONDS.time(stage="similarity"):
+            matches = await asyncio.to_thread(
+                similarity_index.search, jira_details.summary, story_text(jira_details),
+                exclude_issue=jira_details.key
+            )
+            best = matches[0] if matches else None
+            if best is None or best["score"] < SIMILARITY_EXAMPLE_THRESHOLD:
+                return None, None, {"matches": matches}
+            content = await asyncio.to_thread(load_plan, best["id"])
+    except Exception as e:
+        logger.error(f"Similarity lookup error: {e}")
+        return None, None, {}
+    if not content:
+        return None, None, {"matches": matches}
+    similarity = {"matches": matches, "example_from": best["id"]}
+    if best["score"] >= SIMILARITY_REUSE_THRESHOLD:
+        if allow_reuse:
+            return content, None, {"matches": matches, "reused_from": best["id"]}
+        # Another story's plan is only served on request; point the caller at it instead
+        similarity["reuse_candidate"] = best["id"]
+    example = f"Story: {best['jira_summary']}\n{trim_example(content)}"
+    return None, example, similarity
+
+async def generate_with_cache(prompt: str, bypass_cache: bool = False, hedge_seconds: Optional[float] = None,
+                              base_prompt: Optional[str] = None):
+    """Return (content, cache_status, usage, identity), routing cache misses across providers.
+
+    The answer is also cached under `base_prompt` (the prompt without its
+    few-shot example), which callers check before the similarity lookup.
+    """
+    with GENERATION_STAGE_SECONDS.time(stage="config_load"):
+        await config_cache.refresh("llm", "llm_providers")
+        identities = routed_identities()
+    if not bypass_cache:
+        cached, identity = await asyncio.to_thread(cached_response, identities, prompt)
+        if cached:
+            return cached, "hit", {}, identity
+
+    start = time.perf_counter()
+    result = await llm_router.generate(prompt, hedge_seconds)
+    GENERATION_STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm", provider=result.name)
+    identity = result.service.cache_identity()
+    await asyncio.to_thread(cache_plan, identity, result.content, prompt, base_prompt)
+    return result.content, "bypass" if bypass_cache else "miss", result.service.last_usage, identity
+
+# Most section prompts a sectioned generation fans out to; extra sections are grouped
+GENERATION_MAX_SECTIONS = int(os.getenv("GENERATION_MAX_SECTIONS", "6"))
+DEFAULT_SECTIONS = ["Overview", "Scope", "Test Scenarios", "Exit Criteria"]
+# Lines at least this long (normalized) are dropped when an earlier section already has them
+DEDUP_MIN_CHARS = 25
+
+_TABLE_SEPARATOR = re.compile(r"^\|?\s*:?-{3,}")
+
+def plan_sections(template_outline: str) -> List[Tuple[str, str]]:
+    """Split a template outline into (title, outline block) per section.
+
+    Sections are the shallowest outline level with more than one entry (else
+    the deepest), so a lone document title (an H1 above H2 sections) gives way
+    to its children.
+    """
+    lines = [line for line in (template_outline or "").splitlines() if line.strip() != "- ..."]
+    # Outline bullets are indented two spaces per heading level below the top
+    depths = [(len(line) - len(line.lstrip())) // 2 if line.lstrip().startswith("- ") else None
+              for line in lines]
+    counts: Dict[int, int] = {}
+    for depth in depths:
+        if depth is not None:
+            counts[depth] = counts.get(depth, 0) + 1
+    if not counts:
+        return [(title, f"- {title}") for title in DEFAULT_SECTIONS]
+    level = next((depth for depth in sorted(counts) if counts[depth] > 1), max(counts))
+    
+    sections: List[Tuple[str, List[str]]] = []
+    inside = False
+    for line, depth in zip(lines, depths):
+        if depth == level:
+            sections.append((line.strip()[2:].strip(), [line[level * 2:]]))
+            inside = True
+        elif depth is not None and depth < level:
+            inside = False  # a parent heading; its fields are not part of the next section
+        elif inside:
+            sections[-1][1].append(line[level * 2:])
+    # The stitcher writes the document title itself
+    sections = [section for section in sections if not section[0].lower().startswith("test plan")]
+    if not sections:
+        return [(title, f"- {title}") for title in DEFAULT_SECTIONS]
+    return [(title, "\n".join(block)) for title, block in sections]
+
+def group_sections(sections: List[Tuple[str, str]], max_groups: int = GENERATION_MAX_SECTIONS) -> List[List[Tuple[str, str]]]:
+    """Group consecutive sections, as evenly as possible, so at most `max_groups` prompts run"""
+    count = min(len(sections), max(1, max_groups))
+    bounds = [len(sections) * i // count for i in range(count + 1)]
+    return [sections[bounds[i]:bounds[i + 1]] for i in range(count)]
+
+def build_section_prompt(shared_context: str, group: List[Tuple[str, str]], part: int,
+                         groups: List[List[Tuple[str, str]]]) -> str:
+    """Shared plan prompt (an identical prefix for every section) plus this part's instructions"""
+    titles = [title for title, _ in group]
+    others = [title for index, other in enumerate(groups, 1) if index != part for title, _ in other]
+    return f"""{shared_context}
+
+YOU ARE WRITING PART {part} OF {len(groups)} OF THIS TEST PLAN; the other parts are written in parallel.
+Write ONLY these sections, in this order:
+{chr(10).join(block for _, block in group)}
+
+Rules:
+- Start each section with a "## <section name>" heading.
+- Do not write a document title, restate the Jira issue, or add an introduction or conclusion.
+- Do not cover the other parts' sections: {", ".join(others) or "none"}."""
+
+def _normalize_line(line: str) -> str:
+    stripped = line.strip()
+    if stripped.startswith("|"):
+        # Compare table rows without their (independently numbered) ID column
+        stripped = " ".join(stripped.strip("|").split("|")[1:])
+    return re.sub(r"[^a-z0-9]+", " ", stripped.lower()).strip()
+
+class SectionStitcher:
+    """Joins section outputs, in order, into one Markdown plan, dropping lines an earlier section already has"""
+
+    def __init__(self, jira_details: JiraIssue):
+        self.jira_details = jira_details
+        self.seen = set()
+
+    def header(self) -> str:
+        return f"# Test Plan: {self.jira_details.key} - {self.jira_details.summary}\n"
+
+    def add(self, titles: List[str], text: str) -> str:
+        """Clean one part and return it ready to append"""
+        lines = text.strip().splitlines()
+        if lines and lines[0].startswith("```"):
+            lines = lines[1:-1] if lines[-1].startswith("```") else lines[1:]
+        kept = []
+        for i, line in enumerate(lines):
+            stripped = line.strip()
+            if stripped.startswith("# "):
+                continue  # a document title of its own
+            is_heading = stripped.startswith("#")
+            is_table_header = i + 1 < len(lines) and _TABLE_SEPARATOR.match(lines[i + 1].strip())
+            if not is_heading and not is_table_header and not _TABLE_SEPARATOR.match(stripped):
+                key = _normalize_line(line)
+                if len(key) >= DEDUP_MIN_CHARS:
+                    if key in self.seen:
+                        continue
+                    self.seen.add(key)
+            kept.append(line)
+        # A table whose rows were all duplicates leaves a bare header behind
+        kept = [line for i, line in enumerate(kept) if not self._bare_table_header(kept, i)]
+        while kept and not kept[0].strip():
+            kept.pop(0)
+        if not kept or not kept[0].lstrip().startswith("#"):
+            kept.insert(0, f"## {titles[0]}\n")
+        return "\n" + "\n".join(kept).rstrip() + "\n"
+
+    @staticmethod
+    def _bare_table_header(lines: List[str], i: int) -> bool:
+        """Whether line i belongs to a table header + separator with no rows after it"""
+        def bare(j: int) -> bool:
+            return (j >= 0 and j + 1 < len(lines) and lines[j].strip().startswith("|")
+                    and bool(_TABLE_SEPARATOR.match(lines[j + 1].strip()))
+                    and not (j + 2 < len(lines) and lines[j + 2].strip().startswith("|")))
+        return bare(i) or bare(i - 1)
+
+def combine_usage(usages: List[Dict], wall_seconds: float) -> Dict:
+    """Sum token counts over sections; throughput is completion tokens over the wall-clock time"""
+    prompt_tokens = sum(usage.get("prompt_tokens") or 0 for usage in usages)
+    completion_tokens = sum(usage.get("completion_tokens") or 0 for usage in usages)
+    first_tokens = [usage["time_to_first_token_seconds"] for usage in usages
+                    if usage.get("time_to_first_token_seconds") is not None]
+    prompt_evals = [usage["prompt_eval_seconds"] for usage in usages if usage.get("prompt_eval_seconds") is not None]
+    cached_prompt_tokens = sum(usage.get("cached_prompt_tokens") or 0 for usage in usages)
+    return {
+        "prompt_tokens": prompt_tokens or None,
+        "completion_tokens": completion_tokens or None,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "time_to_first_token_seconds": min(first_tokens) if first_tokens else None,
+        "tokens_per_second": round(completion_tokens / wall_seconds, 2) if completion_tokens and wall_seconds else None,
+        "prompt_eval_seconds": round(sum(prompt_evals), 3) if prompt_evals else None,
+        "cached_prompt_tokens": cached_prompt_tokens or None,
+        "sections": len(usages)
+    }
+
+def _combined(values: List[Optional[str]]) -> Optional[str]:
+    distinct = sorted({value for value in values if value})
+    return ",".join(distinct) if distinct else None
+
+async def generate_sectioned(jira_details: JiraIssue, template_outline: str, example: Optional[str] = None,
+                             bypass_cache: bool = False, hedge_seconds: Optional[float] = None, emit=None):
+    """Generate the plan one template section group per concurrent LLM call and stitch the parts.
+
+    Returns the same (content, cache_status, usage, identity) as
+    generate_with_cache. Parts are stitched in template order as they finish,
+    so `emit` (an async callback) receives the plan progressively; total time
+    is roughly that of the slowest part.
+    """
+    shared_context = build_test_plan_prompt(jira_details, template_outline, example)
+    groups = group_sections(plan_sections(template_outline))
+    prompts = [build_section_prompt(shared_context, group, part, groups) for part, group in enumerate(groups, 1)]
+    stitcher = SectionStitcher(jira_details)
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(generate_with_cache(prompt, bypass_cache, hedge_seconds)) for prompt in prompts]
+    try:
+        chunks, results = [stitcher.header()], []
+        if emit:
+            await emit(chunks[0])
+        for group, task in zip(groups, tasks):
+            result = await task
+            results.append(result)
+            chunk = stitcher.add([title for title, _ in group], result[0])
+            chunks.append(chunk)
+            if emit:
+                await emit(chunk)
+    finally:
+        for task in tasks:
+            task.cancel()
+    GENERATION_STAGE_SECONDS.observe(time.perf_counter() - start, stage="sections")
+
+    statuses = {result[1] for result in results}
+    identity = {
+        "provider": _combined([result[3]["provider"] for result in results]),
+        "model": _combined([result[3]["model"] for result in results])
+    }
+    usage = combine_usage([result[2] or {} for result in results], time.perf_counter() - start)
+    return "".join(chunks), statuses.pop() if len(statuses) == 1 else "partial", usage, identity
+
+def history_row(generation_id: str, jira_details: JiraIssue, content: str,
+                provider: str, generation_time: float, template_used: Optional[str] = None,
+                model: Optional[str] = None, cache_status: Optional[str] = None,
+                usage: Optional[Dict] = None) -> tuple:
+    """Build a generation_history row for save_generations"""
+    usage = usage or {}
+    return (
+        generation_id,
+        jira_details.key,
+        jira_details.summary,
+        content,
+        provider,
+        round(generation_time, 2),
+        usage.get("total_tokens"),
+        template_used,
+        model,
+        cache_status,
+        usage.get("prompt_tokens"),
+        usage.get("completion_tokens"),
+        usage.get("time_to_first_token_seconds"),
+        usage.get("tokens_per_second"),
+        usage.get("prompt_eval_seconds"),
+        usage.get("cached_prompt_tokens")
+    )
+
+def save_generations(rows: List[tuple]):
+    """Persist finished generations to history in a single transaction, then queue pre-renders"""
+    with GENERATION_STAGE_SECONDS.time(stage="db_insert"):
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.executemany("""
+            INSERT INTO generation_history
+            (id, jira_issue_id, jira_summary, generated_content, provider_used, generation_time_seconds,
+             token_usage, template_used, model_used, cache_status, prompt_tokens, completion_tokens,
+             time_to_first_token_seconds, tokens_per_second, prompt_eval_seconds, cached_prompt_tokens)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [row[:3] + (compress_content(row[3]),) + row[4:] for row in rows])
+        conn.commit()
+        conn.close()
+    try:
+        retrain_content_dictionary_if_due()
+    except Exception as e:
+        logger.error(f"Content dictionary training error: {e}")
+    if SIMILARITY_ENABLED:
+        similarity_index.add([row[:4] for row in rows])
+    for row in rows:
+        export_prerenderer.schedule(row[0], row[3])
+
+def save_generation(generation_id: str, jira_details: JiraIssue, content: str,
+                    provider: str, generation_time: float, **accounting):
+    """Persist a finished generation to history; accounting is passed through to history_row"""
+    save_generations([history_row(generation_id, jira_details, content, provider, generation_time, **accounting)])
+
+def build_generation_response(generation_id: str, jira_details: JiraIssue, provider: str, content: str,
+                              generation_time: float, template_used: str, cache_status: str = "miss",
+                              usage: Optional[Dict] = None, similarity: Optional[Dict] = None) -> dict:
+    """Build the API response for a finished generation"""
+    return {
+        "id": generation_id,
+        "jira_issue_id": jira_details.key,
+        "jira_summary": jira_details.summary,
+        "content": content,
+        "format": "markdown",
+        "provider_used": provider,
+        "metadata": {
+            "generated_at": datetime.now().isoformat(),
+            "generation_time_seconds": round(generation_time, 2),
+            "template_used": template_used,
+            "token_usage": (usage or {}).get("total_tokens", 0),
+            "usage": usage or {},
+            "cache": cache_status,
+            "similarity": similarity or {}
+        },
+        "exports": {
+            "pdf_url": f"/api/export/{generation_id}/pdf",
+            "word_url": f"/api/export/{generation_id}/docx",
+            "markdown_url": f"/api/export/{generation_id}/md"
+        }
+    }
+
+async def generate_for_story(jira_details: JiraIssue, template_outline: str, bypass_cache: bool = False,
+                             hedge_seconds: Optional[float] = None, allow_reuse: bool = False,
+                             sectioned: bool = False):
+    """Return (content, cache_status, usage, identity, similarity) for one story.
+
+    With `allow_reuse`, a near-duplicate past plan is served without calling
+    the LLM (unless the cache is bypassed); otherwise the nearest plan is given
+    to the LLM as a trimmed example and named in the similarity metadata as a
+    reuse candidate. A cached plan for the story itself (the prompt without an
+    example) is served before any similarity lookup. `sectioned` generates the
+    template's sections concurrently (see generate_sectioned).
+    """
+    with GENERATION_STAGE_SECONDS.time(stage="prompt_build"):
+        base_prompt = build_test_plan_prompt(jira_details, template_outline)
+    if not bypass_cache:
+        # A repeat of this story hits the cache without a similarity lookup
+        with GENERATION_STAGE_SECONDS.time(stage="config_load"):
+            await config_cache.refresh("llm", "llm_providers")
+            identities = routed_identities()
+        cached, identity = await asyncio.to_thread(cached_response, identities, base_prompt)
+        if cached:
+            return cached, "hit", {}, identity, {}
+    reused, example, similarity = await find_similar_plans(jira_details, allow_reuse and not bypass_cache)
+    if reused:
+        return reused, "reuse", {}, REUSE_IDENTITY, similarity
+    if sectioned:
+        content, cache_status, usage, identity = await generate_sectioned(
+            jira_details, template_outline, example, bypass_cache, hedge_seconds
+        )
+        return content, cache_status, usage, identity, similarity
+    with GENERATION_STAGE_SECONDS.time(stage="prompt_build"):
+        prompt = build_test_plan_prompt(jira_details, template_outline, example) if example else base_prompt
+    content, cache_status, usage, identity = await generate_with_cache(prompt, bypass_cache, hedge_seconds, base_prompt)
+    return content, cache_status, usage, identity, similarity
+
+async def run_generation(request: GenerateTestPlanRequest) -> dict:
+    """Generate, persist and return a test plan for a single Jira issue"""
+    start_time = time.time()
+    generation_id = str(uuid.uuid4())
+
+    template_used, template_outline = await load_configured_template()
+
+    # Reuse a near-duplicate plan, or generate routed across the configured providers
+    content, cache_status, usage, identity, similarity = await generate_for_story(
+        request.jira_details, template_outline, request.bypass_cache, request.hedge_seconds,
+        request.allow_reuse, request.sectioned
+    )
+
+    generation_time = time.time() - start_time
+
+    # Save to history, recording the provider that actually answered
+    await asyncio.to_thread(
+        save_generation, generation_id, request.jira_details, content, identity["provider"], generation_time,
+        template_used=template_used, model=identity["model"],
+        cache_status=cache_status, usage=usage
+    )
+
+    return build_generation_response(
+        generation_id, request.jira_details, identity["provider"], content,
+        generation_time, template_used, cache_status, usage, similarity
+    )
@@ -0,0 +1,184 @@
+"""Generation history queries - keyset-paginated listing and full-text search"""
+import base64
+import json
+from typing import Dict, List, Optional, Tuple
+
+from database import get_db
+
+HISTORY_COLUMNS = """
+    h.id, h.jira_issue_id, h.jira_summary, h.provider_used, h.model_used,
+    h.generation_time_seconds, h.token_usage, h.prompt_tokens, h.completion_tokens,
+    h.time_to_first_token_seconds, h.tokens_per_second, h.prompt_eval_seconds, h.cached_prompt_tokens,
+    h.cache_status,
+    h.template_used, h.created_at
+"""
+
+STATS_GROUPS = {
+    "model": ["h.provider_used", "h.model_used"],
+    "day": ["date(h.created_at)"],
+    "template": ["h.template_used"],
+}
+
+def encode_cursor(values: list) -> str:
+    """Opaque page cursor from the sort key of the last row on a page"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+def fts_query(text: str) -> str:
+    """Turn free text into a safe FTS5 query: every term quoted, `term*` kept as a prefix match"""
+    terms = []
+    for term in text.split():
+        prefix = term.endswith("*")
+        term = term.rstrip("*").replace('"', '""')
+        if term:
+            terms.append(f'"{term}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+def _filters(jira_issue_id: Optional[str], provider: Optional[str],
+             created_after: Optional[str], created_before: Optional[str]) -> Tuple[List[str], list]:
+    clauses, params = [], []
+    if jira_issue_id:
+        clauses.append("h.jira_issue_id = ?")
+        params.append(jira_issue_id)
+    if provider:
+        clauses.append("h.provider_used = ?")
+        params.append(provider)
+    if created_after:
+        clauses.append("h.created_at >= ?")
+        params.append(created_after.replace("T", " "))
+    if created_before:
+        clauses.append("h.created_at < ?")
+        params.append(created_before.replace("T", " "))
+    return clauses, params
+
+def list_generations(limit: int = 50, cursor: Optional[str] = None, jira_issue_id: Optional[str] = None,
+                     provider: Optional[str] = None, created_after: Optional[str] = None,
+                     created_before: Optional[str] = None) -> Dict:
+    """Newest-first page of history rows (without content), keyed on (created_at, id)"""
+    clauses, params = _filters(jira_issue_id, provider, created_after, created_before)
+    if cursor:
+        created_at, generation_id = decode_cursor(cursor)
+        clauses.append("(h.created_at, h.id) < (?, ?)")
+        params += [created_at, generation_id]
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    conn = get_db()
+    rows = conn.execute(f"""
+        SELECT {HISTORY_COLUMNS} FROM generation_history h
+        {where}
+        ORDER BY h.created_at DESC, h.id DESC
+        LIMIT ?
+    """, params + [limit + 1]).fetchall()
+    conn.close()
+
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor([items[-1]["created_at"], items[-1]["id"]])
+    return {"items": items, "next_cursor": next_cursor}
+
+def search_generations(query: str, limit: int = 20, cursor: Optional[str] = None,
+                       jira_issue_id: Optional[str] = None, provider: Optional[str] = None,
+                       created_after: Optional[str] = None, created_before: Optional[str] = None) -> Dict:
+    """Best-match-first page of history rows matching `query`, keyed on (bm25 score, search rowid)"""
+    match = fts_query(query)
+    if not match:
+        return {"items": [], "next_cursor": None}
+    clauses, params = _filters(jira_issue_id, provider, created_after, created_before)
+    where = "".join(f" AND {clause}" for clause in clauses)
+    page_clause = ""
+    page_params: list = []
+    if cursor:
+        score, rowid = decode_cursor(cursor)
+        page_clause = "WHERE (score, rid) > (?, ?)"
+        page_params = [score, rowid]
+
+    conn = get_db()
+    rows = conn.execute(f"""
+        SELECT * FROM (
+            SELECT {HISTORY_COLUMNS}, h.search_rowid AS rid,
+                   bm25(generation_history_fts) AS score,
+                   snippet(generation_history_fts, -1, '[', ']', '...', 16) AS snippet
+            FROM generation_history_fts
+            JOIN generation_history h ON h.search_rowid = generation_history_fts.rowid
+            WHERE generation_history_fts MATCH ?{where}
+        )
+        {page_clause}
+        ORDER BY score, rid
+        LIMIT ?
+    """, [match] + params + page_params + [limit + 1]).fetchall()
+    conn.close()
+
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor([items[-1]["score"], items[-1]["rid"]])
+    for item in items:
+        item.pop("rid")
+    return {"items": items, "next_cursor": next_cursor}
+
+def generation_stats(group_by: str = "model", jira_issue_id: Optional[str] = None,
+                     provider: Optional[str] = None, created_after: Optional[str] = None,
+                     created_before: Optional[str] = None) -> Dict:
+    """Token and latency totals/averages over history, grouped by model, day or template.
+
+    Cache hits and reused plans are counted but excluded from the generation-time averages,
+    since no provider call was made for them.
+    """
+    if group_by not in STATS_GROUPS:
+        raise ValueError(f"group_by must be one of: {', '.join(STATS_GROUPS)}")
+    keys = STATS_GROUPS[group_by]
+    clauses, params = _filters(jira_issue_id, provider, created_after, created_before)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    key_columns = ", ".join(f"{key} AS k{i}" for i, key in enumerate(keys))
+
+    conn = get_db()
+    rows = conn.execute(f"""
+        SELECT {key_columns},
+               COUNT(*) AS generations,
+               COUNT(CASE WHEN h.cache_status = 'hit' THEN 1 END) AS cache_hits,
+               COUNT(CASE WHEN h.cache_status = 'reuse' THEN 1 END) AS reused,
+               COALESCE(SUM(h.prompt_tokens), 0) AS prompt_tokens,
+               COALESCE(SUM(h.completion_tokens), 0) AS completion_tokens,
+               COALESCE(SUM(h.token_usage), 0) AS total_tokens,
+               AVG(CASE WHEN h.cache_status NOT IN ('hit', 'reuse') OR h.cache_status IS NULL
+                   THEN h.generation_time_seconds END) AS avg_generation_seconds,
+               MAX(CASE WHEN h.cache_status NOT IN ('hit', 'reuse') OR h.cache_status IS NULL
+                   THEN h.generation_time_seconds END) AS max_generation_seconds,
+               AVG(h.time_to_first_token_seconds) AS avg_time_to_first_token_seconds,
+               MAX(h.time_to_first_token_seconds) AS max_time_to_first_token_seconds,
+               AVG(h.tokens_per_second) AS avg_tokens_per_second,
+               AVG(h.prompt_eval_seconds) AS avg_prompt_eval_seconds,
+               COALESCE(SUM(h.cached_prompt_tokens), 0) AS cached_prompt_tokens,
+               AVG(h.prompt_tokens) AS avg_prompt_tokens,
+               AVG(h.completion_tokens) AS avg_completion_tokens
+        FROM generation_history h
+        {where}
+        GROUP BY {", ".join(f"k{i}" for i in range(len(keys)))}
+        ORDER BY {", ".join(f"k{i}" for i in range(len(keys)))}
+    """, params).fetchall()
+    conn.close()
+
+    names = {"model": ["provider", "model"], "day": ["day"], "template": ["template"]}[group_by]
+    groups = []
+    for row in rows:
+        values = dict(row)
+        group = {name: values.pop(f"k{i}") for i, name in enumerate(names)}
+        group.update({key: round(value, 3) if isinstance(value, float) else value
+                      for key, value in values.items()})
+        groups.append(group)
+    return {
+        "group_by": group_by,
+        "groups": groups,
+        "totals": {
+            "generations": sum(group["generations"] for group in groups),
+            "prompt_tokens": sum(group["prompt_tokens"] for group in groups),
+            "completion_tokens": sum(group["completion_tokens"] for group in groups),
+            "total_tokens": sum(group["total_tokens"] for group in groups)
+        }
+    }
@@ -0,0 +1,175 @@
+"""Idempotency keys and single-flight coalescing for generation requests"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from database import get_db, compress_content, decompress_content
+from metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# An in-progress key not updated for this long is assumed abandoned (e.g. its worker died) and taken over;
+# running requests refresh their key every third of this
+IDEMPOTENCY_STALE_SECONDS = float(os.getenv("IDEMPOTENCY_STALE_SECONDS", "600"))
+# How long a retry waits for the original request when it runs in another worker process
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "300"))
+IDEMPOTENCY_POLL_SECONDS = 0.5
+
+class IdempotencyMismatch(ValueError):
+    """The key was already used with a different request body"""
+
+class IdempotencyInProgress(Exception):
+    """The original request is still running elsewhere"""
+
+def request_fingerprint(payload: Dict) -> str:
+    """Hash of a request body, used to coalesce identical requests and validate reused keys"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers with the same key share its result"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here so an error nobody awaited is not logged as lost
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (result, shared); a caller that disconnects does not cancel the shared call"""
+        task = self._calls.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        CACHE_REQUESTS.inc(cache="single_flight", result="joined" if shared else "started")
+        return await asyncio.shield(task), shared
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+class IdempotencyStore:
+    """SQLite record of Idempotency-Key requests and their responses, shared by all workers"""
+
+    def __init__(self, ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS,
+                 stale_seconds: float = IDEMPOTENCY_STALE_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+
+    def begin(self, scope: str, key: str, fingerprint: str) -> Tuple[str, Optional[Dict]]:
+        """Claim a key: ("new", None) for the caller to run, ("completed", response) or ("in_progress", None)"""
+        now = time.time()
+        conn = get_db()
+        cursor = conn.cursor()
+        # IMMEDIATE: two workers claiming the same key must not both see it as new
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (now - self.ttl_seconds,))
+            row = cursor.execute("""
+                SELECT fingerprint, status, response, updated_at FROM idempotency_keys
+                WHERE scope = ? AND idempotency_key = ?
+            """, (scope, key)).fetchone()
+            if row is not None and row["fingerprint"] != fingerprint:
+                raise IdempotencyMismatch("Idempotency-Key was already used with a different request")
+            if row is None or (row["status"] == "in_progress" and now - row["updated_at"] > self.stale_seconds):
+                cursor.execute("""
+                    INSERT OR REPLACE INTO idempotency_keys
+                    (scope, idempotency_key, fingerprint, status, created_at, updated_at)
+                    VALUES (?, ?, ?, 'in_progress', ?, ?)
+                """, (scope, key, fingerprint, now, now))
+                conn.commit()
+                return "new", None
+            conn.commit()
+            if row["status"] == "completed":
+                return "completed", json.loads(decompress_content(row["response"]))
+            return "in_progress", None
+        finally:
+            conn.close()
+
+    def complete(self, scope: str, key: str, response: Dict):
+        """Store the response returned for a key"""
+        conn = get_db()
+        conn.execute("""
+            UPDATE idempotency_keys SET status = 'completed', response = ?, updated_at = ?
+            WHERE scope = ? AND idempotency_key = ?
+        """, (compress_content(json.dumps(response, default=str)), time.time(), scope, key))
+        conn.commit()
+        conn.close()
+
+    def touch(self, scope: str, key: str):
+        """Mark a key's request as still running, so it is not taken over as stale"""
+        conn = get_db()
+        conn.execute("""
+            UPDATE idempotency_keys SET updated_at = ?
+            WHERE scope = ? AND idempotency_key = ? AND status = 'in_progress'
+        """, (time.time(), scope, key))
+        conn.commit()
+        conn.close()
+
+    async def heartbeat(self, scope: str, key: str):
+        """Touch a key for as long as its request runs (until cancelled)"""
+        while True:
+            await asyncio.sleep(self.stale_seconds / 3)
+            try:
+                await asyncio.to_thread(self.touch, scope, key)
+            except Exception as e:
+                logger.error(f"Idempotency heartbeat error: {e}")
+
+    def release(self, scope: str, key: str):
+        """Forget a key whose request failed, so a retry runs it again"""
+        conn = get_db()
+        conn.execute("DELETE FROM idempotency_keys WHERE scope = ? AND idempotency_key = ? AND status = 'in_progress'",
+                     (scope, key))
+        conn.commit()
+        conn.close()
+
+single_flight = SingleFlight()
+idempotency_store = IdempotencyStore()
+
+async def run_idempotent(scope: str, payload: Dict, call: Callable[[], Awaitable[Dict]],
+                         key: Optional[str] = None) -> Tuple[Dict, bool]:
+    """Run `call` once per idempotency key, or once per identical in-flight request without one.
+
+    Returns (response, replayed). With a key, a repeat returns the stored
+    response, joins the call if it is still running in this process, or
+    waits for it if another worker has it; replayed is true for those
+    repeats only. Identical concurrent requests share one call either way.
+    """
+    fingerprint = request_fingerprint(payload)
+
+    async def claim_and_call() -> Tuple[Dict, bool]:
+        if key is None:
+            return await call(), False
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            state, stored = await asyncio.to_thread(idempotency_store.begin, scope, key, fingerprint)
+            if state == "completed":
+                return stored, True
+            if state == "new":
+                break
+            if time.monotonic() > deadline:
+                raise IdempotencyInProgress("The original request with this Idempotency-Key is still in progress")
+            await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+        heartbeat = asyncio.create_task(idempotency_store.heartbeat(scope, key))
+        try:
+            response = await call()
+        except BaseException:
+            await asyncio.to_thread(idempotency_store.release, scope, key)
+            raise
+        finally:
+            heartbeat.cancel()
+        await asyncio.to_thread(idempotency_store.complete, scope, key, response)
+        return response, False
+
+    flight_key = f"{scope}:{key}:{fingerprint}" if key else f"{scope}:{fingerprint}"
+    (response, replayed), shared = await single_flight.do(flight_key, claim_and_call)
+    # Without a key, a shared call is coalescing, not a replay of an earlier request
+    return response, replayed or (shared and key is not None)
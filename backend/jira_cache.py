@@ -0,0 +1,178 @@
+"""Local Jira issue cache - SQLite table plus in-memory LRU, revalidated by `updated`"""
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from database import get_db
+from services.jira_service import JiraService, is_issue_key
+from metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Entries checked within this window are served without contacting Jira
+JIRA_CACHE_FRESH_SECONDS = float(os.getenv("JIRA_CACHE_FRESH_SECONDS", "60"))
+JIRA_CACHE_MEMORY_ENTRIES = int(os.getenv("JIRA_CACHE_MEMORY_ENTRIES", "1000"))
+
+CacheKey = Tuple[str, str]
+
+class JiraIssueCache:
+    """Serves issues from cache and refetches full bodies only when Jira reports a change"""
+
+    def __init__(self, fresh_seconds: float = JIRA_CACHE_FRESH_SECONDS,
+                 memory_entries: int = JIRA_CACHE_MEMORY_ENTRIES):
+        self.fresh_seconds = fresh_seconds
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[CacheKey, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ----- storage -----
+
+    # SQLite access runs on worker threads (asyncio.to_thread); memory hits stay on the loop
+
+    def _recall(self, key: CacheKey) -> Optional[Dict]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+            return entry
+
+    def _lookup(self, key: CacheKey) -> Optional[Dict]:
+        entry = self._recall(key)
+        if entry is not None:
+            return entry
+        conn = get_db()
+        row = conn.execute("""
+            SELECT issue_json, updated, checked_at FROM jira_issue_cache
+            WHERE domain = ? AND issue_key = ?
+        """, key).fetchone()
+        conn.close()
+        if row is None:
+            return None
+        entry = {"issue": json.loads(row[0]), "updated": row[1], "checked_at": row[2]}
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key: CacheKey, entry: Dict):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _store(self, domain: str, issues: List[Dict]):
+        now = time.time()
+        conn = get_db()
+        conn.executemany("""
+            INSERT OR REPLACE INTO jira_issue_cache (domain, issue_key, issue_json, updated, checked_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(domain, issue["key"], json.dumps(issue), issue.get("updated"), now) for issue in issues])
+        conn.commit()
+        conn.close()
+        for issue in issues:
+            self._remember((domain, issue["key"]),
+                           {"issue": issue, "updated": issue.get("updated"), "checked_at": now})
+
+    async def _entry(self, key: CacheKey) -> Optional[Dict]:
+        entry = self._recall(key)
+        if entry is None:
+            entry = await asyncio.to_thread(self._lookup, key)
+        return entry
+
+    def _touch(self, domain: str, keys: List[str]):
+        """Mark entries as revalidated without rewriting their bodies"""
+        now = time.time()
+        conn = get_db()
+        conn.executemany("""
+            UPDATE jira_issue_cache SET checked_at = ? WHERE domain = ? AND issue_key = ?
+        """, [(now, domain, key) for key in keys])
+        conn.commit()
+        conn.close()
+        for key in keys:
+            entry = self._lookup((domain, key))
+            if entry is not None:
+                entry["checked_at"] = now
+
+    def _forget(self, domain: str, keys: List[str]):
+        """Drop entries for issues that no longer exist"""
+        conn = get_db()
+        conn.executemany("DELETE FROM jira_issue_cache WHERE domain = ? AND issue_key = ?",
+                         [(domain, key) for key in keys])
+        conn.commit()
+        conn.close()
+        with self._lock:
+            for key in keys:
+                self._memory.pop((domain, key), None)
+
+    def _is_fresh(self, entry: Dict) -> bool:
+        return time.time() - entry["checked_at"] < self.fresh_seconds
+
+    # ----- public API -----
+
+    async def get_issue(self, service: JiraService, issue_key: str) -> Optional[Dict]:
+        """Return one issue, probing `updated` before refetching a stale entry"""
+        entry = await self._entry((service.domain, issue_key))
+        if entry is not None:
+            if self._is_fresh(entry):
+                CACHE_REQUESTS.inc(cache="jira", result="hit")
+                return entry["issue"]
+            updated = await service.fetch_updated(issue_key)
+            if updated is not None and updated == entry["updated"]:
+                await asyncio.to_thread(self._touch, service.domain, [issue_key])
+                CACHE_REQUESTS.inc(cache="jira", result="revalidated")
+                return entry["issue"]
+
+        CACHE_REQUESTS.inc(cache="jira", result="miss")
+        issue = await service.fetch_issue(issue_key)
+        if issue:
+            await asyncio.to_thread(self._store, service.domain, [issue])
+        return issue
+
+    async def get_issues(self, service: JiraService, issue_keys: List[str]) -> Dict[str, Dict]:
+        """Return many issues keyed by issue key; unknown, deleted and malformed keys are omitted.
+
+        Stale entries are revalidated with one `updated`-only search per 100
+        keys, and only the issues whose timestamp moved (plus uncached ones)
+        are refetched in full. Entries for issues Jira no longer returns are
+        dropped.
+        """
+        result: Dict[str, Dict] = {}
+        stale: Dict[str, Dict] = {}
+        missing: List[str] = []
+        for key in dict.fromkeys(key for key in issue_keys if is_issue_key(key)):
+            entry = await self._entry((service.domain, key))
+            if entry is None:
+                missing.append(key)
+            elif self._is_fresh(entry):
+                result[key] = entry["issue"]
+                CACHE_REQUESTS.inc(cache="jira", result="hit")
+            else:
+                stale[key] = entry
+
+        if stale:
+            current = {}
+            async for issue in service.search_issues(keys=list(stale), fields=["updated"]):
+                current[issue["key"]] = issue["updated"]
+            unchanged = [key for key, entry in stale.items() if key in current and current[key] == entry["updated"]]
+            deleted = [key for key in stale if key not in current]
+            await asyncio.to_thread(self._touch, service.domain, unchanged)
+            if deleted:
+                await asyncio.to_thread(self._forget, service.domain, deleted)
+            CACHE_REQUESTS.inc(len(unchanged), cache="jira", result="revalidated")
+            for key in unchanged:
+                result[key] = stale[key]["issue"]
+            missing.extend(key for key in current if key in stale and key not in result)
+
+        if missing:
+            CACHE_REQUESTS.inc(len(missing), cache="jira", result="miss")
+            fetched = [issue async for issue in service.search_issues(keys=missing)]
+            await asyncio.to_thread(self._store, service.domain, fetched)
+            for issue in fetched:
+                result[issue["key"]] = issue
+        return result
+
+jira_issue_cache = JiraIssueCache()
@@ -0,0 +1,284 @@
+"""Background generation jobs - SQLite-backed priority queue with leased workers"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from database import get_db
+from models import GenerateTestPlanRequest
+from generation import run_generation
+from metrics import GENERATIONS
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# A running job's lease is renewed every JOB_LEASE_SECONDS / 3. If its worker
+# dies (restart, crash), the lease lapses and another worker picks the job up.
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+# A failed attempt is retried after JOB_RETRY_BACKOFF_SECONDS, doubling each time,
+# until the job has made JOB_MAX_ATTEMPTS attempts
+JOB_RETRY_BACKOFF_SECONDS = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "5"))
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+def _job_dict(row) -> Dict:
+    """Convert a generation_jobs row to its API representation"""
+    job = dict(row)
+    job.pop("request_json", None)
+    job.pop("lease_expires_at", None)
+    result = job.pop("result_json", None)
+    job["result"] = json.loads(result) if result else None
+    return job
+
+class JobQueue:
+    """Runs queued generations on a pool of asyncio workers"""
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self._worker_tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelled: set = set()
+        self._wakeup: Optional[asyncio.Event] = None
+
+    # ----- submission and inspection -----
+
+    # The sync methods below run on worker threads (asyncio.to_thread) so SQLite
+    # waits never block the event loop; the async ones are the public API.
+
+    def _insert(self, request: GenerateTestPlanRequest, priority: int) -> str:
+        job_id = str(uuid.uuid4())
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO generation_jobs (id, status, priority, jira_issue_id, request_json, created_at)
+            VALUES (?, 'queued', ?, ?, ?, ?)
+        """, (job_id, priority, request.jira_details.key, request.model_dump_json(), time.time()))
+        conn.commit()
+        conn.close()
+        return job_id
+
+    async def submit(self, request: GenerateTestPlanRequest, priority: int = 0) -> Dict:
+        """Queue a generation and return the new job"""
+        job_id = await asyncio.to_thread(self._insert, request, priority)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return await self.get(job_id)
+
+    def _get(self, job_id: str) -> Optional[Dict]:
+        conn = get_db()
+        row = conn.execute("SELECT * FROM generation_jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.close()
+        return _job_dict(row) if row else None
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        """Return a job by id, or None"""
+        return await asyncio.to_thread(self._get, job_id)
+
+    def _list(self, status: Optional[str], limit: int) -> List[Dict]:
+        conn = get_db()
+        if status:
+            rows = conn.execute("""
+                SELECT * FROM generation_jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?
+            """, (status, limit)).fetchall()
+        else:
+            rows = conn.execute("""
+                SELECT * FROM generation_jobs ORDER BY created_at DESC LIMIT ?
+            """, (limit,)).fetchall()
+        conn.close()
+        return [_job_dict(row) for row in rows]
+
+    async def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """Return the most recent jobs, optionally filtered by status"""
+        return await asyncio.to_thread(self._list, status, limit)
+
+    def _mark_cancelled(self, job_id: str):
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE generation_jobs SET status = 'cancelled', finished_at = ?
+            WHERE id = ? AND status IN ('queued', 'running')
+        """, (time.time(), job_id))
+        conn.commit()
+        conn.close()
+
+    async def cancel(self, job_id: str) -> Optional[Dict]:
+        """Cancel a queued or running job; finished jobs are left unchanged"""
+        await asyncio.to_thread(self._mark_cancelled, job_id)
+        # A job running in another process notices on its next lease renewal
+        task = self._running.get(job_id)
+        if task is not None:
+            self._cancelled.add(job_id)
+            task.cancel()
+        return await self.get(job_id)
+
+    # ----- workers -----
+
+    def start(self):
+        """Start the worker pool on the running event loop"""
+        self._wakeup = asyncio.Event()
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(f"worker-{os.getpid()}-{i}"))
+            for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        """Stop the workers and hand their in-flight jobs back to the queue"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        await asyncio.to_thread(self._requeue_own)
+
+    def _requeue_own(self):
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE generation_jobs SET status = 'queued', attempts = attempts - 1, lease_expires_at = NULL
+            WHERE status = 'running' AND worker_id LIKE ?
+        """, (f"worker-{os.getpid()}-%",))
+        conn.commit()
+        conn.close()
+
+    def _claim(self, worker_id: str):
+        """Atomically claim the highest-priority queued job, or a running job whose lease lapsed"""
+        now = time.time()
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE generation_jobs
+            SET status = 'running', worker_id = ?, attempts = attempts + 1,
+                started_at = ?, lease_expires_at = ?
+            WHERE id = (
+                SELECT id FROM generation_jobs
+                WHERE (status = 'queued' AND (not_before IS NULL OR not_before <= ?))
+                   OR (status = 'running' AND lease_expires_at < ?)
+                ORDER BY priority DESC, created_at
+                LIMIT 1
+            )
+            RETURNING id, request_json, attempts
+        """, (worker_id, now, now + JOB_LEASE_SECONDS, now, now))
+        row = cursor.fetchone()
+        conn.commit()
+        conn.close()
+        return row
+
+    def _finish(self, job_id: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE generation_jobs
+            SET status = ?, result_json = ?, generation_id = ?, error = ?, finished_at = ?
+            WHERE id = ? AND status = 'running'
+        """, (
+            status,
+            json.dumps(result) if result else None,
+            result["id"] if result else None,
+            error,
+            time.time(),
+            job_id
+        ))
+        conn.commit()
+        conn.close()
+
+    def _retry_later(self, job_id: str, error: str, delay: float):
+        """Hand a failed attempt back to the queue, claimable again after `delay` seconds"""
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE generation_jobs
+            SET status = 'queued', error = ?, not_before = ?, worker_id = NULL, lease_expires_at = NULL
+            WHERE id = ? AND status = 'running'
+        """, (error, time.time() + delay, job_id))
+        conn.commit()
+        conn.close()
+
+    def _renew_lease(self, job_id: str) -> bool:
+        """Extend a running job's lease; False once it has been cancelled"""
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE generation_jobs SET lease_expires_at = ?
+            WHERE id = ? AND status = 'running'
+        """, (time.time() + JOB_LEASE_SECONDS, job_id))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount == 1
+
+    async def _keep_lease(self, job_id: str, task: asyncio.Task):
+        while not task.done():
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            if not await asyncio.to_thread(self._renew_lease, job_id):
+                self._cancelled.add(job_id)
+                task.cancel()
+                return
+
+    async def _worker(self, worker_id: str):
+        while True:
+            try:
+                claimed = await asyncio.to_thread(self._claim, worker_id)
+            except Exception as e:
+                logger.error(f"Job claim error: {e}")
+                claimed = None
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(claimed["id"], claimed["request_json"], claimed["attempts"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # e.g. the database was unavailable when recording the outcome; the
+                # lease lapses and the job is retried, so keep this worker alive
+                logger.error(f"Job {claimed['id']} could not be completed on {worker_id}: {e}")
+
+    async def _run(self, job_id: str, request_json: str, attempts: int):
+        if attempts > JOB_MAX_ATTEMPTS:
+            await asyncio.to_thread(self._finish, job_id, "failed", error=f"Gave up after {JOB_MAX_ATTEMPTS} attempts")
+            return
+        try:
+            request = GenerateTestPlanRequest.model_validate_json(request_json)
+        except ValueError as e:
+            logger.error(f"Job {job_id} has an invalid request: {e}")
+            await asyncio.to_thread(self._finish, job_id, "failed", error=f"Invalid request: {e}")
+            GENERATIONS.inc(endpoint="job", outcome="failed")
+            return
+        task = asyncio.create_task(run_generation(request))
+        self._running[job_id] = task
+        lease = asyncio.create_task(self._keep_lease(job_id, task))
+        try:
+            result = await task
+            await asyncio.to_thread(self._finish, job_id, "completed", result=result)
+            GENERATIONS.inc(endpoint="job", outcome="completed")
+        except asyncio.CancelledError:
+            if job_id not in self._cancelled:
+                # The worker itself is being stopped; stop() requeues the job
+                task.cancel()
+                raise
+            logger.info(f"Job {job_id} cancelled")
+        except Exception as e:
+            # Invalid input fails the same way every time; anything else (provider
+            # or Jira outages, timeouts) may succeed on a later attempt
+            if attempts < JOB_MAX_ATTEMPTS and not isinstance(e, ValueError):
+                delay = JOB_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+                logger.warning(f"Job {job_id} attempt {attempts} failed, retrying in {delay:g}s: {e}")
+                await asyncio.to_thread(self._retry_later, job_id, str(e), delay)
+                GENERATIONS.inc(endpoint="job", outcome="retried")
+            else:
+                logger.error(f"Job {job_id} failed: {e}")
+                await asyncio.to_thread(self._finish, job_id, "failed", error=str(e))
+                GENERATIONS.inc(endpoint="job", outcome="failed")
+        finally:
+            lease.cancel()
+            self._running.pop(job_id, None)
+            self._cancelled.discard(job_id)
+
+job_queue = JobQueue()
@@ -0,0 +1,311 @@
+"""LLM provider routing - weighted load balancing, health tracking, failover and hedging"""
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+
+from config_cache import config_cache
+from metrics import LLM_ATTEMPTS, LLM_HEDGES, LLM_IN_FLIGHT, LLM_PROMPT_EVAL_SECONDS
+from services.llm_service import LLMService
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on concurrent calls per provider type, shared by every request in
+# this process (Groq is rate limited per key; a CPU Ollama host serves one at a time)
+LLM_MAX_CONCURRENCY = {
+    "grok": int(os.getenv("LLM_MAX_CONCURRENCY_GROK", "4")),
+    "ollama": int(os.getenv("LLM_MAX_CONCURRENCY_OLLAMA", "1")),
+}
+
+# Fire the next provider if the current one has produced no token after this long (0 = off)
+LLM_HEDGE_SECONDS = float(os.getenv("LLM_HEDGE_SECONDS", "0"))
+LLM_HEDGE_MAX_PARALLEL = int(os.getenv("LLM_HEDGE_MAX_PARALLEL", "2"))
+# Consecutive failures that take a provider out of rotation, and for how long
+LLM_FAILURE_THRESHOLD = int(os.getenv("LLM_FAILURE_THRESHOLD", "3"))
+LLM_COOLDOWN_SECONDS = float(os.getenv("LLM_COOLDOWN_SECONDS", "30"))
+
+# (name, weight, config record)
+Target = Tuple[str, float, object]
+
+_provider_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+def provider_semaphore(provider: str, name: Optional[str] = None) -> asyncio.Semaphore:
+    """Return the process-wide concurrency limiter for a routed provider (keyed by name)"""
+    key = name or provider
+    if key not in _provider_semaphores:
+        _provider_semaphores[key] = asyncio.Semaphore(LLM_MAX_CONCURRENCY.get(provider, 2))
+    return _provider_semaphores[key]
+
+class RoutedResult(NamedTuple):
+    content: str
+    name: str
+    service: LLMService
+
+class ProviderHealth:
+    """Rolling health of one routed provider"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.first_token_seconds: Optional[float] = None  # moving average
+        self.last_error: Optional[str] = None
+
+    def available(self, now: float) -> bool:
+        return self.open_until <= now
+
+    def as_dict(self, now: float) -> Dict:
+        return {
+            "available": self.available(now),
+            "in_flight": self.in_flight,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in_seconds": round(max(0.0, self.open_until - now), 1),
+            "successes": self.successes,
+            "failures": self.failures,
+            "avg_time_to_first_token_seconds":
+                round(self.first_token_seconds, 3) if self.first_token_seconds is not None else None,
+            "last_error": self.last_error
+        }
+
+class _Attempt:
+    """One provider call, streamed so the router can see when the first token arrives"""
+
+    def __init__(self, router: "LLMRouter", target: Target, prompt: str, keep_tokens: bool):
+        self.router = router
+        self.name = target[0]
+        self.service = router.service_for(target)
+        self.first_token = asyncio.Event()
+        self.tokens: Optional[asyncio.Queue] = asyncio.Queue() if keep_tokens else None
+        self.task = asyncio.create_task(self._run(prompt))
+
+    async def _run(self, prompt: str) -> str:
+        health = self.router.health(self.name)
+        async with provider_semaphore(self.service.provider, self.name):
+            health.in_flight += 1
+            LLM_IN_FLIGHT.inc(provider=self.name)
+            start = time.perf_counter()
+            chunks = []
+            try:
+                async for token in self.service.stream_test_plan(prompt):
+                    if not chunks:
+                        self.router.record_first_token(self.name, time.perf_counter() - start)
+                        self.first_token.set()
+                    chunks.append(token)
+                    if self.tokens is not None:
+                        self.tokens.put_nowait(token)
+                if not chunks:
+                    raise RuntimeError("empty response")
+                self.router.record_success(self.name)
+                if self.service.last_usage.get("prompt_eval_seconds") is not None:
+                    LLM_PROMPT_EVAL_SECONDS.observe(self.service.last_usage["prompt_eval_seconds"], provider=self.name)
+                return "".join(chunks)
+            except asyncio.CancelledError:
+                LLM_ATTEMPTS.inc(provider=self.name, outcome="cancelled")
+                raise
+            except Exception as e:
+                logger.error(f"LLM provider {self.name} failed: {e}")
+                self.router.record_failure(self.name, e)
+                raise
+            finally:
+                health.in_flight -= 1
+                LLM_IN_FLIGHT.dec(provider=self.name)
+
+    @property
+    def failed(self) -> bool:
+        return self.task.done() and not self.task.cancelled() and self.task.exception() is not None
+
+class _Race:
+    """Tries providers in routing order until one answers, hedging slow starters"""
+
+    def __init__(self, router: "LLMRouter", prompt: str, order: List[Target],
+                 hedge_seconds: float, keep_tokens: bool = False):
+        self.router = router
+        self.prompt = prompt
+        self.pending = list(order)
+        self.hedge_seconds = hedge_seconds
+        self.keep_tokens = keep_tokens
+        self.racers: List[_Attempt] = []
+        self.errors: List[str] = []
+
+    def _launch(self, hedge: bool = False):
+        target = self.pending.pop(0)
+        if hedge:
+            LLM_HEDGES.inc(provider=target[0])
+        self.racers.append(_Attempt(self.router, target, self.prompt, self.keep_tokens))
+
+    def _reap(self):
+        for attempt in [attempt for attempt in self.racers if attempt.failed]:
+            self.errors.append(f"{attempt.name}: {attempt.task.exception()}")
+            self.racers.remove(attempt)
+
+    async def leader(self) -> _Attempt:
+        """Return the first attempt to produce a token (or finish), cancelling the others"""
+        while True:
+            self._reap()
+            leader = next((attempt for attempt in self.racers
+                           if attempt.first_token.is_set() or attempt.task.done()), None)
+            if leader is not None:
+                self.cancel(keep=leader)
+                return leader
+            if not self.racers:
+                if not self.pending:
+                    raise RuntimeError("All LLM providers failed: " + "; ".join(self.errors or ["none configured"]))
+                self._launch()
+                continue
+
+            can_hedge = self.hedge_seconds > 0 and self.pending and len(self.racers) < LLM_HEDGE_MAX_PARALLEL
+            token_waits = [asyncio.create_task(attempt.first_token.wait()) for attempt in self.racers]
+            try:
+                done, _ = await asyncio.wait(
+                    [attempt.task for attempt in self.racers] + token_waits,
+                    timeout=self.hedge_seconds if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                for wait in token_waits:
+                    wait.cancel()
+            if not done:
+                self._launch(hedge=True)
+
+    def cancel(self, keep: Optional[_Attempt] = None):
+        for attempt in self.racers:
+            if attempt is not keep:
+                attempt.task.cancel()
+        self.racers = [keep] if keep is not None else []
+
+class RoutedStream:
+    """Tokens from whichever provider wins the race; `name`/`service` are set once one does.
+
+    Failover happens only before the first token: once tokens have been
+    forwarded, a provider error is raised to the caller.
+    """
+
+    def __init__(self, router: "LLMRouter", prompt: str, hedge_seconds: float):
+        self.router = router
+        self.prompt = prompt
+        self.hedge_seconds = hedge_seconds
+        self.name: Optional[str] = None
+        self.service: Optional[LLMService] = None
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._tokens()
+
+    async def _tokens(self) -> AsyncIterator[str]:
+        race = _Race(self.router, self.prompt, self.router.order(), self.hedge_seconds, keep_tokens=True)
+        try:
+            attempt = await race.leader()
+            self.name, self.service = attempt.name, attempt.service
+            while True:
+                get = asyncio.ensure_future(attempt.tokens.get())
+                done, _ = await asyncio.wait({get, attempt.task}, return_when=asyncio.FIRST_COMPLETED)
+                if get in done:
+                    yield get.result()
+                    continue
+                get.cancel()
+                while not attempt.tokens.empty():
+                    yield attempt.tokens.get_nowait()
+                attempt.task.result()
+                return
+        finally:
+            race.cancel()
+
+class LLMRouter:
+    """Spreads generations over the configured providers and routes around failing ones"""
+
+    def __init__(self, hedge_seconds: float = LLM_HEDGE_SECONDS):
+        self.hedge_seconds = hedge_seconds
+        self._health: Dict[str, ProviderHealth] = {}
+
+    # ----- targets and ordering -----
+
+    def targets(self) -> List[Target]:
+        """Enabled rows of llm_providers, or the single llm_config row when there are none"""
+        providers = [provider for provider in config_cache.llm_providers() if provider.enabled]
+        if providers:
+            return [(provider.name, provider.weight, provider) for provider in providers]
+        config = config_cache.llm()
+        return [("default", 1.0, config)] if config else []
+
+    @staticmethod
+    def service_for(target: Target) -> LLMService:
+        config = target[2]
+        return LLMService(config.provider, **config.model_dump(exclude={"provider", "name", "weight", "enabled"}))
+
+    def health(self, name: str) -> ProviderHealth:
+        if name not in self._health:
+            self._health[name] = ProviderHealth()
+        return self._health[name]
+
+    def order(self) -> List[Target]:
+        """Available providers in weighted-random order (discounted by their current load),
+        then providers in cooldown, soonest-to-recover first, as a last resort"""
+        now = time.monotonic()
+        available, cooling = [], []
+        for target in self.targets():
+            (available if self.health(target[0]).available(now) else cooling).append(target)
+
+        def draw(target: Target) -> float:
+            weight = max(target[1], 1e-6) / (1 + self.health(target[0]).in_flight)
+            return random.random() ** (1 / weight)
+
+        available.sort(key=draw, reverse=True)
+        cooling.sort(key=lambda target: self.health(target[0]).open_until)
+        return available + cooling
+
+    # ----- health bookkeeping -----
+
+    def record_first_token(self, name: str, seconds: float):
+        health = self.health(name)
+        previous = health.first_token_seconds
+        health.first_token_seconds = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+
+    def record_success(self, name: str):
+        health = self.health(name)
+        health.successes += 1
+        health.consecutive_failures = 0
+        health.open_until = 0.0
+        LLM_ATTEMPTS.inc(provider=name, outcome="success")
+
+    def record_failure(self, name: str, error: Exception):
+        health = self.health(name)
+        health.failures += 1
+        health.consecutive_failures += 1
+        health.last_error = str(error)
+        if health.consecutive_failures >= LLM_FAILURE_THRESHOLD:
+            health.open_until = time.monotonic() + LLM_COOLDOWN_SECONDS
+        LLM_ATTEMPTS.inc(provider=name, outcome="failure")
+
+    def snapshot(self) -> List[Dict]:
+        """Routing state of every configured provider"""
+        now = time.monotonic()
+        return [
+            {"name": name, "provider": config.provider, "weight": weight, **self.health(name).as_dict(now)}
+            for name, weight, config in self.targets()
+        ]
+
+    # ----- routing -----
+
+    async def generate(self, prompt: str, hedge_seconds: Optional[float] = None) -> RoutedResult:
+        """Generate with failover (and optional hedging); raises once every provider has failed"""
+        hedge = self.hedge_seconds if hedge_seconds is None else hedge_seconds
+        race = _Race(self, prompt, self.order(), hedge)
+        try:
+            while True:
+                attempt = await race.leader()
+                try:
+                    content = await attempt.task
+                except Exception:
+                    continue  # reaped by the next leader() call, which fails over
+                return RoutedResult(content, attempt.name, attempt.service)
+        finally:
+            race.cancel()
+
+    def stream(self, prompt: str, hedge_seconds: Optional[float] = None) -> RoutedStream:
+        """Stream tokens from the first provider to respond"""
+        return RoutedStream(self, prompt, self.hedge_seconds if hedge_seconds is None else hedge_seconds)
+
+llm_router = LLMRouter()
@@ -1,30 +1,73 @@
 """FastAPI Main Application - TP Creator Intelligence Test Plan Agent"""
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
 import os
 import json
+import asyncio
 import uuid
 from datetime import datetime
 import time
+import io
 import logging
+import zipfile
+import aiofiles
+from contextlib import asynccontextmanager
 
-from database import init_db, get_db
+from database import init_db, get_db, close_db, bump_config_version, decompress_content
+from config_cache import config_cache
+from generation import (
+    build_test_plan_prompt, llm_service_from_config, load_configured_template, routed_identities,
+    cache_plan, cached_response, find_similar_plans, generate_for_story, generate_sectioned, history_row, save_generation, save_generations,
+    build_generation_response, run_generation, story_text, warm_up_llm, schedule_warm_up, REUSE_IDENTITY
+)
+from similarity import (
+    similarity_index, load_plan, SIMILARITY_ENABLED, SIMILARITY_REUSE_THRESHOLD, SIMILARITY_EXAMPLE_THRESHOLD
+)
+from llm_router import llm_router, LLM_MAX_CONCURRENCY
 from models import *
-from services.jira_service import JiraService
-from services.llm_service import LLMService
+from services.jira_service import JiraService, is_issue_key
 from services.template_service import TemplateService
-from services.export_service import ExportService
+from services.export_service import EXPORT_FORMATS, content_hash
+from services.http_client import http_pool
+from services.rate_limit import limiter_snapshots
+from job_queue import job_queue, TERMINAL_STATUSES
+from idempotency import run_idempotent, IdempotencyMismatch, IdempotencyInProgress
+from jira_cache import jira_issue_cache
+from export_artifacts import export_prerenderer, remove_artifacts, prune_periodically
+from history import list_generations, search_generations, generation_stats
+from metrics import (
+    METRICS_ENABLED, registry, install_log_counter, HTTP_REQUESTS, HTTP_REQUEST_SECONDS, HTTP_IN_FLIGHT,
+    GENERATIONS, GENERATION_STAGE_SECONDS
+)
 
 # Setup
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+install_log_counter()
 init_db()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Own the job workers, export render pool and shared HTTP/database pools for the app's lifetime"""
+    job_queue.start()
+    prune_task = asyncio.create_task(prune_periodically())
+    schedule_warm_up()
+    if SIMILARITY_ENABLED:
+        # Build the index off the request path; lookups before it finishes wait for it
+        asyncio.get_running_loop().run_in_executor(None, similarity_index.ensure_loaded)
+    yield
+    prune_task.cancel()
+    await job_queue.stop()
+    export_prerenderer.shutdown()
+    await http_pool.close()
+    close_db()
+
 app = FastAPI(
     title="TP Creator - Intelligence Test Plan Agent",
     description="Automated test plan generation using Jira + LLM",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS
@@ -36,9 +79,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if METRICS_ENABLED:
+    @app.middleware("http")
+    async def record_request_metrics(request: Request, call_next):
+        """Count and time every request by its route template (not the raw path)"""
+        start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = request.scope.get("route")
+            labels = {"method": request.method, "route": getattr(route, "path", "unmatched")}
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, **labels)
+            HTTP_REQUESTS.inc(status=status, **labels)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint (this worker process only)"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 # Root endpoint
 @app.get("/")
-def root():
+async def root():
     return {
         "message": "🚀 TP Creator - Intelligence Test Plan Agent",
         "docs": "/docs",
@@ -46,7 +114,7 @@ def root():
     }
 
 @app.get("/api/health", response_model=HealthResponse)
-def health_check():
+async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
@@ -55,12 +123,23 @@ def health_check():
         "llm": "ready"
     }
 
+def _mark_connected(table: str, name: str):
+    """Record a successful connection test on a config table (run via asyncio.to_thread)"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        UPDATE {table} SET connection_status = 'connected', last_tested_at = CURRENT_TIMESTAMP
+    """)
+    bump_config_version(cursor, name)
+    conn.commit()
+    conn.close()
+
 # ============== JIRA ENDPOINTS ==============
 
 @app.post("/api/config/jira")
-def save_jira_config(config: JiraConfigUpdate):
+async def save_jira_config(config: JiraConfigUpdate):
     """Save Jira configuration"""
-    try:
+    def write():
         conn = get_db()
         cursor = conn.cursor()
         
@@ -69,71 +148,66 @@ def save_jira_config(config: JiraConfigUpdate):
             INSERT INTO jira_config (domain, email, api_token, connection_status)
             VALUES (?, ?, ?, 'untested')
         """, (config.domain, config.email, config.api_token))
+        bump_config_version(cursor, "jira")
         
         conn.commit()
         conn.close()
+    
+    try:
+        await asyncio.to_thread(write)
+        config_cache.invalidate("jira")
         
         return {"status": "saved", "message": "Jira configuration saved"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/config/jira")
-def get_jira_config():
+async def get_jira_config():
     """Get Jira configuration"""
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, domain, email, connection_status, last_tested_at FROM jira_config LIMIT 1")
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
+        config = await config_cache.aget("jira")
+        if config:
             return {
-                "id": row[0],
-                "domain": row[1],
-                "email": row[2],
-                "connection_status": row[3],
-                "last_tested_at": row[4]
+                "id": config.id,
+                "domain": config.domain,
+                "email": config.email,
+                "connection_status": config.connection_status,
+                "last_tested_at": config.last_tested_at
             }
         return {"status": "not_configured"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/config/test-jira")
-def test_jira_connection():
+async def test_jira_connection():
     """Test Jira connection"""
     try:
-        config = get_jira_config()
-        if "status" in config and config["status"] == "not_configured":
+        config = await config_cache.aget("jira")
+        if not config:
             raise HTTPException(status_code=400, detail="Jira not configured")
         
-        service = JiraService(config["domain"], config["email"], "")
-        result = service.test_connection()
+        service = JiraService(config.domain, config.email, config.api_token)
+        result = await service.test_connection()
         
         # Update status in DB
         if result["status"] == "connected":
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE jira_config SET connection_status = 'connected', last_tested_at = CURRENT_TIMESTAMP
-            """)
-            conn.commit()
-            conn.close()
+            await asyncio.to_thread(_mark_connected, "jira_config", "jira")
+            config_cache.invalidate("jira")
         
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/jira/issue/{issue_id}")
-def fetch_jira_issue(issue_id: str):
-    """Fetch Jira issue details"""
+async def fetch_jira_issue(issue_id: str):
+    """Fetch Jira issue details, served from the local cache while the issue is unchanged"""
     try:
-        config = get_jira_config()
-        if "status" in config:
+        config = await config_cache.aget("jira")
+        if not config:
             raise HTTPException(status_code=400, detail="Jira not configured")
         
-        service = JiraService(config["domain"], config["email"], "hidden_token")
-        issue = service.fetch_issue(issue_id)
+        service = JiraService(config.domain, config.email, config.api_token)
+        issue = await jira_issue_cache.get_issue(service, issue_id)
         
         if not issue:
             raise HTTPException(status_code=404, detail=f"Issue {issue_id} not found")
@@ -142,12 +216,42 @@ def fetch_jira_issue(issue_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/jira/search")
+async def search_jira_issues(request: JiraSearchRequest):
+    """Bulk-fetch Jira issues by JQL and/or keys, streamed as newline-delimited JSON"""
+    config = await config_cache.aget("jira")
+    if not config:
+        raise HTTPException(status_code=400, detail="Jira not configured")
+    if not request.jql and not request.keys:
+        raise HTTPException(status_code=400, detail="Provide a JQL query or issue keys")
+    
+    service = JiraService(config.domain, config.email, config.api_token)
+    
+    async def issue_stream():
+        try:
+            found = set()
+            async for issue in service.search_issues(
+                jql=request.jql, keys=request.keys, fields=request.fields,
+                page_size=min(request.page_size, 100)
+            ):
+                found.add(issue["key"])
+                yield json.dumps(issue) + "\n"
+            for key in dict.fromkeys(request.keys or []):
+                if key not in found:
+                    error = "Issue not found" if is_issue_key(key) else "Invalid issue key"
+                    yield json.dumps({"key": key, "error": error}) + "\n"
+        except Exception as e:
+            logger.error(f"Jira search error: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return StreamingResponse(issue_stream(), media_type="application/x-ndjson")
+
 # ============== LLM ENDPOINTS ==============
 
 @app.post("/api/config/llm")
-def save_llm_config(config: LLMConfigUpdate):
+async def save_llm_config(config: LLMConfigUpdate):
     """Save LLM configuration"""
-    try:
+    def write():
         conn = get_db()
         cursor = conn.cursor()
         
@@ -166,278 +270,906 @@ def save_llm_config(config: LLMConfigUpdate):
             config.ollama_url,
             config.ollama_model
         ))
+        bump_config_version(cursor, "llm")
         
         conn.commit()
         conn.close()
+    
+    try:
+        await asyncio.to_thread(write)
+        config_cache.invalidate("llm")
+        schedule_warm_up()
         
         return {"status": "saved", "message": f"LLM configuration saved ({config.provider})"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/config/llm")
-def get_llm_config():
+async def get_llm_config():
     """Get LLM configuration"""
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, provider, grok_model, ollama_url, ollama_model, connection_status
-            FROM llm_config LIMIT 1
-        """)
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
+        config = await config_cache.aget("llm")
+        if config:
             return {
-                "id": row[0],
-                "provider": row[1],
-                "grok_model": row[2],
-                "ollama_url": row[3],
-                "ollama_model": row[4],
-                "connection_status": row[5]
+                "id": config.id,
+                "provider": config.provider,
+                "grok_model": config.grok_model,
+                "ollama_url": config.ollama_url,
+                "ollama_model": config.ollama_model,
+                "connection_status": config.connection_status
             }
         return {"status": "not_configured"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/config/test-llm")
-def test_llm_connection():
+async def test_llm_connection():
     """Test LLM provider connection"""
     try:
-        config = get_llm_config()
-        if "status" in config:
+        config = await config_cache.aget("llm")
+        if not config:
             raise HTTPException(status_code=400, detail="LLM not configured")
         
-        service = LLMService(config["provider"], **config)
-        result = service.test_connection()
+        service = llm_service_from_config(config)
+        result = await service.test_connection()
         
         if result["status"] == "connected":
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE llm_config SET connection_status = 'connected', last_tested_at = CURRENT_TIMESTAMP
-            """)
-            conn.commit()
-            conn.close()
+            await asyncio.to_thread(_mark_connected, "llm_config", "llm")
+            config_cache.invalidate("llm")
         
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/config/llm/providers")
+async def list_llm_providers():
+    """List routed LLM providers with their live health"""
+    try:
+        await config_cache.refresh("llm", "llm_providers")
+        health = {entry["name"]: entry for entry in llm_router.snapshot()}
+        return {
+            "providers": [
+                {
+                    "id": provider.id,
+                    "name": provider.name,
+                    "provider": provider.provider,
+                    "grok_model": provider.grok_model,
+                    "ollama_url": provider.ollama_url,
+                    "ollama_model": provider.ollama_model,
+                    "weight": provider.weight,
+                    "enabled": provider.enabled,
+                    "connection_status": provider.connection_status,
+                    "health": health.get(provider.name)
+                }
+                for provider in config_cache.llm_providers()
+            ]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/config/llm/providers")
+async def save_llm_provider(config: LLMProviderUpdate):
+    """Add or replace a routed LLM provider (matched by name)"""
+    def write():
+        conn = get_db()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            INSERT INTO llm_providers
+            (name, provider, grok_api_key, grok_model, grok_temperature, grok_max_tokens,
+             ollama_url, ollama_model, weight, enabled, connection_status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'untested')
+            ON CONFLICT(name) DO UPDATE SET
+                provider = excluded.provider, grok_api_key = excluded.grok_api_key,
+                grok_model = excluded.grok_model, grok_temperature = excluded.grok_temperature,
+                grok_max_tokens = excluded.grok_max_tokens, ollama_url = excluded.ollama_url,
+                ollama_model = excluded.ollama_model, weight = excluded.weight,
+                enabled = excluded.enabled, connection_status = 'untested'
+        """, (
+            config.name,
+            config.provider,
+            config.grok_api_key,
+            config.grok_model,
+            config.grok_temperature,
+            config.grok_max_tokens,
+            config.ollama_url,
+            config.ollama_model,
+            config.weight,
+            int(config.enabled)
+        ))
+        bump_config_version(cursor, "llm_providers")
+
+        conn.commit()
+        conn.close()
+
+    try:
+        if config.weight <= 0:
+            raise ValueError("weight must be positive")
+        await asyncio.to_thread(write)
+        config_cache.invalidate("llm_providers")
+        schedule_warm_up()
+
+        return {"status": "saved", "message": f"LLM provider {config.name} saved ({config.provider})"}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/api/config/llm/providers/{name}")
+async def delete_llm_provider(name: str):
+    """Remove a routed LLM provider"""
+    def delete() -> bool:
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM llm_providers WHERE name = ?", (name,))
+        if cursor.rowcount == 0:
+            conn.close()
+            return False
+        bump_config_version(cursor, "llm_providers")
+        conn.commit()
+        conn.close()
+        return True
+    
+    try:
+        if not await asyncio.to_thread(delete):
+            raise HTTPException(status_code=404, detail="Provider not found")
+        config_cache.invalidate("llm_providers")
+        return {"status": "deleted", "name": name}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/llm/warm-up")
+async def warm_up_llm_providers():
+    """Load the routed Ollama models now and report load and prompt-eval times"""
+    try:
+        return {"providers": await warm_up_llm()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/llm/router")
+async def get_llm_router():
+    """Current routing order inputs: per-provider health, load and cooldown, plus upstream rate limit budgets"""
+    await config_cache.refresh("llm", "llm_providers")
+    return {"providers": llm_router.snapshot(), "rate_limits": limiter_snapshots()}
+
 # ============== TEMPLATE ENDPOINTS ==============
 
 @app.post("/api/config/template")
-def save_template_config(config: TemplateConfigUpdate):
+async def save_template_config(config: TemplateConfigUpdate):
     """Save template configuration"""
     try:
-        validation = TemplateService.validate_template(config.file_path)
-        
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM template_config")
+        validation = await asyncio.to_thread(TemplateService.validate_template, config.file_path)
+        if validation["status"] != "failed":
+            # Extract the prompt outline now rather than on the first generation
+            await asyncio.to_thread(TemplateService.load_outline, config.file_path)
         
-        file_ext = config.file_path.split('.')[-1].lower()
-        cursor.execute("""
-            INSERT INTO template_config (file_path, file_format, validation_status)
-            VALUES (?, ?, ?)
-        """, (config.file_path, file_ext, validation["status"]))
+        def write():
+            conn = get_db()
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM template_config")
+            
+            file_ext = config.file_path.split('.')[-1].lower()
+            cursor.execute("""
+                INSERT INTO template_config (file_path, file_format, validation_status)
+                VALUES (?, ?, ?)
+            """, (config.file_path, file_ext, validation["status"]))
+            bump_config_version(cursor, "template")
+            
+            conn.commit()
+            conn.close()
         
-        conn.commit()
-        conn.close()
+        await asyncio.to_thread(write)
+        config_cache.invalidate("template")
+        # The prompt prefix changed with the template
+        schedule_warm_up()
         
         return {"status": "saved", "validation": validation}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/config/template")
-def get_template_config():
+async def get_template_config():
     """Get template configuration"""
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, file_path, file_format, validation_status FROM template_config LIMIT 1
-        """)
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
+        config = await config_cache.aget("template")
+        if config:
             return {
-                "id": row[0],
-                "file_path": row[1],
-                "file_format": row[2],
-                "validation_status": row[3]
+                "id": config.id,
+                "file_path": config.file_path,
+                "file_format": config.file_format,
+                "validation_status": config.validation_status
             }
         return {"status": "not_configured"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/config/template/outline")
+async def get_template_outline():
+    """Show the structural outline of the configured template that prompts include"""
+    try:
+        template_used, template_outline = await load_configured_template()
+        return {"template_used": template_used, "outline": template_outline, "chars": len(template_outline)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ============== TEST PLAN GENERATION ==============
 
 @app.post("/api/generate/test-plan", response_model=GenerateTestPlanResponse)
-def generate_test_plan(request: GenerateTestPlanRequest):
-    """Generate test plan from Jira issue"""
+async def generate_test_plan(request: GenerateTestPlanRequest, response: Response,
+                             idempotency_key: Optional[str] = Header(None)):
+    """Generate test plan from Jira issue.
+
+    A retry with the same Idempotency-Key returns the original result, and
+    identical requests in flight at the same time share one generation.
+    """
     try:
+        result, replayed = await run_idempotent(
+            "generate", request.model_dump(mode="json"), lambda: run_generation(request), idempotency_key
+        )
+        if replayed:
+            response.headers["Idempotency-Replayed"] = "true"
+        GENERATIONS.inc(endpoint="single", outcome="replayed" if replayed else "completed")
+        return result
+    except IdempotencyMismatch as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Generation error: {e}")
+        GENERATIONS.inc(endpoint="single", outcome="failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/generate/test-plan/stream")
+async def generate_test_plan_stream(request: GenerateTestPlanRequest):
+    """Generate test plan from Jira issue, streaming tokens as server-sent events.
+
+    Emits a `start` event with the generation id, one `token` event per chunk
+    from the provider, then a `done` event carrying the same payload as
+    /api/generate/test-plan once the plan has been saved to history. A cache
+    hit or reused near-duplicate plan is delivered as a single `token` event; a
+    sectioned generation sends each stitched section as it completes, in order. Providers are routed (and
+    hedged) as for other generations, but can only fail over before the
+    first token has been sent.
+    """
+    try:
+        await config_cache.refresh("llm", "llm_providers")
+        identities = routed_identities()
+    except RuntimeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    template_used, template_outline = await load_configured_template()
+    base_prompt = build_test_plan_prompt(request.jira_details, template_outline)
+    # A repeat of this story hits the cache without a similarity lookup
+    cached, cached_identity = (None, None) if request.bypass_cache else await asyncio.to_thread(
+        cached_response, identities, base_prompt
+    )
+    reused, example, similarity = (None, None, {}) if cached else await find_similar_plans(
+        request.jira_details, request.allow_reuse and not request.bypass_cache
+    )
+    prompt = build_test_plan_prompt(request.jira_details, template_outline, example) if example else base_prompt
+    if example and not request.bypass_cache:
+        cached, cached_identity = await asyncio.to_thread(cached_response, identities, prompt)
+    
+    async def event_stream():
         start_time = time.time()
         generation_id = str(uuid.uuid4())
-        
-        # Build prompt from Jira details and template
-        template_config = get_template_config()
-        template_content = ""
-        if "file_path" in template_config:
-            template_content = TemplateService.load_template(template_config["file_path"]) or ""
-        
-        prompt = f"""You are a QA expert creating a professional test plan.
-
-JIRA ISSUE:
-- Key: {request.jira_details.key}
-- Summary: {request.jira_details.summary}
-- Description: {request.jira_details.description}
-- Acceptance Criteria: {request.jira_details.acceptanceCriteria}
-- Priority: {request.jira_details.priority}
-
-TEMPLATE STRUCTURE:
-{template_content[:1000] if template_content else "[Default template: Create test plan with Overview, Scope, Test Scenarios, Exit Criteria]"}
-
-Generate a comprehensive, professional test plan in Markdown format that:
-1. Covers positive, negative, and edge case scenarios
-2. Includes specific test steps and expected results
-3. Addresses all acceptance criteria
-4. Uses professional QA terminology
-5. Is ready for immediate use by QA engineers"""
-        
-        # Generate using LLM
-        llm_config = get_llm_config()
-        if "status" in llm_config:
-            raise HTTPException(status_code=400, detail="LLM not configured")
-        
-        service = LLMService(llm_config["provider"], **llm_config)
-        content = service.generate_test_plan(prompt)
-        
-        if not content:
-            raise HTTPException(status_code=500, detail="LLM generation failed")
-        
-        generation_time = time.time() - start_time
-        
-        # Save to history
+        chunks = []
+        yield _sse_event("start", {"id": generation_id, "jira_issue_id": request.jira_details.key})
+        try:
+            routed = None
+            usage = {}
+            if reused:
+                cache_status, identity = "reuse", REUSE_IDENTITY
+                chunks.append(reused)
+                yield _sse_event("token", {"token": reused})
+            elif cached:
+                cache_status, identity = "hit", cached_identity
+                chunks.append(cached)
+                yield _sse_event("token", {"token": cached})
+            elif request.sectioned:
+                sections: asyncio.Queue = asyncio.Queue()
+                task = asyncio.create_task(generate_sectioned(
+                    request.jira_details, template_outline, example, request.bypass_cache,
+                    request.hedge_seconds, emit=sections.put
+                ))
+                try:
+                    while not (task.done() and sections.empty()):
+                        get = asyncio.ensure_future(sections.get())
+                        await asyncio.wait({get, task}, return_when=asyncio.FIRST_COMPLETED)
+                        if not get.done():
+                            get.cancel()
+                            continue
+                        chunks.append(get.result())
+                        yield _sse_event("token", {"token": get.result()})
+                    _, cache_status, usage, identity = task.result()
+                finally:
+                    task.cancel()
+            else:
+                cache_status = "bypass" if request.bypass_cache else "miss"
+                llm_start = time.perf_counter()
+                routed = llm_router.stream(prompt, request.hedge_seconds)
+                async for token in routed:
+                    chunks.append(token)
+                    yield _sse_event("token", {"token": token})
+                GENERATION_STAGE_SECONDS.observe(
+                    time.perf_counter() - llm_start, stage="llm", provider=routed.name
+                )
+                identity = routed.service.cache_identity()
+            
+            content = "".join(chunks)
+            if not content:
+                GENERATIONS.inc(endpoint="stream", outcome="failed")
+                yield _sse_event("error", {"detail": "LLM generation failed"})
+                return
+            if routed is not None:
+                await asyncio.to_thread(cache_plan, identity, content, prompt, base_prompt)
+                usage = routed.service.last_usage
+            
+            generation_time = time.time() - start_time
+            await asyncio.to_thread(
+                save_generation, generation_id, request.jira_details, content, identity["provider"], generation_time,
+                template_used=template_used, model=identity["model"], cache_status=cache_status, usage=usage
+            )
+            GENERATIONS.inc(endpoint="stream", outcome="completed")
+            yield _sse_event("done", build_generation_response(
+                generation_id, request.jira_details, identity["provider"], content,
+                generation_time, template_used, cache_status, usage, similarity
+            ))
+        except Exception as e:
+            logger.error(f"Streaming generation error: {e}")
+            GENERATIONS.inc(endpoint="stream", outcome="failed")
+            yield _sse_event("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/generate/similar")
+async def find_similar_test_plans(jira_details: JiraIssue):
+    """Past plans most similar to a story, with the scores that decide reuse and few-shot examples"""
+    if not SIMILARITY_ENABLED:
+        raise HTTPException(status_code=404, detail="Similarity index disabled")
+    try:
+        matches = await asyncio.to_thread(
+            similarity_index.search, jira_details.summary, story_text(jira_details),
+            exclude_issue=jira_details.key
+        )
+        return {
+            "matches": matches,
+            "reuse_threshold": SIMILARITY_REUSE_THRESHOLD,
+            "example_threshold": SIMILARITY_EXAMPLE_THRESHOLD,
+            "index": similarity_index.stats()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/generate/test-plan/batch")
+async def generate_test_plan_batch(request: BatchGenerateRequest):
+    """Generate test plans for many Jira issues concurrently.
+
+    Streams newline-delimited JSON: a `start` record, `item` records as each
+    issue starts, completes or fails (completed items carry the full response),
+    then a `done` summary once every history row has been written in one
+    transaction. Concurrency is capped per routed provider across all requests
+    and optionally further by `max_concurrency`.
+    """
+    await config_cache.refresh("llm", "llm_providers")
+    targets = llm_router.targets()
+    if not targets:
+        raise HTTPException(status_code=400, detail="LLM not configured")
+    if not request.issue_keys and not request.issues:
+        raise HTTPException(status_code=400, detail="No issues given")
+    jira_config = await config_cache.aget("jira")
+    if request.issue_keys and not jira_config:
+        raise HTTPException(status_code=400, detail="Jira not configured")
+    
+    template_used, template_outline = await load_configured_template()
+    # By default keep every routed provider busy; the router enforces each one's cap
+    request_limit = asyncio.Semaphore(
+        request.max_concurrency
+        or sum(LLM_MAX_CONCURRENCY.get(config.provider, 2) for _, _, config in targets)
+    )
+    items = list(request.issues) + list(request.issue_keys)
+    
+    async def fetch_issues(keys) -> dict:
+        """Resolve issue keys from the issue cache, bulk-fetching only changed or unknown ones"""
+        jira_service = JiraService(jira_config.domain, jira_config.email, jira_config.api_token)
+        issues = await jira_issue_cache.get_issues(jira_service, keys)
+        return {key: JiraIssue(**issue) for key, issue in issues.items()}
+    
+    async def generate_one(item, fetched: dict, fetch_error: Optional[str], events: asyncio.Queue):
+        label = item if isinstance(item, str) else item.key
+        async with request_limit:
+            try:
+                start_time = time.time()
+                jira_details = item
+                if isinstance(item, str):
+                    jira_details = fetched.get(item)
+                    if not jira_details:
+                        if not is_issue_key(item):
+                            raise ValueError(f"Invalid issue key {item}")
+                        raise LookupError(fetch_error or f"Issue {item} not found")
+                
+                await events.put({"type": "item", "key": label, "status": "started"})
+                content, cache_status, usage, identity, similarity = await generate_for_story(
+                    jira_details, template_outline, request.bypass_cache, request.hedge_seconds,
+                    request.allow_reuse, request.sectioned
+                )
+                provider, model = identity["provider"], identity["model"]
+                
+                generation_time = time.time() - start_time
+                generation_id = str(uuid.uuid4())
+                GENERATIONS.inc(endpoint="batch", outcome="completed")
+                await events.put({
+                    "type": "item",
+                    "key": label,
+                    "status": "completed",
+                    "row": history_row(
+                        generation_id, jira_details, content, provider, generation_time,
+                        template_used, model, cache_status, usage
+                    ),
+                    "result": build_generation_response(
+                        generation_id, jira_details, provider, content,
+                        generation_time, template_used, cache_status, usage, similarity
+                    )
+                })
+            except Exception as e:
+                logger.error(f"Batch generation error for {label}: {e}")
+                GENERATIONS.inc(endpoint="batch", outcome="failed")
+                await events.put({"type": "item", "key": label, "status": "failed", "error": str(e)})
+    
+    async def result_stream():
+        events: asyncio.Queue = asyncio.Queue()
+        tasks = []
+        rows = []
+        finished = 0
+        yield json.dumps({"type": "start", "total": len(items)}) + "\n"
+        try:
+            fetched, fetch_error = {}, None
+            if request.issue_keys:
+                try:
+                    fetched = await fetch_issues(request.issue_keys)
+                except Exception as e:
+                    logger.error(f"Batch Jira fetch error: {e}")
+                    fetch_error = f"Jira fetch failed: {e}"
+            tasks = [asyncio.create_task(generate_one(item, fetched, fetch_error, events)) for item in items]
+            while finished < len(items):
+                event = await events.get()
+                if event["status"] != "started":
+                    finished += 1
+                    event["completed"] = finished
+                    event["total"] = len(items)
+                if "row" in event:
+                    rows.append(event.pop("row"))
+                yield json.dumps(event) + "\n"
+            
+            if rows:
+                await asyncio.to_thread(save_generations, rows)
+            yield json.dumps({
+                "type": "done",
+                "total": len(items),
+                "succeeded": len(rows),
+                "failed": len(items) - len(rows)
+            }) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+# ============== GENERATION JOBS ==============
+
+@app.post("/api/jobs/test-plan", status_code=202)
+async def submit_generation_job(request: GenerationJobRequest, response: Response,
+                                idempotency_key: Optional[str] = Header(None)):
+    """Queue a test plan generation and return its job id immediately"""
+    try:
+        if not idempotency_key:
+            return await job_queue.submit(request, priority=request.priority)
+
+        job, replayed = await run_idempotent(
+            "job", request.model_dump(mode="json"),
+            lambda: job_queue.submit(request, priority=request.priority), idempotency_key
+        )
+        if replayed:
+            response.headers["Idempotency-Replayed"] = "true"
+            return await job_queue.get(job["id"]) or job  # current status rather than the one at submission
+        return job
+    except IdempotencyMismatch as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/jobs")
+async def list_generation_jobs(status: Optional[str] = None, limit: int = 50):
+    """List recent generation jobs"""
+    return await job_queue.list(status=status, limit=min(limit, 500))
+
+@app.get("/api/jobs/{job_id}")
+async def get_generation_job(job_id: str):
+    """Get job status, and the generation result once completed"""
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_generation_job(job_id: str):
+    """Cancel a queued or running job"""
+    job = await job_queue.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_generation_job(job_id: str):
+    """Subscribe to a job's status changes as server-sent events until it finishes"""
+    if not await job_queue.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def event_stream():
+        last_status = None
+        while True:
+            job = await job_queue.get(job_id)
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield _sse_event("status", job)
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(1)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ============== HISTORY ENDPOINTS ==============
+
+@app.get("/api/history")
+async def list_history(limit: int = 50, cursor: Optional[str] = None, jira_issue_id: Optional[str] = None,
+                       provider: Optional[str] = None, created_after: Optional[str] = None,
+                       created_before: Optional[str] = None):
+    """List past generations newest first; pass `next_cursor` back as `cursor` for the next page"""
+    try:
+        return await asyncio.to_thread(
+            list_generations, limit=max(1, min(limit, 200)), cursor=cursor, jira_issue_id=jira_issue_id,
+            provider=provider, created_after=created_after, created_before=created_before
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/history/search")
+async def search_history(q: str, limit: int = 20, cursor: Optional[str] = None,
+                         jira_issue_id: Optional[str] = None, provider: Optional[str] = None,
+                         created_after: Optional[str] = None, created_before: Optional[str] = None):
+    """Full-text search over past summaries and plans, best match first"""
+    try:
+        return await asyncio.to_thread(
+            search_generations, q, limit=max(1, min(limit, 100)), cursor=cursor, jira_issue_id=jira_issue_id,
+            provider=provider, created_after=created_after, created_before=created_before
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/stats/generations")
+async def get_generation_stats(group_by: str = "model", jira_issue_id: Optional[str] = None,
+                               provider: Optional[str] = None, created_after: Optional[str] = None,
+                               created_before: Optional[str] = None):
+    """Token usage and latency aggregated by model, day or template"""
+    try:
+        return await asyncio.to_thread(
+            generation_stats, group_by, jira_issue_id=jira_issue_id, provider=provider,
+            created_after=created_after, created_before=created_before
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/history/{generation_id}")
+async def get_history_item(generation_id: str):
+    """Get one past generation including its content"""
+    def read():
+        conn = get_db()
+        row = conn.execute("SELECT * FROM generation_history WHERE id = ?", (generation_id,)).fetchone()
+        conn.close()
+        if not row:
+            return None
+        item = dict(row)
+        item.pop("search_rowid", None)
+        item["generated_content"] = decompress_content(item["generated_content"])
+        return item
+    
+    item = await asyncio.to_thread(read)
+    if not item:
+        raise HTTPException(status_code=404, detail="Generation not found")
+    return item
+
+@app.delete("/api/history/{generation_id}")
+async def delete_history_item(generation_id: str):
+    """Delete a past generation and its rendered exports"""
+    def delete() -> bool:
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO generation_history 
-            (id, jira_issue_id, jira_summary, generated_content, provider_used, generation_time_seconds)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (
-            generation_id,
-            request.jira_details.key,
-            request.jira_details.summary,
-            content,
-            request.provider,
-            round(generation_time, 2)
-        ))
+        cursor.execute("DELETE FROM generation_history WHERE id = ?", (generation_id,))
         conn.commit()
         conn.close()
-        
-        return {
-            "id": generation_id,
-            "jira_issue_id": request.jira_details.key,
-            "jira_summary": request.jira_details.summary,
-            "content": content,
-            "format": "markdown",
-            "provider_used": request.provider,
-            "metadata": {
-                "generated_at": datetime.now().isoformat(),
-                "generation_time_seconds": round(generation_time, 2),
-                "template_used": template_config.get("file_path", "default"),
-                "token_usage": 0
-            },
-            "exports": {
-                "pdf_url": f"/api/export/{generation_id}/pdf",
-                "word_url": f"/api/export/{generation_id}/docx",
-                "markdown_url": f"/api/export/{generation_id}/md"
-            }
-        }
+        if cursor.rowcount == 0:
+            return False
+        remove_artifacts(generation_id)
+        return True
+    
+    try:
+        if not await asyncio.to_thread(delete):
+            raise HTTPException(status_code=404, detail="Generation not found")
+        return {"status": "deleted", "id": generation_id}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Generation error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # ============== EXPORT ENDPOINTS ==============
 
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+def _parse_range(range_header: str, size: int):
+    """Parse a single `bytes=start-end` range; returns (start, end), None to ignore, or raises"""
+    if not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_text, _, end_text = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            start = max(size - int(end_text), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError("unsatisfiable range")
+    return start, min(end, size - 1)
+
+async def _file_chunks(path: str, start: int, length: int):
+    async with aiofiles.open(path, 'rb') as f:
+        await f.seek(start)
+        while length > 0:
+            chunk = await f.read(min(EXPORT_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+def artifact_response(http_request: Request, path: str, media_type: str, filename: str, etag: str):
+    """Serve a rendered artifact with ETag revalidation and single-range support"""
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=0, must-revalidate",
+        "Content-Disposition": f'attachment; filename="{filename}"'
+    }
+    if_none_match = http_request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    range_header = http_request.headers.get("range")
+    if_range = http_request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        size = os.path.getsize(path)
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            return StreamingResponse(
+                _file_chunks(path, start, length),
+                status_code=206,
+                media_type=media_type,
+                headers={
+                    **headers,
+                    "Content-Range": f"bytes {start}-{end}/{size}",
+                    "Content-Length": str(length)
+                }
+            )
+    
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+async def export_generation(http_request: Request, generation_id: str, fmt: str):
+    """Look up a generation and serve its cached (or freshly rendered) export"""
+    content = await asyncio.to_thread(load_plan, generation_id)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Generation not found")
+    
+    ext, media_type = EXPORT_FORMATS[fmt]
+    # Joins an in-flight pre-render rather than rendering the same artifact twice
+    path = await export_prerenderer.render(generation_id, fmt, content)
+    if not path:
+        raise HTTPException(status_code=500, detail=f"{fmt.upper()} generation failed")
+    
+    etag = f'"{generation_id}-{fmt}-{content_hash(content)}"'
+    return artifact_response(http_request, path, media_type, f"test_plan.{ext}", etag)
+
 @app.get("/api/export/{generation_id}/pdf")
-def export_pdf(generation_id: str):
+async def export_pdf(generation_id: str, http_request: Request):
     """Export test plan as PDF"""
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT generated_content FROM generation_history WHERE id = ?", (generation_id,))
-        row = cursor.fetchone()
-        conn.close()
-        
-        if not row:
-            raise HTTPException(status_code=404, detail="Generation not found")
-        
-        pdf_bytes = ExportService.markdown_to_pdf(row[0])
-        if not pdf_bytes:
-            raise HTTPException(status_code=500, detail="PDF generation failed")
-        
-        return FileResponse(
-            iter([pdf_bytes]),
-            media_type="application/pdf",
-            filename="test_plan.pdf"
-        )
+        return await export_generation(http_request, generation_id, "pdf")
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/export/{generation_id}/docx")
-def export_docx(generation_id: str):
+async def export_docx(generation_id: str, http_request: Request):
     """Export test plan as Word (.docx)"""
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT generated_content FROM generation_history WHERE id = ?", (generation_id,))
-        row = cursor.fetchone()
-        conn.close()
-        
-        if not row:
-            raise HTTPException(status_code=404, detail="Generation not found")
-        
-        docx_bytes = ExportService.markdown_to_docx(row[0])
-        if not docx_bytes:
-            raise HTTPException(status_code=500, detail="DOCX generation failed")
-        
-        from io import BytesIO
-        return FileResponse(
-            BytesIO(docx_bytes),
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            filename="test_plan.docx"
-        )
+        return await export_generation(http_request, generation_id, "docx")
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/export/{generation_id}/md")
-def export_markdown(generation_id: str):
+async def export_markdown(generation_id: str, http_request: Request):
     """Export test plan as Markdown"""
     try:
+        return await export_generation(http_request, generation_id, "md")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+BUNDLE_MAX_GENERATIONS = int(os.getenv("BUNDLE_MAX_GENERATIONS", "500"))
+BUNDLE_RENDER_AHEAD = int(os.getenv("BUNDLE_RENDER_AHEAD", "4"))
+
+class _ZipStream(io.RawIOBase):
+    """Write-only sink that lets a streaming response drain zipfile output as it is produced"""
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+async def _bundle_generation_ids(request: ExportBundleRequest) -> list:
+    """Resolve a bundle request to (generation_id, jira_issue_id) pairs"""
+    issue_ids = list(request.jira_issue_ids)
+    if request.jql:
+        jira_config = await config_cache.aget("jira")
+        if not jira_config:
+            raise HTTPException(status_code=400, detail="Jira not configured")
+        service = JiraService(jira_config.domain, jira_config.email, jira_config.api_token)
+        issue_ids += [issue["key"] async for issue in service.search_issues(jql=request.jql, fields=["updated"])]
+        if not issue_ids:
+            return []
+    
+    clauses, params = [], []
+    if request.generation_ids:
+        clauses.append(f"id IN ({','.join('?' * len(request.generation_ids))})")
+        params += request.generation_ids
+    if issue_ids:
+        clauses.append(f"jira_issue_id IN ({','.join('?' * len(issue_ids))})")
+        params += issue_ids
+    if request.created_after:
+        clauses.append("created_at >= ?")
+        params.append(request.created_after.replace("T", " "))
+    if request.created_before:
+        clauses.append("created_at < ?")
+        params.append(request.created_before.replace("T", " "))
+    if not clauses:
+        raise HTTPException(status_code=400, detail="Give generation ids, issue ids, a JQL query or a date range")
+    
+    def read():
         conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT generated_content FROM generation_history WHERE id = ?", (generation_id,))
-        row = cursor.fetchone()
+        rows = conn.execute(f"""
+            SELECT id, jira_issue_id FROM generation_history
+            WHERE {' AND '.join(clauses)}
+            ORDER BY created_at DESC
+        """, params).fetchall()
         conn.close()
-        
-        if not row:
-            raise HTTPException(status_code=404, detail="Generation not found")
-        
-        from io import BytesIO
-        return FileResponse(
-            BytesIO(row[0].encode()),
-            media_type="text/markdown",
-            filename="test_plan.md"
-        )
+        return rows
+    
+    rows = await asyncio.to_thread(read)
+    
+    if request.latest_only:
+        latest = {}
+        for row in rows:
+            latest.setdefault(row[1], row)
+        rows = list(latest.values())
+    return [(row[0], row[1]) for row in rows[:BUNDLE_MAX_GENERATIONS]]
+
+@app.post("/api/export/bundle")
+async def export_bundle(request: ExportBundleRequest):
+    """Stream a zip of many plans in the requested formats, built on the fly.
+
+    Artifacts are rendered ahead in the export process pool and copied into
+    the archive in chunks as they become ready, so neither the archive nor the
+    full set of rendered files is held in memory.
+    """
+    formats = [fmt for fmt in dict.fromkeys(request.formats) if fmt in EXPORT_FORMATS]
+    if not formats:
+        raise HTTPException(status_code=400, detail=f"Formats must be among {sorted(EXPORT_FORMATS)}")
+    try:
+        generations = await _bundle_generation_ids(request)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if not generations:
+        raise HTTPException(status_code=404, detail="No generations match the request")
+    
+    render_limit = asyncio.Semaphore(BUNDLE_RENDER_AHEAD)
+    
+    async def render_one(generation_id: str, jira_issue_id: str, fmt: str):
+        async with render_limit:
+            content = await asyncio.to_thread(load_plan, generation_id)
+            path = await export_prerenderer.render(generation_id, fmt, content) if content is not None else None
+            name = f"{jira_issue_id}/{jira_issue_id}-{generation_id[:8]}.{EXPORT_FORMATS[fmt][0]}"
+            return name, path
+    
+    async def zip_stream():
+        sink = _ZipStream()
+        tasks = [
+            asyncio.create_task(render_one(generation_id, jira_issue_id, fmt))
+            for generation_id, jira_issue_id in generations
+            for fmt in formats
+        ]
+        failed = []
+        try:
+            with zipfile.ZipFile(sink, mode="w") as archive:
+                for next_done in asyncio.as_completed(tasks):
+                    name, path = await next_done
+                    if not path:
+                        failed.append(name)
+                        continue
+                    # PDF and DOCX are already compressed; only deflate Markdown
+                    compression = zipfile.ZIP_DEFLATED if name.endswith(".md") else zipfile.ZIP_STORED
+                    info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+                    info.compress_type = compression
+                    with archive.open(info, mode="w") as entry:
+                        async for chunk in _file_chunks(path, 0, os.path.getsize(path)):
+                            entry.write(chunk)
+                            yield sink.drain()
+                    yield sink.drain()
+                if failed:
+                    archive.writestr("FAILED.txt", "Could not render:\n" + "\n".join(failed) + "\n")
+            yield sink.drain()
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    filename = f"test_plans_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return StreamingResponse(
+        zip_stream(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 if __name__ == "__main__":
     import uvicorn
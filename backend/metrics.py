@@ -0,0 +1,226 @@
+"""In-process metrics - counters, gauges and histograms in the Prometheus text format"""
+import os
+import time
+import bisect
+import logging
+import threading
+import functools
+import inspect
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+# When off, recording calls return immediately and timed() leaves functions undecorated
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """A named family of samples keyed by label values"""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    @contextmanager
+    def track_in_progress(self, **labels):
+        """Count the block as in progress while it runs"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[LabelKey, list] = {}
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the block"""
+        if not METRICS_ENABLED:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()}
+        lines = []
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Holds this process's metrics; each worker process exposes its own"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self.register(Counter(name, documentation))
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self.register(Gauge(name, documentation))
+
+    def histogram(self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets))
+
+    def render(self) -> str:
+        """Exposition text for a /metrics scrape"""
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.header() + metric.render()
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+def timed(histogram: Histogram, **labels):
+    """Decorator observing the duration of a sync or async function"""
+    def decorate(func):
+        if not METRICS_ENABLED:
+            return func
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with histogram.time(**labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# ----- application metrics -----
+
+HTTP_REQUESTS = registry.counter("tp_http_requests_total", "HTTP requests by route, method and status")
+HTTP_REQUEST_SECONDS = registry.histogram("tp_http_request_seconds", "HTTP request latency until response headers")
+HTTP_IN_FLIGHT = registry.gauge("tp_http_requests_in_flight", "HTTP requests currently being handled")
+
+GENERATION_STAGE_SECONDS = registry.histogram(
+    "tp_generation_stage_seconds", "Time spent in each test plan generation stage"
+)
+GENERATIONS = registry.counter("tp_generations_total", "Test plan generations by endpoint and outcome")
+LLM_IN_FLIGHT = registry.gauge("tp_llm_requests_in_flight", "LLM provider calls in progress")
+LLM_ATTEMPTS = registry.counter(
+    "tp_llm_attempts_total", "Routed LLM provider attempts by provider name and outcome"
+)
+LLM_HEDGES = registry.counter("tp_llm_hedges_total", "Hedged LLM requests fired, by provider name")
+LLM_PROMPT_EVAL_SECONDS = registry.histogram(
+    "tp_llm_prompt_eval_seconds", "Provider-reported prompt evaluation time by provider name"
+)
+
+EXPORT_RENDER_SECONDS = registry.histogram("tp_export_render_seconds", "Export render time in the render worker by format")
+EXPORT_PRERENDER_SECONDS = registry.histogram(
+    "tp_export_prerender_seconds", "Export pool render time, from submission to completion, by format"
+)
+JIRA_REQUEST_SECONDS = registry.histogram("tp_jira_request_seconds", "Jira API call latency by operation")
+RATE_LIMIT_WAIT_SECONDS = registry.histogram(
+    "tp_rate_limit_wait_seconds", "Time spent queued for upstream rate limit capacity, by limiter"
+)
+UPSTREAM_RETRIES = registry.counter("tp_upstream_retries_total", "Retried upstream HTTP calls by host and reason")
+
+CACHE_REQUESTS = registry.counter("tp_cache_requests_total", "Cache lookups by cache and result")
+ERRORS = registry.counter("tp_errors_total", "Errors by component")
+LOG_ERRORS = registry.counter("tp_log_errors_total", "ERROR log records by logger")
+
+class ErrorLogCounter(logging.Handler):
+    """Counts ERROR records so existing logger.error calls show up as a metric"""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+
+    def emit(self, record: logging.LogRecord):
+        LOG_ERRORS.inc(logger=record.name)
+
+def install_log_counter():
+    """Attach the error-counting handler to the root logger (once)"""
+    root = logging.getLogger()
+    if METRICS_ENABLED and not any(isinstance(handler, ErrorLogCounter) for handler in root.handlers):
+        root.addHandler(ErrorLogCounter())
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 # Jira Config Models
@@ -25,6 +25,11 @@ class LLMConfigUpdate(BaseModel):
     ollama_url: str = "http://localhost:11434"
     ollama_model: Optional[str] = None
 
+class LLMProviderUpdate(LLMConfigUpdate):
+    name: str  # unique label used by the router, e.g. "groq-fast" or "ollama-gpu"
+    weight: float = 1.0  # relative share of traffic among healthy providers
+    enabled: bool = True
+
 class LLMConfigResponse(BaseModel):
     id: int
     provider: str
@@ -41,6 +46,38 @@ class TemplateConfigResponse(BaseModel):
     file_format: str
     validation_status: str
 
+# Cached config records (full rows, including secrets - never returned by the API)
+class JiraConfigRecord(BaseModel):
+    id: int
+    domain: str
+    email: str
+    api_token: str
+    connection_status: str = "untested"
+    last_tested_at: Optional[str] = None
+
+class LLMConfigRecord(BaseModel):
+    id: int
+    provider: str
+    grok_api_key: Optional[str] = None
+    grok_model: str = "grok-2"
+    grok_temperature: float = 0.7
+    grok_max_tokens: int = 2000
+    ollama_url: str = "http://localhost:11434"
+    ollama_model: Optional[str] = None
+    connection_status: str = "untested"
+    last_tested_at: Optional[str] = None
+
+class LLMProviderRecord(LLMConfigRecord):
+    name: str
+    weight: float = 1.0
+    enabled: bool = True
+
+class TemplateConfigRecord(BaseModel):
+    id: int
+    file_path: str
+    file_format: Optional[str] = None
+    validation_status: str = "untested"
+
 # Jira Issue Models
 class JiraIssue(BaseModel):
     key: str
@@ -50,6 +87,12 @@ class JiraIssue(BaseModel):
     priority: Optional[str] = None
     issueType: Optional[str] = None
 
+class JiraSearchRequest(BaseModel):
+    jql: Optional[str] = None
+    keys: List[str] = []
+    fields: Optional[List[str]] = None  # defaults to the fields a test plan needs
+    page_size: int = 100
+
 # Generation Request/Response Models
 class GenerateTestPlanRequest(BaseModel):
     jira_issue_id: str
@@ -58,6 +101,22 @@ class GenerateTestPlanRequest(BaseModel):
     provider: str
     temperature: float = 0.7
     max_tokens: int = 2000
+    bypass_cache: bool = False  # skip the LLM response cache and force a fresh generation
+    hedge_seconds: Optional[float] = None  # overrides LLM_HEDGE_SECONDS; 0 disables hedging
+    allow_reuse: bool = False  # opt in to serving a near-duplicate past plan instead of generating
+    sectioned: bool = False  # generate template sections concurrently and stitch them
+
+class BatchGenerateRequest(BaseModel):
+    issue_keys: List[str] = []  # fetched from Jira before generation
+    issues: List[JiraIssue] = []  # already-fetched issue payloads
+    max_concurrency: Optional[int] = None  # further caps the per-provider limit for this batch
+    bypass_cache: bool = False
+    hedge_seconds: Optional[float] = None
+    allow_reuse: bool = False
+    sectioned: bool = False
+
+class GenerationJobRequest(GenerateTestPlanRequest):
+    priority: int = 0  # higher runs first
 
 class GenerateTestPlanResponse(BaseModel):
     id: str
@@ -69,6 +128,16 @@ class GenerateTestPlanResponse(BaseModel):
     metadata: dict
     exports: dict
 
+# Export Models
+class ExportBundleRequest(BaseModel):
+    generation_ids: List[str] = []
+    jira_issue_ids: List[str] = []
+    jql: Optional[str] = None  # resolved to issue keys through Jira
+    created_after: Optional[str] = None  # compared against generation_history.created_at (UTC)
+    created_before: Optional[str] = None
+    latest_only: bool = False  # keep only the newest generation per Jira issue
+    formats: List[str] = ["pdf"]
+
 # Health Check
 class HealthResponse(BaseModel):
     status: str
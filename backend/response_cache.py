@@ -0,0 +1,79 @@
+"""Content-addressed cache of LLM responses, stored next to generation_history"""
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Dict, Optional
+
+from database import get_db
+from metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+
+class ResponseCache:
+    """SQLite-backed response cache with TTL expiry and LRU size bound"""
+
+    def __init__(self, ttl_seconds: float = LLM_CACHE_TTL_SECONDS, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+    @staticmethod
+    def key_for(identity: Dict, prompt: str) -> str:
+        """Hash provider, model, sampling parameters and the final prompt"""
+        payload = json.dumps({**identity, "prompt": prompt}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """Return cached content, or None if missing or expired"""
+        now = time.time()
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT content, created_at FROM llm_response_cache WHERE cache_key = ?",
+            (cache_key,)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            conn.close()
+            CACHE_REQUESTS.inc(cache="llm_response", result="miss")
+            return None
+        if now - row[1] > self.ttl_seconds:
+            cursor.execute("DELETE FROM llm_response_cache WHERE cache_key = ?", (cache_key,))
+            conn.commit()
+            conn.close()
+            CACHE_REQUESTS.inc(cache="llm_response", result="expired")
+            return None
+        cursor.execute("""
+            UPDATE llm_response_cache SET hit_count = hit_count + 1, last_used_at = ?
+            WHERE cache_key = ?
+        """, (now, cache_key))
+        conn.commit()
+        conn.close()
+        CACHE_REQUESTS.inc(cache="llm_response", result="hit")
+        return row[0]
+
+    def put(self, cache_key: str, identity: Dict, content: str):
+        """Store content and evict expired and least-recently-used entries"""
+        now = time.time()
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR REPLACE INTO llm_response_cache
+            (cache_key, provider, model, content, hit_count, created_at, last_used_at)
+            VALUES (?, ?, ?, ?, 0, ?, ?)
+        """, (cache_key, identity.get("provider"), identity.get("model"), content, now, now))
+        cursor.execute("DELETE FROM llm_response_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        cursor.execute("""
+            DELETE FROM llm_response_cache WHERE cache_key IN (
+                SELECT cache_key FROM llm_response_cache
+                ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+        conn.commit()
+        conn.close()
+
+response_cache = ResponseCache()
@@ -1,51 +1,289 @@
 """Export Service - Generate PDF and Word formats"""
+import os
+import re
+import hashlib
 import logging
+from functools import lru_cache
+from xml.sax.saxutils import escape as xml_escape
 from typing import Optional
 from io import BytesIO
 
 logger = logging.getLogger(__name__)
 
+# Rendered artifacts live at {EXPORT_CACHE_DIR}/{generation_id}/{format}-{content hash}.{ext}
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", "./export_cache")
+
+EXPORT_FORMATS = {
+    "pdf": ("pdf", "application/pdf"),
+    "docx": ("docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    "md": ("md", "text/markdown"),
+}
+
+# ----- Markdown parsing -----
+#
+# parse_markdown turns a plan into a compact tree of immutable tuples, shared by
+# every renderer:
+#   ("heading", level, spans)      ("paragraph", spans)      ("quote", spans)
+#   ("list", items)                items: ((depth, ordered, spans), ...)
+#   ("code", language, text)       ("rule",)
+#   ("table", header, rows)        header: (spans, ...), rows: ((spans, ...), ...)
+# where spans is a tuple of (text, style) and style is "" or a mix of "b", "i", "c".
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)(?:\s+#+)?\s*$")
+_LIST_RE = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)$")
+_RULE_RE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+_TABLE_SEPARATOR_RE = re.compile(r"^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$")
+_INLINE_RE = re.compile(r"`([^`]+)`|\*\*(.+?)\*\*|__(.+?)__|\*(.+?)\*|(?<!\w)_(.+?)_(?!\w)")
+
+def _parse_inline(text: str, style: str = "") -> tuple:
+    """Split inline Markdown into (text, style) spans"""
+    spans = []
+    pos = 0
+    for match in _INLINE_RE.finditer(text):
+        if match.start() > pos:
+            spans.append((text[pos:match.start()], style))
+        code, bold, bold_alt, italic, italic_alt = match.groups()
+        if code is not None:
+            spans.append((code, style + "c"))
+        elif bold is not None or bold_alt is not None:
+            spans.extend(_parse_inline(bold if bold is not None else bold_alt, style + "b"))
+        else:
+            spans.extend(_parse_inline(italic if italic is not None else italic_alt, style + "i"))
+        pos = match.end()
+    if pos < len(text):
+        spans.append((text[pos:], style))
+    return tuple(spans)
+
+def _split_row(line: str) -> list:
+    cells = line.strip()
+    if cells.startswith("|"):
+        cells = cells[1:]
+    if cells.endswith("|"):
+        cells = cells[:-1]
+    return [cell.strip() for cell in cells.split("|")]
+
+@lru_cache(maxsize=64)
+def parse_markdown(markdown_content: str) -> tuple:
+    """Parse Markdown into the block tree described above, in a single pass"""
+    blocks = []
+    lines = markdown_content.splitlines()
+    paragraph = []
+    i = 0
+    
+    def flush_paragraph():
+        if paragraph:
+            blocks.append(("paragraph", _parse_inline(" ".join(paragraph))))
+            paragraph.clear()
+    
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+        
+        if stripped.startswith("```") or stripped.startswith("~~~"):
+            flush_paragraph()
+            fence, language = stripped[:3], stripped[3:].strip()
+            code = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith(fence):
+                code.append(lines[i])
+                i += 1
+            blocks.append(("code", language, "\n".join(code)))
+            i += 1
+            continue
+        
+        if not stripped:
+            flush_paragraph()
+            i += 1
+            continue
+        
+        heading = _HEADING_RE.match(stripped)
+        if heading:
+            flush_paragraph()
+            blocks.append(("heading", len(heading.group(1)), _parse_inline(heading.group(2))))
+            i += 1
+            continue
+        
+        if _RULE_RE.match(line):
+            flush_paragraph()
+            blocks.append(("rule",))
+            i += 1
+            continue
+        
+        if "|" in stripped and i + 1 < len(lines) and _TABLE_SEPARATOR_RE.match(lines[i + 1]):
+            flush_paragraph()
+            header = tuple(_parse_inline(cell) for cell in _split_row(stripped))
+            rows = []
+            i += 2
+            while i < len(lines) and "|" in lines[i] and lines[i].strip():
+                cells = _split_row(lines[i])
+                cells = (cells + [""] * len(header))[:len(header)]
+                rows.append(tuple(_parse_inline(cell) for cell in cells))
+                i += 1
+            blocks.append(("table", header, tuple(rows)))
+            continue
+        
+        list_item = _LIST_RE.match(line)
+        if list_item:
+            flush_paragraph()
+            list_ordered = list_item.group(2)[0].isdigit()
+            items = []
+            while i < len(lines):
+                list_item = _LIST_RE.match(lines[i])
+                if list_item:
+                    depth = len(list_item.group(1).expandtabs(4)) // 2
+                    ordered = list_item.group(2)[0].isdigit()
+                    if depth == 0 and ordered != list_ordered:
+                        break  # a top-level item of the other kind starts a new list
+                    items.append((depth, ordered, _parse_inline(list_item.group(3))))
+                elif items and lines[i].startswith((" ", "\t")) and lines[i].strip():
+                    # Continuation line of the previous item
+                    depth, ordered, spans = items[-1]
+                    items[-1] = (depth, ordered, spans + _parse_inline(" " + lines[i].strip()))
+                else:
+                    break
+                i += 1
+            blocks.append(("list", tuple(items)))
+            continue
+        
+        if stripped.startswith(">"):
+            flush_paragraph()
+            blocks.append(("quote", _parse_inline(stripped.lstrip("> ").strip())))
+            i += 1
+            continue
+        
+        paragraph.append(stripped)
+        i += 1
+    
+    flush_paragraph()
+    return tuple(blocks)
+
+def plain_text(spans: tuple) -> str:
+    """Concatenate spans without styling"""
+    return "".join(text for text, _ in spans)
+
+# ----- Renderer toolkits -----
+
+@lru_cache(maxsize=1)
+def _pdf_toolkit():
+    """Import reportlab and build the stylesheet once per process"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import (
+        SimpleDocTemplate, Paragraph, Spacer, Preformatted, Table, TableStyle, HRFlowable
+    )
+    from reportlab.lib.units import inch
+    
+    styles = getSampleStyleSheet()
+    list_styles = {
+        depth: ParagraphStyle(f"ListDepth{depth}", parent=styles["Normal"],
+                              leftIndent=18 * (depth + 1), bulletIndent=18 * depth + 6)
+        for depth in range(6)
+    }
+    cell_style = ParagraphStyle("TableCell", parent=styles["Normal"], fontSize=9, leading=11)
+    header_style = ParagraphStyle("TableHeader", parent=cell_style, fontName="Helvetica-Bold")
+    quote_style = ParagraphStyle("Quote", parent=styles["Normal"], leftIndent=18,
+                                 textColor=colors.HexColor("#555555"))
+    table_style = TableStyle([
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#e8e8e8")),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+    ])
+    return {
+        "letter": letter,
+        "inch": inch,
+        "styles": styles,
+        "list_styles": list_styles,
+        "cell_style": cell_style,
+        "header_style": header_style,
+        "quote_style": quote_style,
+        "table_style": table_style,
+        "SimpleDocTemplate": SimpleDocTemplate,
+        "Paragraph": Paragraph,
+        "Spacer": Spacer,
+        "Preformatted": Preformatted,
+        "Table": Table,
+        "HRFlowable": HRFlowable,
+    }
+
+def _pdf_markup(spans: tuple) -> str:
+    """Render spans as reportlab paragraph markup"""
+    parts = []
+    for text, style in spans:
+        text = xml_escape(text)
+        if "c" in style:
+            text = f'<font face="Courier">{text}</font>'
+        if "i" in style:
+            text = f"<i>{text}</i>"
+        if "b" in style:
+            text = f"<b>{text}</b>"
+        parts.append(text)
+    return "".join(parts)
+
+def _docx_runs(paragraph, spans: tuple):
+    """Append spans to a python-docx paragraph as styled runs"""
+    for text, style in spans:
+        run = paragraph.add_run(text)
+        run.bold = "b" in style or None
+        run.italic = "i" in style or None
+        if "c" in style:
+            run.font.name = "Courier New"
+
+def content_hash(content: str) -> str:
+    """Short stable hash identifying a specific version of a plan"""
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
 class ExportService:
     """Generate PDF and Word document exports"""
     
     @staticmethod
-    def markdown_to_pdf(markdown_content: str, filename: str = "test_plan.pdf") -> Optional[bytes]:
-        """Convert Markdown to PDF"""
+    def markdown_to_pdf(markdown_content: str, filename: str = "test_plan.pdf",
+                        blocks: Optional[tuple] = None) -> Optional[bytes]:
+        """Convert Markdown (or its already parsed `blocks`) to PDF"""
         try:
-            from reportlab.lib.pagesizes import letter
-            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-            from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-            from reportlab.lib.units import inch
-            
-            # Parse markdown headers and paragraphs (simple implementation)
-            lines = markdown_content.split('\n')
+            tk = _pdf_toolkit()
+            styles, inch, Paragraph, Spacer = tk["styles"], tk["inch"], tk["Paragraph"], tk["Spacer"]
+            heading_space = {1: 0.2, 2: 0.15, 3: 0.1}
             elements = []
-            styles = getSampleStyleSheet()
             
-            for line in lines:
-                if line.startswith('# '):
-                    title = line.replace('# ', '')
-                    elements.append(Paragraph(title, styles['Heading1']))
-                    elements.append(Spacer(1, 0.2*inch))
-                elif line.startswith('## '):
-                    heading = line.replace('## ', '')
-                    elements.append(Paragraph(heading, styles['Heading2']))
-                    elements.append(Spacer(1, 0.15*inch))
-                elif line.startswith('### '):
-                    subheading = line.replace('### ', '')
-                    elements.append(Paragraph(subheading, styles['Heading3']))
-                    elements.append(Spacer(1, 0.1*inch))
-                elif line.startswith('- '):
-                    bullet = line.replace('- ', '')
-                    elements.append(Paragraph(f"• {bullet}", styles['Normal']))
-                elif line.strip():
-                    elements.append(Paragraph(line, styles['Normal']))
-                else:
-                    elements.append(Spacer(1, 0.1*inch))
+            for block in blocks if blocks is not None else parse_markdown(markdown_content):
+                kind = block[0]
+                if kind == "heading":
+                    level = min(block[1], 6)
+                    elements.append(Paragraph(_pdf_markup(block[2]), styles[f"Heading{level}"]))
+                    elements.append(Spacer(1, heading_space.get(level, 0.05) * inch))
+                elif kind == "paragraph":
+                    elements.append(Paragraph(_pdf_markup(block[1]), styles["Normal"]))
+                    elements.append(Spacer(1, 0.1 * inch))
+                elif kind == "quote":
+                    elements.append(Paragraph(_pdf_markup(block[1]), tk["quote_style"]))
+                    elements.append(Spacer(1, 0.1 * inch))
+                elif kind == "list":
+                    counters = {}
+                    for depth, ordered, spans in block[1]:
+                        depth = min(depth, 5)
+                        counters = {d: n for d, n in counters.items() if d <= depth}
+                        counters[depth] = counters.get(depth, 0) + 1
+                        bullet = f"{counters[depth]}." if ordered else "•"
+                        elements.append(Paragraph(_pdf_markup(spans), tk["list_styles"][depth], bulletText=bullet))
+                    elements.append(Spacer(1, 0.1 * inch))
+                elif kind == "code":
+                    elements.append(tk["Preformatted"](block[2], styles["Code"]))
+                    elements.append(Spacer(1, 0.1 * inch))
+                elif kind == "table":
+                    header, rows = block[1], block[2]
+                    data = [[Paragraph(_pdf_markup(cell), tk["header_style"]) for cell in header]]
+                    data += [[Paragraph(_pdf_markup(cell), tk["cell_style"]) for cell in row] for row in rows]
+                    table = tk["Table"](data, repeatRows=1, hAlign="LEFT")
+                    table.setStyle(tk["table_style"])
+                    elements.append(table)
+                    elements.append(Spacer(1, 0.15 * inch))
+                elif kind == "rule":
+                    elements.append(tk["HRFlowable"](width="100%"))
             
             # Generate PDF
             pdf_buffer = BytesIO()
-            doc = SimpleDocTemplate(pdf_buffer, pagesize=letter)
+            doc = tk["SimpleDocTemplate"](pdf_buffer, pagesize=tk["letter"])
             doc.build(elements)
             
             return pdf_buffer.getvalue()
@@ -57,37 +295,44 @@ class ExportService:
             return None
     
     @staticmethod
-    def markdown_to_docx(markdown_content: str, filename: str = "test_plan.docx") -> Optional[bytes]:
-        """Convert Markdown to Word .docx"""
+    def markdown_to_docx(markdown_content: str, filename: str = "test_plan.docx",
+                         blocks: Optional[tuple] = None) -> Optional[bytes]:
+        """Convert Markdown (or its already parsed `blocks`) to Word .docx"""
         try:
             from docx import Document
-            from docx.shared import Pt, RGBColor, Inches
             
             doc = Document()
-            lines = markdown_content.split('\n')
             
-            for line in lines:
-                if line.startswith('# '):
-                    title = line.replace('# ', '')
-                    heading = doc.add_heading(title, level=1)
-                elif line.startswith('## '):
-                    heading = line.replace('## ', '')
-                    doc.add_heading(heading, level=2)
-                elif line.startswith('### '):
-                    subheading = line.replace('### ', '')
-                    doc.add_heading(subheading, level=3)
-                elif line.startswith('- '):
-                    bullet = line.replace('- ', '')
-                    doc.add_paragraph(bullet, style='List Bullet')
-                elif line.startswith('* '):
-                    bullet = line.replace('* ', '')
-                    doc.add_paragraph(bullet, style='List Bullet')
-                elif line.strip():
-                    doc.add_paragraph(line)
-                else:
-                    # Empty line
-                    if doc.paragraphs:
-                        doc.add_paragraph()
+            for block in blocks if blocks is not None else parse_markdown(markdown_content):
+                kind = block[0]
+                if kind == "heading":
+                    heading = doc.add_heading(level=min(block[1], 9))
+                    _docx_runs(heading, block[2])
+                elif kind == "paragraph":
+                    _docx_runs(doc.add_paragraph(), block[1])
+                elif kind == "quote":
+                    _docx_runs(doc.add_paragraph(style='Quote'), block[1])
+                elif kind == "list":
+                    for depth, ordered, spans in block[1]:
+                        base = 'List Number' if ordered else 'List Bullet'
+                        style = base if depth == 0 else f"{base} {min(depth + 1, 3)}"
+                        _docx_runs(doc.add_paragraph(style=style), spans)
+                elif kind == "code":
+                    run = doc.add_paragraph().add_run(block[2])
+                    run.font.name = "Courier New"
+                elif kind == "table":
+                    header, rows = block[1], block[2]
+                    table = doc.add_table(rows=1 + len(rows), cols=len(header))
+                    table.style = 'Table Grid'
+                    for row_index, row in enumerate((header,) + rows):
+                        for col_index, spans in enumerate(row):
+                            cell_paragraph = table.cell(row_index, col_index).paragraphs[0]
+                            _docx_runs(cell_paragraph, spans)
+                            if row_index == 0:
+                                for run in cell_paragraph.runs:
+                                    run.bold = True
+                elif kind == "rule":
+                    doc.add_paragraph("_" * 40)
             
             # Save to bytes
             docx_buffer = BytesIO()
@@ -101,3 +346,56 @@ class ExportService:
         except Exception as e:
             logger.error(f"DOCX generation error: {e}")
             return None
+    
+    @staticmethod
+    def render(markdown_content: str, fmt: str, blocks: Optional[tuple] = None) -> Optional[bytes]:
+        """Render Markdown to the given export format"""
+        if fmt == "pdf":
+            return ExportService.markdown_to_pdf(markdown_content, blocks=blocks)
+        if fmt == "docx":
+            return ExportService.markdown_to_docx(markdown_content, blocks=blocks)
+        if fmt == "md":
+            return markdown_content.encode()
+        return None
+    
+    @staticmethod
+    def artifact_path(generation_id: str, fmt: str, digest: str) -> str:
+        """Location of the cached artifact for one version of a plan"""
+        ext = EXPORT_FORMATS[fmt][0]
+        return os.path.join(EXPORT_CACHE_DIR, generation_id, f"{fmt}-{digest}.{ext}")
+    
+    @staticmethod
+    def touch_artifact(path: str):
+        """Mark an artifact as recently served (the size cap evicts least recently served first)"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    
+    @staticmethod
+    def render_artifact(generation_id: str, fmt: str, markdown_content: str,
+                        blocks: Optional[tuple] = None) -> Optional[str]:
+        """Return the path of the rendered artifact, rendering it only on a cache miss.
+
+        Render pool callers pass the parsed `blocks`, since the parse cache of a
+        worker process is not shared with the workers rendering other formats.
+        Runs in pool workers, so metrics are recorded by the caller.
+        """
+        path = ExportService.artifact_path(generation_id, fmt, content_hash(markdown_content))
+        if os.path.exists(path):
+            ExportService.touch_artifact(path)
+            return path
+        
+        data = ExportService.render(markdown_content, fmt, blocks)
+        if not data:
+            return None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Could not cache {fmt} export: {e}")
+            return None
+        return path
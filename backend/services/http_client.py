@@ -0,0 +1,73 @@
+"""Shared async HTTP client pool - keep-alive connections for Jira and LLM calls"""
+import os
+import json
+import logging
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Defaults apply to every host; HTTP_HOST_LIMITS overrides them per host, e.g.
+# {"api.groq.com": {"max_connections": 20, "read_timeout": 60}}
+DEFAULT_LIMITS = {
+    "max_connections": int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+    "max_keepalive_connections": int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")),
+    "keepalive_expiry": float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+    "connect_timeout": float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")),
+    "read_timeout": float(os.getenv("HTTP_READ_TIMEOUT", "120")),
+}
+
+def _load_host_limits() -> Dict[str, Dict]:
+    """Parse per-host overrides from HTTP_HOST_LIMITS"""
+    raw = os.getenv("HTTP_HOST_LIMITS", "")
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError:
+        logger.warning("Ignoring invalid HTTP_HOST_LIMITS (expected JSON object)")
+        return {}
+
+class HTTPClientPool:
+    """One pooled httpx.AsyncClient per origin, sized by per-host limits"""
+
+    def __init__(self, host_limits: Optional[Dict[str, Dict]] = None):
+        self.host_limits = host_limits if host_limits is not None else _load_host_limits()
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def limits_for(self, host: str) -> Dict:
+        """Return the effective limit settings for a host"""
+        return {**DEFAULT_LIMITS, **self.host_limits.get(host, {})}
+
+    def client_for(self, url: str) -> httpx.AsyncClient:
+        """Return the pooled client for the origin of `url`, creating it on first use"""
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        client = self._clients.get(origin)
+        if client is None or client.is_closed:
+            settings = self.limits_for(parts.hostname or "")
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings["max_connections"],
+                    max_keepalive_connections=settings["max_keepalive_connections"],
+                    keepalive_expiry=settings["keepalive_expiry"],
+                ),
+                timeout=httpx.Timeout(settings["read_timeout"], connect=settings["connect_timeout"]),
+            )
+            self._clients[origin] = client
+        return client
+
+    async def close(self):
+        """Close every pooled client"""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+# Process-wide pool; main.py closes it when the FastAPI app shuts down
+http_pool = HTTPClientPool()
+
+def get_client(url: str) -> httpx.AsyncClient:
+    """Return the shared pooled client for `url`"""
+    return http_pool.client_for(url)
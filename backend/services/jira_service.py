@@ -1,11 +1,37 @@
 """Jira API Integration Service"""
-import requests
-from typing import Dict, Optional
+import re
+import httpx
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional
 from datetime import datetime
 import logging
 
+from .http_client import get_client
+from .rate_limit import jira_limiter, send_with_retry
+from metrics import JIRA_REQUEST_SECONDS, timed
+
 logger = logging.getLogger(__name__)
 
+# Fields needed to build a test plan prompt; everything else is left out of the payload
+ISSUE_FIELDS = ["summary", "description", "priority", "issuetype", "updated"]
+SEARCH_PAGE_SIZE = 100
+# Keys per `key in (...)` query, keeping JQL well under Jira's length limits
+SEARCH_KEYS_PER_QUERY = 100
+SEARCH_MAX_CONCURRENCY = 4
+ISSUE_KEY_PATTERN = re.compile(r"^[A-Z][A-Z0-9_]+-\d+$")
+
+def is_issue_key(key: str) -> bool:
+    """Whether `key` looks like a Jira issue key (PROJECT-123)"""
+    return bool(ISSUE_KEY_PATTERN.match(key or ""))
+
+def key_in_clause(keys: List[str]) -> str:
+    """JQL `key in (...)` over validated, quoted issue keys"""
+    invalid = [key for key in keys if not is_issue_key(key)]
+    if invalid:
+        raise ValueError(f"Invalid issue keys: {', '.join(invalid)}")
+    quoted = ", ".join(f'"{key}"' for key in keys)
+    return f"key in ({quoted})"
+
 class JiraService:
     def __init__(self, domain: str, email: str, api_token: str):
         self.domain = domain
@@ -17,6 +43,13 @@ class JiraService:
             "Accept": "application/json",
             "Content-Type": "application/json"
         }
+        self.limiter = jira_limiter(domain)
+    
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a rate-limited Jira API call, retrying 429/5xx (honouring Retry-After)"""
+        client = get_client(self.base_url)
+        request = client.build_request(method, url, headers=self.headers, **kwargs)
+        return await send_with_retry(client, request, self.limiter)
     
     def _encode_credentials(self) -> str:
         """Encode email:token as base64"""
@@ -24,10 +57,11 @@ class JiraService:
         credentials = f"{self.email}:{self.api_token}"
         return base64.b64encode(credentials.encode()).decode()
     
-    def test_connection(self) -> Dict:
+    @timed(JIRA_REQUEST_SECONDS, operation="test_connection")
+    async def test_connection(self) -> Dict:
         """Test Jira connection and return status"""
         try:
-            response = requests.get(
+            response = await get_client(self.base_url).get(
                 f"{self.base_url}/myself",
                 headers=self.headers,
                 timeout=5
@@ -45,7 +79,7 @@ class JiraService:
                     "error": f"HTTP {response.status_code}: {response.text}",
                     "message": "❌ Jira connection failed"
                 }
-        except requests.exceptions.ConnectionError:
+        except httpx.ConnectError:
             return {
                 "status": "failed",
                 "error": "Connection refused",
@@ -58,27 +92,18 @@ class JiraService:
                 "message": f"❌ Error: {str(e)}"
             }
     
-    def fetch_issue(self, issue_key: str) -> Optional[Dict]:
+    @timed(JIRA_REQUEST_SECONDS, operation="fetch_issue")
+    async def fetch_issue(self, issue_key: str) -> Optional[Dict]:
         """Fetch Jira issue details by key"""
         try:
-            response = requests.get(
-                f"{self.base_url}/issues/{issue_key}",
-                headers=self.headers,
-                params={"fields": "key,summary,description,priority,issuetype"}
+            response = await self._request(
+                "GET",
+                f"{self.base_url}/issue/{issue_key}",
+                params={"fields": ",".join(ISSUE_FIELDS)}
             )
             
             if response.status_code == 200:
-                issue_data = response.json()
-                fields = issue_data.get("fields", {})
-                
-                return {
-                    "key": issue_data["key"],
-                    "summary": fields.get("summary", ""),
-                    "description": fields.get("description", ""),
-                    "priority": fields.get("priority", {}).get("name", "Medium"),
-                    "issueType": fields.get("issuetype", {}).get("name", "Task"),
-                    "acceptanceCriteria": self._extract_acceptance_criteria(fields),
-                }
+                return self._normalize_issue(response.json())
             else:
                 logger.error(f"Failed to fetch issue {issue_key}: {response.status_code}")
                 return None
@@ -86,6 +111,128 @@ class JiraService:
             logger.error(f"Error fetching Jira issue: {e}")
             return None
     
+    @timed(JIRA_REQUEST_SECONDS, operation="fetch_updated")
+    async def fetch_updated(self, issue_key: str) -> Optional[str]:
+        """Cheap revalidation probe: return only the issue's `updated` timestamp"""
+        try:
+            response = await self._request(
+                "GET",
+                f"{self.base_url}/issue/{issue_key}",
+                params={"fields": "updated"}
+            )
+            if response.status_code == 200:
+                return response.json().get("fields", {}).get("updated")
+            logger.error(f"Failed to probe issue {issue_key}: {response.status_code}")
+            return None
+        except Exception as e:
+            logger.error(f"Error probing Jira issue: {e}")
+            return None
+    
+    async def search_issues(self, jql: Optional[str] = None, keys: Optional[List[str]] = None,
+                            fields: Optional[List[str]] = None, page_size: int = SEARCH_PAGE_SIZE,
+                            max_concurrency: int = SEARCH_MAX_CONCURRENCY) -> AsyncIterator[Dict]:
+        """Stream normalized issues matching a JQL query and/or a list of issue keys.
+
+        Uses Jira's enhanced search API (/search/jql) with field projection.
+        Its pages are chained by nextPageToken, so each query is paged in
+        order; key lists are split into several queries that run
+        concurrently, and issues are yielded as each page arrives. Keys that
+        are malformed are skipped and keys that do not exist are simply not
+        returned, so callers compare the result with what they asked for.
+        """
+        queries = [(jql, None)] if jql else []
+        keys = list(dict.fromkeys(keys or []))
+        invalid = [key for key in keys if not is_issue_key(key)]
+        if invalid:
+            logger.warning(f"Skipping invalid Jira issue keys: {', '.join(invalid)}")
+            keys = [key for key in keys if is_issue_key(key)]
+        for i in range(0, len(keys), SEARCH_KEYS_PER_QUERY):
+            chunk = keys[i:i + SEARCH_KEYS_PER_QUERY]
+            queries.append((key_in_clause(chunk), chunk))
+        
+        fields = fields or ISSUE_FIELDS
+        limit = asyncio.Semaphore(max_concurrency)
+        pages: asyncio.Queue = asyncio.Queue()
+        
+        async def run(query: str, chunk: Optional[List[str]]):
+            try:
+                async for page in self._search_pages(query, chunk, fields, page_size, limit):
+                    await pages.put(page)
+                await pages.put(None)
+            except Exception as e:
+                await pages.put(e)
+        
+        tasks = [asyncio.create_task(run(query, chunk)) for query, chunk in queries]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                page = await pages.get()
+                if page is None:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    for issue in page:
+                        yield issue
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _search_pages(self, jql: str, keys: Optional[List[str]], fields: List[str],
+                            page_size: int, limit: asyncio.Semaphore) -> AsyncIterator[List[Dict]]:
+        """Yield the normalized issues of one query a page at a time"""
+        next_page_token = None
+        while True:
+            body = {"jql": jql, "maxResults": page_size, "fields": fields}
+            if next_page_token:
+                body["nextPageToken"] = next_page_token
+            async with limit:
+                with JIRA_REQUEST_SECONDS.time(operation="search_page"):
+                    response = await self._request("POST", f"{self.base_url}/search/jql", json=body)
+            if response.status_code == 400 and keys:
+                # A key that no longer exists makes Jira reject the whole `key in (...)`
+                # query, so look this chunk's keys up one at a time instead
+                logger.warning(f"Jira search rejected {jql!r}; fetching {len(keys)} issues individually")
+                yield [issue for issue in await asyncio.gather(*(self._fetch_limited(key, limit) for key in keys))
+                       if issue]
+                return
+            if response.status_code != 200:
+                logger.error(f"Jira search failed ({jql!r}): {response.status_code}")
+                raise RuntimeError(f"Jira search HTTP {response.status_code}: {response.text}")
+            data = response.json()
+            yield [self._normalize_issue(issue) for issue in data.get("issues", [])]
+            next_page_token = data.get("nextPageToken")
+            if not next_page_token or data.get("isLast"):
+                return
+    
+    async def _fetch_limited(self, issue_key: str, limit: asyncio.Semaphore) -> Optional[Dict]:
+        async with limit:
+            return await self.fetch_issue(issue_key)
+    
+    def _normalize_issue(self, issue_data: Dict) -> Dict:
+        """Flatten a Jira issue payload into the JiraIssue shape"""
+        fields = issue_data.get("fields", {})
+        description = fields.get("description") or ""
+        if isinstance(description, dict):
+            description = self._adf_to_text(description)
+        return {
+            "key": issue_data["key"],
+            "summary": fields.get("summary", ""),
+            "description": description,
+            "priority": (fields.get("priority") or {}).get("name", "Medium"),
+            "issueType": (fields.get("issuetype") or {}).get("name", "Task"),
+            "acceptanceCriteria": self._extract_acceptance_criteria(fields),
+            "updated": fields.get("updated"),
+        }
+    
+    def _adf_to_text(self, node: Dict) -> str:
+        """Flatten Atlassian Document Format rich text to plain text"""
+        if node.get("type") == "text":
+            return node.get("text", "")
+        parts = [self._adf_to_text(child) for child in node.get("content", [])]
+        separator = "\n" if node.get("type") == "doc" else ""
+        return separator.join(parts)
+    
     def _extract_acceptance_criteria(self, fields: Dict) -> str:
         """Extract acceptance criteria from description or custom field"""
         description = fields.get("description", "")
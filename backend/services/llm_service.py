@@ -1,27 +1,167 @@
 """LLM Service - Abstracts Grok and Ollama providers"""
-import requests
+import os
+import time
+import httpx
 import logging
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, Optional
 import json
 
+from .http_client import get_client
+from .rate_limit import groq_limiter, send_with_retry
+
 logger = logging.getLogger(__name__)
 
+GROQ_CHAT_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+# How long Ollama keeps the model loaded after a request: a duration ("30m"),
+# seconds, or -1 to never unload. Avoids reloading the model after idle periods.
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Context window requested from Ollama (0 = the model's default)
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "0"))
+
 class LLMService:
     """Unified interface for Grok and Ollama"""
     
     def __init__(self, provider: str, **config):
         self.provider = provider
         self.config = config
+        # Token counts and latency of the most recent stream
+        self.last_usage: Dict = {}
+    
+    def cache_identity(self) -> Dict:
+        """Parameters that, together with the prompt, determine the generated output"""
+        model = self.config.get("grok_model", "grok-2") if self.provider == "grok" \
+            else self.config.get("ollama_model", "mistral")
+        return {
+            "provider": self.provider,
+            "model": model,
+            "temperature": self.config.get("grok_temperature", 0.7),
+            "max_tokens": self.config.get("grok_max_tokens", 2000),
+        }
+    
+    def _record_usage(self, prompt_tokens: Optional[int], completion_tokens: Optional[int],
+                      time_to_first_token: Optional[float], decode_seconds: Optional[float],
+                      prompt_eval_seconds: Optional[float] = None, cached_prompt_tokens: Optional[int] = None):
+        """Remember token counts and latency of the call that just finished"""
+        tokens_per_second = None
+        if completion_tokens and decode_seconds:
+            tokens_per_second = round(completion_tokens / decode_seconds, 2)
+        self.last_usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": (prompt_tokens or 0) + (completion_tokens or 0),
+            "time_to_first_token_seconds": round(time_to_first_token, 3) if time_to_first_token is not None else None,
+            "tokens_per_second": tokens_per_second,
+            # Time the provider spent on the prompt; drops when a reused prefix is served from cache
+            "prompt_eval_seconds": round(prompt_eval_seconds, 3) if prompt_eval_seconds is not None else None,
+            "cached_prompt_tokens": cached_prompt_tokens
+        }
+    
+    def _record_groq_usage(self, usage: Dict, time_to_first_token: Optional[float] = None,
+                           decode_seconds: Optional[float] = None):
+        """Record an OpenAI-style usage block; Groq adds server-side queue/prompt/completion times"""
+        if time_to_first_token is None and "prompt_time" in usage:
+            time_to_first_token = usage.get("queue_time", 0) + usage["prompt_time"]
+        self._record_usage(
+            usage.get("prompt_tokens"),
+            usage.get("completion_tokens"),
+            time_to_first_token,
+            usage.get("completion_time") or decode_seconds,
+            usage.get("prompt_time"),
+            (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        )
+    
+    def _record_ollama_usage(self, final: Dict, time_to_first_token: Optional[float] = None):
+        """Record the counters from Ollama's final response (durations are nanoseconds)"""
+        if time_to_first_token is None and "prompt_eval_duration" in final:
+            time_to_first_token = (final.get("load_duration", 0) + final["prompt_eval_duration"]) / 1e9
+        eval_duration = final.get("eval_duration")
+        prompt_eval_duration = final.get("prompt_eval_duration")
+        self._record_usage(
+            final.get("prompt_eval_count"),
+            final.get("eval_count"),
+            time_to_first_token,
+            eval_duration / 1e9 if eval_duration else None,
+            prompt_eval_duration / 1e9 if prompt_eval_duration is not None else None
+        )
+    
+    def _ollama_body(self, prompt: str, stream: bool) -> Dict:
+        """Ollama /api/generate payload with the keep-alive policy and sampling options"""
+        options = {
+            "temperature": self.config.get("grok_temperature", 0.7),
+            "num_predict": self.config.get("grok_max_tokens", 2000)
+        }
+        if OLLAMA_NUM_CTX:
+            options["num_ctx"] = OLLAMA_NUM_CTX
+        keep_alive = OLLAMA_KEEP_ALIVE
+        if keep_alive.lstrip("-").isdigit():
+            keep_alive = int(keep_alive)
+        return {
+            "model": self.config.get("ollama_model", "mistral"),
+            "prompt": prompt,
+            "options": options,
+            "keep_alive": keep_alive,
+            "stream": stream
+        }
+    
+    async def warm_up(self, prompt_prefix: str = "") -> Dict:
+        """Load the Ollama model and evaluate the stable prompt prefix so later prompts reuse it"""
+        if self.provider != "ollama":
+            return {"status": "skipped", "provider": self.provider}
+        try:
+            url = self.config.get("ollama_url", "http://localhost:11434")
+            body = self._ollama_body(prompt_prefix, stream=False)
+            body["options"]["num_predict"] = 1
+            response = await get_client(url).post(f"{url}/api/generate", json=body)
+            if response.status_code != 200:
+                return {"status": "failed", "error": f"HTTP {response.status_code}"}
+            data = response.json()
+            return {
+                "status": "warm",
+                "model": body["model"],
+                "load_seconds": round(data.get("load_duration", 0) / 1e9, 3),
+                "prompt_eval_seconds": round(data.get("prompt_eval_duration", 0) / 1e9, 3),
+                "prompt_eval_count": data.get("prompt_eval_count")
+            }
+        except Exception as e:
+            logger.error(f"Ollama warm-up error: {e}")
+            return {"status": "failed", "error": str(e)}
+    
+    def _groq_call(self, prompt: str, stream: bool):
+        """Build a Groq chat request with its rate limiter and up-front token estimate"""
+        api_key = self.config.get("grok_api_key")
+        model = self.config.get("grok_model", "grok-2")
+        max_tokens = self.config.get("grok_max_tokens", 2000)
+        body = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.config.get("grok_temperature", 0.7),
+            "max_tokens": max_tokens
+        }
+        if stream:
+            body["stream"] = True
+            body["stream_options"] = {"include_usage": True}
+        client = get_client(GROQ_CHAT_URL)
+        request = client.build_request(
+            "POST",
+            GROQ_CHAT_URL,
+            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+            json=body
+        )
+        # ~4 characters per token for the prompt, plus the most the completion may use;
+        # settled against the reported usage when the call finishes
+        estimated = len(prompt) // 4 + max_tokens
+        return client, request, groq_limiter(api_key, model), estimated
     
-    def test_connection(self) -> Dict:
+    async def test_connection(self) -> Dict:
         """Test LLM provider connection"""
         if self.provider == "grok":
-            return self._test_grok()
+            return await self._test_grok()
         elif self.provider == "ollama":
-            return self._test_ollama()
+            return await self._test_ollama()
         return {"status": "failed", "error": "Unknown provider"}
     
-    def _test_grok(self) -> Dict:
+    async def _test_grok(self) -> Dict:
         """Test Grok connection"""
         try:
             api_key = self.config.get("grok_api_key")
@@ -33,8 +173,8 @@ class LLMService:
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(
-                "https://api.groq.com/openai/v1/chat/completions",
+            response = await get_client(GROQ_CHAT_URL).post(
+                GROQ_CHAT_URL,
                 headers=headers,
                 json={
                     "model": self.config.get("grok_model", "grok-2"),
@@ -57,17 +197,17 @@ class LLMService:
                     "error": f"HTTP {response.status_code}",
                     "message": "❌ Grok connection failed. Check API key."
                 }
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             return {"status": "failed", "error": "Request timeout", "message": "❌ Grok timeout"}
         except Exception as e:
             return {"status": "failed", "error": str(e), "message": f"❌ Error: {str(e)}"}
     
-    def _test_ollama(self) -> Dict:
+    async def _test_ollama(self) -> Dict:
         """Test Ollama connection"""
         try:
             url = self.config.get("ollama_url", "http://localhost:11434")
             
-            response = requests.get(
+            response = await get_client(url).get(
                 f"{url}/api/tags",
                 timeout=5
             )
@@ -83,7 +223,7 @@ class LLMService:
                 }
             else:
                 return {"status": "failed", "error": "Ollama not responding"}
-        except requests.exceptions.ConnectionError:
+        except httpx.ConnectError:
             return {
                 "status": "failed",
                 "error": "Connection refused",
@@ -92,66 +232,85 @@ class LLMService:
         except Exception as e:
             return {"status": "failed", "error": str(e), "message": f"❌ Error: {str(e)}"}
     
-    def generate_test_plan(self, prompt: str) -> Optional[str]:
-        """Generate test plan using configured LLM provider"""
+    def stream_test_plan(self, prompt: str) -> AsyncIterator[str]:
+        """Stream test plan tokens from the configured LLM provider as they arrive.
+
+        Provider errors are raised so the caller can report a failed stream
+        instead of silently truncating it. Token usage is in last_usage once
+        the stream is exhausted.
+        """
+        self.last_usage = {}
         if self.provider == "grok":
-            return self._generate_grok(prompt)
+            return self._stream_grok(prompt)
         elif self.provider == "ollama":
-            return self._generate_ollama(prompt)
-        return None
+            return self._stream_ollama(prompt)
+        raise ValueError(f"Unknown provider: {self.provider}")
     
-    def _generate_grok(self, prompt: str) -> Optional[str]:
-        """Generate using Grok"""
+    async def _stream_grok(self, prompt: str) -> AsyncIterator[str]:
+        """Stream using Grok (OpenAI-compatible server-sent events)"""
+        client, request, limiter, estimated = self._groq_call(prompt, stream=True)
+        # Timed from before the request goes out, so time to first token covers
+        # connecting, queueing and prompt evaluation as well as the first decode step
+        started = time.perf_counter()
+        response = await send_with_retry(client, request, limiter, estimated, stream=True)
         try:
-            api_key = self.config.get("grok_api_key")
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.post(
-                "https://api.groq.com/openai/v1/chat/completions",
-                headers=headers,
-                json={
-                    "model": self.config.get("grok_model", "grok-2"),
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": self.config.get("grok_temperature", 0.7),
-                    "max_tokens": self.config.get("grok_max_tokens", 2000)
-                },
-                timeout=30
-            )
+            if response.status_code != 200:
+                body = (await response.aread()).decode(errors="replace")
+                logger.error(f"Grok stream error: {response.status_code} {body}")
+                raise RuntimeError(f"Grok HTTP {response.status_code}")
             
-            if response.status_code == 200:
-                return response.json()["choices"][0]["message"]["content"]
-            else:
-                logger.error(f"Grok error: {response.status_code} {response.text}")
-                return None
-        except Exception as e:
-            logger.error(f"Grok generation error: {e}")
-            return None
+            first_token_at = None
+            usage = {}
+            async for line in response.aiter_lines():
+                if not line or not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):]
+                if data.strip() == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                # The final chunk carries usage (Groq also nests it under x_groq)
+                usage = chunk.get("usage") or chunk.get("x_groq", {}).get("usage") or usage
+                choices = chunk.get("choices") or [{}]
+                token = choices[0].get("delta", {}).get("content")
+                if token:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    yield token
+            if first_token_at is not None:
+                self._record_groq_usage(usage, first_token_at - started, time.perf_counter() - first_token_at)
+                limiter.settle(estimated, self.last_usage.get("total_tokens") or None)
+        finally:
+            await response.aclose()
     
-    def _generate_ollama(self, prompt: str) -> Optional[str]:
-        """Generate using Ollama"""
-        try:
-            url = self.config.get("ollama_url", "http://localhost:11434")
-            model = self.config.get("ollama_model", "mistral")
+    async def _stream_ollama(self, prompt: str) -> AsyncIterator[str]:
+        """Stream using Ollama (newline-delimited JSON)"""
+        url = self.config.get("ollama_url", "http://localhost:11434")
+        
+        # Headers arrive before the model is loaded and the prompt evaluated, so start here
+        started = time.perf_counter()
+        async with get_client(url).stream(
+            "POST",
+            f"{url}/api/generate",
+            json=self._ollama_body(prompt, stream=True)
+        ) as response:
+            if response.status_code != 200:
+                logger.error(f"Ollama stream error: {response.status_code}")
+                raise RuntimeError(f"Ollama HTTP {response.status_code}")
             
-            response = requests.post(
-                f"{url}/api/generate",
-                json={
-                    "model": model,
-                    "prompt": prompt,
-                    "temperature": self.config.get("grok_temperature", 0.7),
-                    "stream": False
-                },
-                timeout=120
-            )
-            
-            if response.status_code == 200:
-                return response.json().get("response", "")
-            else:
-                logger.error(f"Ollama error: {response.status_code}")
-                return None
-        except Exception as e:
-            logger.error(f"Ollama generation error: {e}")
-            return None
+            first_token_at = None
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(f"Ollama error: {chunk['error']}")
+                token = chunk.get("response")
+                if token:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    yield token
+                if chunk.get("done"):
+                    self._record_ollama_usage(
+                        chunk, first_token_at - started if first_token_at is not None else None
+                    )
+                    break
@@ -0,0 +1,215 @@
+"""Client-side rate limiting and retry for upstream APIs (Groq, Jira)"""
+import os
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import httpx
+
+from metrics import RATE_LIMIT_WAIT_SECONDS, UPSTREAM_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Quotas per minute (0 = unlimited). Groq's token limit is per model and is
+# corrected from the x-ratelimit-* response headers once the first call returns.
+GROQ_RPM = float(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = float(os.getenv("GROQ_TPM", "6000"))
+JIRA_RPM = float(os.getenv("JIRA_RPM", "600"))
+
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "4"))
+HTTP_RETRY_BASE_SECONDS = float(os.getenv("HTTP_RETRY_BASE_SECONDS", "0.5"))
+# Longest single wait; a Retry-After beyond this is returned to the caller instead
+HTTP_RETRY_MAX_SECONDS = float(os.getenv("HTTP_RETRY_MAX_SECONDS", "30"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """Refills continuously at `per_minute / 60` per second up to one minute's worth"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available (requests larger than the bucket wait for a full one)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+    def give(self, amount: float):
+        """Return (or, when negative, additionally charge) capacity; the level may go into debt"""
+        self.level = min(self.capacity, self.level + amount)
+
+    def limit_to(self, level: float):
+        """Lower the level to what the server reports as remaining"""
+        self._refill(time.monotonic())
+        self.level = min(self.level, level)
+
+    def resize(self, per_minute: float):
+        self.level = self.level * per_minute / self.capacity
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budget for one upstream quota.
+
+    Callers queue in arrival order and wait for capacity rather than failing,
+    so a batch drains at the quota ceiling instead of bouncing off 429s.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 0):
+        """Wait until one request and `tokens` tokens fit in the budget, then spend them"""
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                wait = self.paused_until - now
+                if self.requests:
+                    wait = max(wait, self.requests.wait_time(1, now))
+                if self.tokens and tokens:
+                    wait = max(wait, self.tokens.wait_time(tokens, now))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens and tokens:
+                self.tokens.take(tokens)
+        RATE_LIMIT_WAIT_SECONDS.observe(time.monotonic() - start, limiter=self.name)
+
+    def settle(self, estimated: float, actual: Optional[float]):
+        """Correct an up-front token estimate once the real usage is known"""
+        if self.tokens and actual is not None:
+            self.tokens.give(estimated - actual)
+
+    def pause(self, seconds: float):
+        """Hold every queued caller back, e.g. for a 429's Retry-After"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def observe(self, headers: httpx.Headers):
+        """Adopt the server's view of the token budget (OpenAI-style x-ratelimit-* headers)"""
+        if not self.tokens:
+            return
+        try:
+            limit = headers.get("x-ratelimit-limit-tokens")
+            if limit and float(limit) != self.tokens.capacity:
+                self.tokens.resize(float(limit))
+            remaining = headers.get("x-ratelimit-remaining-tokens")
+            if remaining is not None:
+                self.tokens.limit_to(float(remaining))
+        except ValueError:
+            pass
+
+    def snapshot(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "name": self.name,
+            "requests_available": round(self.requests.level, 1) if self.requests else None,
+            "tokens_available": round(self.tokens.level) if self.tokens else None,
+            "paused_seconds": round(max(0.0, self.paused_until - now), 1)
+        }
+
+_limiters: Dict[str, RateLimiter] = {}
+
+def rate_limiter(name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0) -> RateLimiter:
+    """Return the process-wide limiter for a quota, creating it on first use"""
+    if name not in _limiters:
+        _limiters[name] = RateLimiter(name, requests_per_minute, tokens_per_minute)
+    return _limiters[name]
+
+def groq_limiter(api_key: Optional[str], model: str) -> RateLimiter:
+    """Groq quotas are per organisation (API key) and model"""
+    key_id = hashlib.sha256((api_key or "").encode()).hexdigest()[:8]
+    return rate_limiter(f"groq:{key_id}:{model}", GROQ_RPM, GROQ_TPM)
+
+def jira_limiter(domain: str) -> RateLimiter:
+    return rate_limiter(f"jira:{domain}", JIRA_RPM)
+
+def limiter_snapshots() -> list:
+    return [limiter.snapshot() for limiter in _limiters.values()]
+
+def retry_after(headers: httpx.Headers) -> Optional[float]:
+    """Parse Retry-After as seconds or an HTTP date"""
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(HTTP_RETRY_MAX_SECONDS, HTTP_RETRY_BASE_SECONDS * 2 ** attempt))
+
+async def send_with_retry(client: httpx.AsyncClient, request: httpx.Request,
+                          limiter: Optional[RateLimiter] = None, tokens: float = 0,
+                          stream: bool = False, retries: int = HTTP_MAX_RETRIES) -> httpx.Response:
+    """Send `request`, waiting on `limiter` first and retrying 429/5xx and connection errors.
+
+    Retry-After is honoured (plus jitter); a 429 also pauses the limiter so
+    queued callers back off together. The last response is returned whatever
+    its status, so callers keep their existing error handling. With
+    stream=True the caller must close the returned response.
+    """
+    for attempt in range(retries + 1):
+        if limiter:
+            await limiter.acquire(tokens)
+        try:
+            response = await client.send(request, stream=stream)
+        except (httpx.ConnectError, httpx.RemoteProtocolError) as e:
+            if limiter:
+                limiter.settle(tokens, 0)  # nothing was generated; the retry charges again
+            if attempt == retries:
+                raise
+            delay = backoff_delay(attempt)
+            UPSTREAM_RETRIES.inc(host=request.url.host, reason="connect")
+            logger.warning(f"{request.method} {request.url.host} failed ({e}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        if limiter:
+            if response.status_code in RETRY_STATUSES:
+                limiter.settle(tokens, 0)
+            limiter.observe(response.headers)
+        if response.status_code not in RETRY_STATUSES or attempt == retries:
+            return response
+        wait = retry_after(response.headers)
+        if wait is not None and wait > HTTP_RETRY_MAX_SECONDS:
+            if limiter and response.status_code == 429:
+                limiter.pause(wait)
+            return response
+        delay = backoff_delay(attempt) if wait is None else wait + random.uniform(0, HTTP_RETRY_BASE_SECONDS)
+        if stream:
+            await response.aclose()
+        UPSTREAM_RETRIES.inc(host=request.url.host, reason=str(response.status_code))
+        logger.warning(f"{request.method} {request.url.host} returned {response.status_code}; "
+                       f"retry {attempt + 1}/{retries} in {delay:.1f}s")
+        if limiter and response.status_code == 429:
+            limiter.pause(delay)  # the next acquire() waits it out, along with every queued caller
+        else:
+            await asyncio.sleep(delay)
@@ -1,10 +1,108 @@
 """Template Parsing Service"""
 import os
+import re
+import hashlib
 import logging
-from typing import Dict, Optional
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from metrics import CACHE_REQUESTS
 
 logger = logging.getLogger(__name__)
 
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", "16"))
+# Optional directory for extracted template text, so PDF parsing survives restarts
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", "")
+
+PDF_PLACEHOLDER = "[PDF Template - Content extraction requires PyPDF2]"
+
+# Upper bound on the outline sent in prompts (cut at whole lines)
+TEMPLATE_OUTLINE_MAX_CHARS = int(os.getenv("TEMPLATE_OUTLINE_MAX_CHARS", "1500"))
+
+_MD_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*$")
+_NUMBERED_HEADING = re.compile(r"^(\d+(?:\.\d+)*)\.?\s+([A-Z][^.!?]{1,80})$")
+# "Scope ....... 2" / "Scope 2" lines of a table of contents
+_TOC_ENTRY = re.compile(r"^([A-Z][^.!?]{1,70}?:?)[\s.\u00b7]*\s(\d{1,3})$")
+_TOC_TITLE = re.compile(r"^[A-Z][^.!?]{1,70}[.:]?$")
+_FIELD = re.compile(r"^(?:[-*\u2022]\s*)?([A-Z][A-Za-z0-9 /&()'-]{1,40}):(?:\s+(.*))?$")
+_TABLE_ROW = re.compile(r"^\|(.+)\|$")
+_TABLE_RULE = re.compile(r"^\|?\s*:?-{3,}")
+
+CacheKey = Tuple[str, int, int]
+
+class TemplateCache:
+    """LRU cache of extracted template text keyed by (path, size, mtime)"""
+    
+    def __init__(self, max_entries: int = TEMPLATE_CACHE_SIZE, cache_dir: str = TEMPLATE_CACHE_DIR,
+                 name: str = "template"):
+        self.name = name
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries: "OrderedDict[CacheKey, str]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key_for(file_path: str) -> CacheKey:
+        """Build a cache key that changes whenever the file is modified"""
+        stat = os.stat(file_path)
+        return (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    
+    def _disk_path(self, key: CacheKey) -> str:
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.txt")
+    
+    def get(self, key: CacheKey) -> Optional[str]:
+        """Return cached text from memory, falling back to the disk cache"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                CACHE_REQUESTS.inc(cache=self.name, result="hit")
+                return self._entries[key]
+        if self.cache_dir:
+            try:
+                with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                    text = f.read()
+            except OSError:
+                CACHE_REQUESTS.inc(cache=self.name, result="miss")
+                return None
+            self._remember(key, text)
+            CACHE_REQUESTS.inc(cache=self.name, result="disk_hit")
+            return text
+        CACHE_REQUESTS.inc(cache=self.name, result="miss")
+        return None
+    
+    def put(self, key: CacheKey, text: str):
+        """Store extracted text in memory and, if configured, on disk"""
+        self._remember(key, text)
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = self._disk_path(key) + ".tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                os.replace(tmp_path, self._disk_path(key))
+            except OSError as e:
+                logger.warning(f"Could not write template cache: {e}")
+    
+    def _remember(self, key: CacheKey, text: str):
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+template_cache = TemplateCache()
+# Outlines derived from the cached text, keyed the same way
+template_outline_cache = TemplateCache(
+    cache_dir=os.path.join(TEMPLATE_CACHE_DIR, "outlines") if TEMPLATE_CACHE_DIR else "",
+    name="template_outline"
+)
+
 class TemplateService:
     """Parse and validate test plan templates"""
     
@@ -36,9 +134,12 @@ class TemplateService:
         """Validate PDF template"""
         try:
             import PyPDF2
+            key = template_cache.key_for(file_path)
             with open(file_path, 'rb') as f:
                 reader = PyPDF2.PdfReader(f)
                 num_pages = len(reader.pages)
+                if template_cache.get(key) is None:
+                    template_cache.put(key, TemplateService._extract_pdf_text(reader))
             return {
                 "status": "valid",
                 "format": "pdf",
@@ -63,8 +164,10 @@ class TemplateService:
     def _validate_text(file_path: str) -> Dict:
         """Validate text or markdown template"""
         try:
+            key = template_cache.key_for(file_path)
             with open(file_path, 'r', encoding='utf-8') as f:
                 content = f.read()
+            template_cache.put(key, content)
             
             if len(content) < 10:
                 return {
@@ -89,15 +192,24 @@ class TemplateService:
     
     @staticmethod
     def load_template(file_path: str) -> Optional[str]:
-        """Load template content"""
+        """Load template content, reusing cached text while the file is unchanged"""
         try:
+            key = template_cache.key_for(file_path)
+            cached = template_cache.get(key)
+            if cached is not None:
+                return cached
+            
             file_ext = os.path.splitext(file_path)[1].lower()
             
             if file_ext == ".pdf":
-                return TemplateService._load_pdf(file_path)
+                content = TemplateService._load_pdf(file_path)
             else:
                 with open(file_path, 'r', encoding='utf-8') as f:
-                    return f.read()
+                    content = f.read()
+            
+            if content is not None and content != PDF_PLACEHOLDER:
+                template_cache.put(key, content)
+            return content
         except Exception as e:
             logger.error(f"Error loading template: {e}")
             return None
@@ -107,15 +219,149 @@ class TemplateService:
         """Extract text from PDF"""
         try:
             import PyPDF2
-            text = ""
             with open(file_path, 'rb') as f:
                 reader = PyPDF2.PdfReader(f)
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
-            return text
+                return TemplateService._extract_pdf_text(reader)
         except ImportError:
             logger.warning("PyPDF2 not installed, cannot extract PDF text")
-            return "[PDF Template - Content extraction requires PyPDF2]"
+            return PDF_PLACEHOLDER
         except Exception as e:
             logger.error(f"Error extracting PDF: {e}")
             return None
+    
+    @staticmethod
+    def _extract_pdf_text(reader) -> str:
+        """Join the text of every page of an open PdfReader"""
+        return "".join((page.extract_text() or "") + "\n" for page in reader.pages)
+    
+    @staticmethod
+    def load_outline(file_path: str) -> Optional[str]:
+        """Load the template's structural outline, extracting it once per file version"""
+        try:
+            key = template_outline_cache.key_for(file_path)
+        except OSError as e:
+            logger.error(f"Error loading template: {e}")
+            return None
+        cached = template_outline_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        content = TemplateService.load_template(file_path)
+        if not content or content == PDF_PLACEHOLDER:
+            return content
+        outline = TemplateService.extract_outline(content)
+        template_outline_cache.put(key, outline)
+        return outline
+    
+    @staticmethod
+    def extract_outline(text: str, max_chars: int = TEMPLATE_OUTLINE_MAX_CHARS) -> str:
+        """Reduce template text to its section headings, required fields and table columns.
+
+        Headings come from a table of contents when the template has one (typical
+        of PDFs), otherwise from Markdown or numbered headings. Templates with no
+        recognisable structure fall back to a prefix cut at a word boundary.
+        """
+        lines = [line.strip() for line in text.splitlines()]
+        lines = [line for line in lines if line]
+        sections, toc_lines = TemplateService._toc_sections(lines)
+        titles = {section["title"].rstrip(":").lower() for section in sections}
+        loose_fields: List[str] = []
+        current = None
+        
+        for i, line in enumerate(lines):
+            if i in toc_lines:
+                continue
+            heading = _MD_HEADING.match(line)
+            numbered = _NUMBERED_HEADING.match(line)
+            if heading:
+                current = TemplateService._add_section(sections, heading.group(2), len(heading.group(1)))
+            elif numbered:
+                current = TemplateService._add_section(sections, numbered.group(2), numbered.group(1).count(".") + 1)
+            elif line.rstrip(":").lower() in titles:
+                # Body heading of a TOC entry; repeated titles resolve to the next occurrence
+                start = sections.index(current) + 1 if current in sections else 0
+                current = next((section for section in sections[start:]
+                                if section["title"].rstrip(":").lower() == line.rstrip(":").lower()), current)
+            elif _TABLE_ROW.match(line) and i + 1 < len(lines) and _TABLE_RULE.match(lines[i + 1]):
+                columns = [cell.strip() for cell in line.strip("|").split("|") if cell.strip()]
+                if current is not None:
+                    current["columns"].append(columns)
+                else:
+                    current = TemplateService._add_section(sections, "Table", 1)
+                    current["columns"].append(columns)
+            else:
+                field = _FIELD.match(line)
+                if field and len(field.group(1).split()) <= 5:
+                    label = field.group(1).strip()
+                    target = current["fields"] if current is not None else loose_fields
+                    if label not in target:
+                        target.append(label)
+        
+        if not sections:
+            flat = " ".join(lines)
+            if loose_fields:
+                return "Fields: " + ", ".join(loose_fields)
+            if len(flat) <= max_chars:
+                return flat
+            return flat[:max_chars].rsplit(None, 1)[0] + " ..."
+        return TemplateService._render_outline(sections, loose_fields, max_chars)
+    
+    @staticmethod
+    def _toc_sections(lines: List[str]) -> Tuple[List[Dict], Set[int]]:
+        """Sections listed in a table of contents (3+ consecutive entries), and the TOC's line numbers"""
+        entries, used = [], set()
+        run, run_lines = [], []
+        i = 0
+        while i <= len(lines):
+            line = lines[i] if i < len(lines) else ""
+            entry = _TOC_ENTRY.match(line)
+            if entry:
+                run.append(entry.group(1).strip())
+                run_lines.append(i)
+                i += 1
+                continue
+            # PDF extraction often puts the page number on its own line
+            if _TOC_TITLE.match(line) and i + 1 < len(lines) and lines[i + 1].isdigit() and len(lines[i + 1]) <= 3:
+                run.append(line.rstrip("."))
+                run_lines += [i, i + 1]
+                i += 2
+                continue
+            if len(run) >= 3:
+                entries += run
+                used.update(run_lines)
+            run, run_lines = [], []
+            i += 1
+        
+        sections: List[Dict] = []
+        for title in entries:
+            # "Entry Criteria:" style entries are sub-items of the preceding section
+            TemplateService._add_section(sections, title.rstrip(":"), 2 if title.endswith(":") and sections else 1)
+        return sections, used
+    
+    @staticmethod
+    def _add_section(sections: List[Dict], title: str, level: int) -> Dict:
+        section = {"title": title.strip(), "level": level, "fields": [], "columns": []}
+        sections.append(section)
+        return section
+    
+    @staticmethod
+    def _render_outline(sections: List[Dict], loose_fields: List[str], max_chars: int) -> str:
+        """Indented bullet outline, truncated at whole lines"""
+        top = min(section["level"] for section in sections)
+        lines = [f"Fields: {', '.join(loose_fields)}"] if loose_fields else []
+        for section in sections:
+            indent = "  " * (section["level"] - top)
+            lines.append(f"{indent}- {section['title']}")
+            if section["fields"]:
+                lines.append(f"{indent}  Fields: {', '.join(section['fields'])}")
+            for columns in section["columns"]:
+                lines.append(f"{indent}  Table columns: {' | '.join(columns)}")
+        
+        outline, size = [], 0
+        for line in lines:
+            if size + len(line) + 1 > max_chars:
+                outline.append("- ...")
+                break
+            outline.append(line)
+            size += len(line) + 1
+        return "\n".join(outline)
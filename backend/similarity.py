@@ -0,0 +1,215 @@
+"""Local similarity index over generation history - near-duplicate reuse and few-shot examples"""
+import os
+import re
+import zlib
+import math
+import logging
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from database import get_db, decompress_content
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_ENABLED = os.getenv("SIMILARITY_ENABLED", "1") == "1"
+# Hashed feature space; collisions cost a little precision, but new terms never resize the index
+SIMILARITY_DIMENSIONS = int(os.getenv("SIMILARITY_DIMENSIONS", "1024"))
+# Most recent plans kept in memory (~8 KB each at 1024 dimensions)
+SIMILARITY_MAX_DOCUMENTS = int(os.getenv("SIMILARITY_MAX_DOCUMENTS", "5000"))
+SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", "3"))
+# At or above this score a past plan is offered for reuse instead of generating
+SIMILARITY_REUSE_THRESHOLD = float(os.getenv("SIMILARITY_REUSE_THRESHOLD", "0.85"))
+# At or above this score the nearest plan is included in the prompt as an example
+SIMILARITY_EXAMPLE_THRESHOLD = float(os.getenv("SIMILARITY_EXAMPLE_THRESHOLD", "0.3"))
+SIMILARITY_EXAMPLE_MAX_CHARS = int(os.getenv("SIMILARITY_EXAMPLE_MAX_CHARS", "1200"))
+# Share of the score from summary-to-summary similarity (the rest compares the story with plan content)
+SUMMARY_WEIGHT = 0.7
+
+STOPWORDS = frozenset("""
+a an and are as at be by can for from has have if in into is it its of on or should that the
+their then there these this to was will with when which who user users able so we our
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+def vectorize(text: str, dimensions: int = SIMILARITY_DIMENSIONS) -> np.ndarray:
+    """Sublinear term frequencies of unigrams and bigrams, hashed into a fixed-size vector"""
+    words = [word for word in _TOKEN.findall((text or "").lower()) if len(word) > 1 and word not in STOPWORDS]
+    terms = Counter(words)
+    terms.update(f"{first} {second}" for first, second in zip(words, words[1:]))
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for term, count in terms.items():
+        vector[zlib.crc32(term.encode()) % dimensions] += 1 + math.log(count)
+    return vector
+
+class _Matrix:
+    """Growable ring of term-frequency rows with per-feature document frequencies"""
+
+    def __init__(self, capacity: int, dimensions: int):
+        self.rows = np.zeros((capacity, dimensions), dtype=np.float32)
+        self.document_frequency = np.zeros(dimensions, dtype=np.int64)
+
+    def reserve(self, capacity: int):
+        """Grow the rows to hold at least `capacity` documents"""
+        if capacity > len(self.rows):
+            rows = np.zeros((capacity, self.rows.shape[1]), dtype=np.float32)
+            rows[:len(self.rows)] = self.rows
+            self.rows = rows
+
+    def put(self, slot: int, vector: np.ndarray, replacing: bool):
+        if replacing:
+            self.document_frequency -= self.rows[slot] > 0
+        self.rows[slot] = vector
+        self.document_frequency += vector > 0
+
+    def cosine(self, query: np.ndarray, size: int) -> np.ndarray:
+        """TF-IDF cosine similarity of `query` against the first `size` rows"""
+        idf = np.log((1 + size) / (1 + self.document_frequency)).astype(np.float32) + 1
+        weighted_query = query * idf
+        query_norm = np.linalg.norm(weighted_query)
+        if not query_norm:
+            return np.zeros(size, dtype=np.float32)
+        rows = self.rows[:size]
+        dots = rows @ (weighted_query * idf)
+        norms = np.sqrt(np.einsum("ij,ij,j->i", rows, rows, idf * idf))
+        return dots / (norms * query_norm + 1e-12)
+
+class SimilarityIndex:
+    """In-memory TF-IDF index of past plans, loaded from history on first use and updated on insert"""
+
+    def __init__(self, max_documents: int = SIMILARITY_MAX_DOCUMENTS, dimensions: int = SIMILARITY_DIMENSIONS):
+        self.max_documents = max_documents
+        self.dimensions = dimensions
+        # Rows are allocated as documents arrive, doubling up to max_documents
+        self._summaries = _Matrix(0, dimensions)
+        self._contents = _Matrix(0, dimensions)
+        self._meta: List[Tuple[str, str, str]] = []  # (id, jira key, summary) per slot
+        self._ids: Dict[str, int] = {}
+        self._count = 0  # documents ever added; slot = count % max_documents
+        self._loaded = False
+        self._pending: Optional[List[Tuple[str, str, str, str]]] = None  # adds queued during the load
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def _add(self, generation_id: str, jira_issue_id: str, summary: str, content: str):
+        if generation_id in self._ids:
+            return
+        slot = self._count % self.max_documents
+        replacing = slot < len(self._meta)
+        if replacing:
+            del self._ids[self._meta[slot][0]]
+        elif slot == len(self._summaries.rows):
+            self._reserve(max(64, 2 * slot))
+        self._summaries.put(slot, vectorize(summary, self.dimensions), replacing)
+        self._contents.put(slot, vectorize(f"{summary}\n{content}", self.dimensions), replacing)
+        if replacing:
+            self._meta[slot] = (generation_id, jira_issue_id, summary)
+        else:
+            self._meta.append((generation_id, jira_issue_id, summary))
+        self._ids[generation_id] = slot
+        self._count += 1
+
+    def _reserve(self, capacity: int):
+        capacity = min(capacity, self.max_documents)
+        self._summaries.reserve(capacity)
+        self._contents.reserve(capacity)
+
+    def ensure_loaded(self):
+        """Index the most recent history rows (once per process)"""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            with self._lock:
+                self._pending = []
+            try:
+                conn = get_db()
+                rows = conn.execute("""
+                    SELECT id, jira_issue_id, jira_summary, generated_content FROM generation_history
+                    ORDER BY created_at DESC, rowid DESC LIMIT ?
+                """, (self.max_documents,)).fetchall()
+                conn.close()
+                # Built without holding _lock, so add() calls meanwhile are queued rather than blocked
+                loaded = SimilarityIndex(self.max_documents, self.dimensions)
+                loaded._reserve(len(rows))
+                for row in reversed(rows):
+                    loaded._add(row[0], row[1], row[2] or "", decompress_content(row[3]))
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                for document in self._pending:
+                    loaded._add(*document)
+                self._summaries, self._contents = loaded._summaries, loaded._contents
+                self._meta, self._ids, self._count = loaded._meta, loaded._ids, loaded._count
+                self._pending = None
+                self._loaded = True
+            logger.info(f"Similarity index loaded {len(rows)} plans")
+
+    def add(self, documents: List[Tuple[str, str, str, str]]):
+        """Index newly saved (id, jira key, summary, content) rows; queued while the index
+        is loading, and a no-op before that (the load reads them from the database)"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(documents)
+            elif self._loaded:
+                for document in documents:
+                    self._add(*document)
+
+    def search(self, summary: str, story: str, top_k: int = SIMILARITY_TOP_K,
+               exclude_issue: Optional[str] = None) -> List[Dict]:
+        """Past plans most similar to a story, best first, at most one per Jira issue
+        (none from `exclude_issue`, usually the story's own earlier plans)"""
+        self.ensure_loaded()
+        with self._lock:
+            size = min(self._count, self.max_documents)
+            if not size:
+                return []
+            scores = (SUMMARY_WEIGHT * self._summaries.cosine(vectorize(summary, self.dimensions), size)
+                      + (1 - SUMMARY_WEIGHT) * self._contents.cosine(vectorize(story, self.dimensions), size))
+            candidates = np.argsort(scores)[::-1][:top_k * 4]
+            matches, seen = [], {exclude_issue}
+            for slot in candidates:
+                generation_id, jira_issue_id, jira_summary = self._meta[slot]
+                if jira_issue_id in seen:
+                    continue
+                seen.add(jira_issue_id)
+                matches.append({
+                    "id": generation_id,
+                    "jira_issue_id": jira_issue_id,
+                    "jira_summary": jira_summary,
+                    "score": round(float(scores[slot]), 4)
+                })
+                if len(matches) == top_k:
+                    break
+            return matches
+
+    def stats(self) -> Dict:
+        return {
+            "loaded": self._loaded,
+            "documents": min(self._count, self.max_documents),
+            "dimensions": self.dimensions,
+            "max_documents": self.max_documents
+        }
+
+similarity_index = SimilarityIndex()
+
+def load_plan(generation_id: str) -> Optional[str]:
+    """Full content of a past plan"""
+    conn = get_db()
+    row = conn.execute("SELECT generated_content FROM generation_history WHERE id = ?",
+                       (generation_id,)).fetchone()
+    conn.close()
+    return decompress_content(row[0]) if row else None
+
+def trim_example(content: str, max_chars: int = SIMILARITY_EXAMPLE_MAX_CHARS) -> str:
+    """Cut a plan to a few-shot example at a line boundary"""
+    if len(content) <= max_chars:
+        return content
+    cut = content[:max_chars]
+    return cut[:cut.rfind("\n")] if "\n" in cut else cut
@@ -0,0 +1,148 @@
+"""Benchmark - SQLite connection handling on the config and export endpoints
+
+Compares the original connect-per-call, rollback-journal setup with config
+read from its table on every request ("before") with the pooled WAL
+connection manager and in-memory config cache ("after").
+
+Usage: python bench_database.py [--requests 2000] [--rows 5000]
+"""
+import os
+import sys
+import time
+import uuid
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+# Point the backend at a scratch database before it is imported
+_workdir = tempfile.mkdtemp(prefix="tp_bench_")
+os.environ["DATABASE_PATH"] = os.path.join(_workdir, "after.db")
+os.environ.setdefault("LLM_WARM_UP", "0")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+from fastapi.testclient import TestClient
+
+import database
+import main
+from config_cache import config_cache
+
+BEFORE_DB = os.path.join(_workdir, "before.db")
+AFTER_DB = os.environ["DATABASE_PATH"]
+
+def legacy_get_db():
+    """The original get_db(): a fresh default connection on every call"""
+    conn = sqlite3.connect(BEFORE_DB)
+    conn.row_factory = sqlite3.Row
+    # The history FTS triggers read content through this function
+    conn.create_function("plan_text", 1, database.decompress_content)
+    return conn
+
+def use_get_db(get_db):
+    """Point every backend module that imported get_db (and database itself) at `get_db`"""
+    for module in list(sys.modules.values()):
+        if getattr(module, "get_db", None) is not None and hasattr(module, "__file__") \
+                and (module.__file__ or "").startswith(os.path.dirname(database.__file__)):
+            module.get_db = get_db
+
+def legacy_config_get(name: str):
+    """The original config reads: query the table on every request, no in-memory cache"""
+    return config_cache._load(name, None)[0]
+
+def seed(conn, rows: int) -> list:
+    """Fill config tables and generation_history, returning the history ids"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM llm_config")
+    cursor.execute("INSERT INTO llm_config (provider, ollama_model) VALUES ('ollama', 'mistral')")
+    cursor.execute("DELETE FROM template_config")
+    cursor.execute("INSERT INTO template_config (file_path, file_format, validation_status) VALUES ('Template/test-plan-template.pdf', 'pdf', 'valid')")
+    ids = [str(uuid.uuid4()) for _ in range(rows)]
+    content = "# Test Plan\n\n## Scope\n" + ("- Verify behaviour under load\n" * 200)
+    cursor.executemany("""
+        INSERT INTO generation_history (id, jira_issue_id, jira_summary, generated_content, provider_used)
+        VALUES (?, ?, ?, ?, 'ollama')
+    """, [(gid, f"BENCH-{i}", f"Story {i}", content) for i, gid in enumerate(ids)])
+    conn.commit()
+    return ids
+
+def run_endpoints(client: TestClient, ids: list, n: int) -> dict:
+    """Return requests/sec for each benchmarked endpoint"""
+    targets = {
+        "GET /api/config/llm": lambda i: "/api/config/llm",
+        "GET /api/config/template": lambda i: "/api/config/template",
+        "GET /api/export/{id}/md": lambda i: f"/api/export/{ids[i % len(ids)]}/md",
+    }
+    results = {}
+    for name, path in targets.items():
+        start = time.perf_counter()
+        for i in range(n):
+            response = client.get(path(i))
+            assert response.status_code == 200, response.text
+        results[name] = n / (time.perf_counter() - start)
+    return results
+
+def run_mixed(get_db, ids: list, seconds: float = 2.0) -> float:
+    """Export-style reads/sec while another thread keeps inserting history rows"""
+    stop = threading.Event()
+
+    def writer():
+        conn = get_db()
+        while not stop.is_set():
+            conn.execute("""
+                INSERT INTO generation_history (id, jira_issue_id, generated_content)
+                VALUES (?, 'BENCH-W', 'x')
+            """, (str(uuid.uuid4()),))
+            conn.commit()
+        conn.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    reads = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        conn = get_db()
+        conn.execute("SELECT generated_content FROM generation_history WHERE id = ?",
+                     (ids[reads % len(ids)],)).fetchone()
+        conn.close()
+        reads += 1
+    stop.set()
+    thread.join()
+    return reads / seconds
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    # "before": rollback journal, new connection per call, config read from the table every time
+    use_get_db(legacy_get_db)
+    config_cache.get = legacy_config_get
+    database.DB_PATH = BEFORE_DB
+    database.init_db()
+    before_ids = seed(legacy_get_db(), args.rows)
+    with TestClient(main.app) as client:
+        before = run_endpoints(client, before_ids, args.requests)
+    before_mixed = run_mixed(legacy_get_db, before_ids)
+
+    # "after": pooled per-thread connections with WAL and tuned pragmas
+    manager = database.ConnectionManager(AFTER_DB)
+    use_get_db(manager.connection)
+    del config_cache.get
+    config_cache.invalidate()
+    database.init_db()
+    after_ids = seed(manager.connection(), args.rows)
+    with TestClient(main.app) as client:
+        after = run_endpoints(client, after_ids, args.requests)
+    after_mixed = run_mixed(manager.connection, after_ids)
+    manager.close_all()
+
+    print(f"\n{'Endpoint':32} {'before req/s':>14} {'after req/s':>14} {'speedup':>9}")
+    print("-" * 72)
+    for name in before:
+        print(f"{name:32} {before[name]:14.0f} {after[name]:14.0f} {after[name] / before[name]:8.2f}x")
+    print(f"{'reads/s during writes':32} {before_mixed:14.0f} {after_mixed:14.0f} {after_mixed / before_mixed:8.2f}x")
+    print(f"\nScratch databases in {_workdir}\n")
+
+if __name__ == "__main__":
+    main_bench()
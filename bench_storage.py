@@ -0,0 +1,111 @@
+"""Benchmark - compressed generation_history content
+
+Compares plain TEXT plan content ("before") with the zlib + trained dictionary
+storage in backend/database.py ("after"): database file size, history listing
+latency and export-style full-content reads.
+
+Usage: python bench_storage.py [--rows 5000] [--reads 2000]
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import tempfile
+
+# Point the backend at a scratch database before it is imported
+_workdir = tempfile.mkdtemp(prefix="tp_bench_storage_")
+os.environ["DATABASE_PATH"] = os.path.join(_workdir, "after.db")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+import database
+from history import list_generations
+
+SECTIONS = ["Overview", "Scope", "Test Environment", "Test Scenarios", "Exit Criteria", "Risks"]
+PLATFORMS = ["iOS", "Android", "Web", "Desktop"]
+FEATURES = ["login", "checkout", "search", "profile settings", "notifications", "file upload"]
+
+def make_plan(i: int) -> str:
+    """A synthetic plan with the shared boilerplate and per-story detail of real output"""
+    rng = random.Random(i)
+    feature, platform = rng.choice(FEATURES), rng.choice(PLATFORMS)
+    lines = [f"# Test Plan: {feature.title()} on {platform} (BENCH-{i})", ""]
+    for section in SECTIONS:
+        lines += [f"## {section}", ""]
+        if section == "Test Scenarios":
+            lines += ["| ID | Scenario | Steps | Expected Result |", "|----|----------|-------|-----------------|"]
+            for n in range(rng.randint(8, 20)):
+                kind = rng.choice(["Positive", "Negative", "Edge case"])
+                lines.append(f"| TC-{n + 1:03d} | {kind}: {feature} with input set {rng.randint(1, 999)} "
+                             f"| Open the {feature} screen on {platform}, enter the data and submit "
+                             f"| The system handles the request and shows the expected state |")
+        else:
+            for _ in range(rng.randint(3, 8)):
+                lines.append(f"- Verify that {feature} behaves correctly on {platform} "
+                             f"when the user {rng.choice(['is offline', 'has a slow network', 'switches accounts', 'rotates the device'])}")
+        lines.append("")
+    return "\n".join(lines)
+
+def seed(path: str, rows: int, compress: bool) -> list:
+    """Create a fresh history database, returning the generation ids"""
+    manager = database.ConnectionManager(path)
+    database.db_manager = manager
+    database.init_db()
+    conn = manager.connection()
+    ids = [str(uuid.uuid4()) for _ in range(rows)]
+    conn.executemany("""
+        INSERT INTO generation_history (id, jira_issue_id, jira_summary, generated_content, provider_used)
+        VALUES (?, ?, ?, ?, 'ollama')
+    """, [(gid, f"BENCH-{i}", f"Story {i}", make_plan(i)) for i, gid in enumerate(ids)])
+    conn.commit()
+    if compress:
+        # The same path production takes: train on existing plans, then migrate them
+        database.train_content_dictionary()
+        database.compress_history()
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return ids
+
+def measure(ids: list, reads: int) -> dict:
+    """Average latency (ms) of a history page and of a full content read + decode"""
+    conn = database.get_db()
+    start = time.perf_counter()
+    for i in range(reads):
+        row = conn.execute("SELECT generated_content FROM generation_history WHERE id = ?",
+                           (ids[i % len(ids)],)).fetchone()
+        database.decompress_content(row[0])
+    content_ms = (time.perf_counter() - start) / reads * 1000
+
+    pages = max(1, reads // 10)
+    start = time.perf_counter()
+    for _ in range(pages):
+        list_generations(limit=50)
+    list_ms = (time.perf_counter() - start) / pages * 1000
+    return {"content_read_ms": content_ms, "history_page_ms": list_ms}
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--reads", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = {}
+    for name, compress in (("before", False), ("after", True)):
+        path = os.path.join(_workdir, f"{name}.db")
+        ids = seed(path, args.rows, compress)
+        timings = measure(ids, args.reads)
+        database.close_db()
+        results[name] = {"db_mb": os.path.getsize(path) / 1024 / 1024, **timings}
+
+    before, after = results["before"], results["after"]
+    print(f"\n{'Metric':24} {'before':>12} {'after':>12} {'ratio':>9}")
+    print("-" * 60)
+    for key, label in (("db_mb", "database size (MB)"),
+                       ("content_read_ms", "content read (ms)"),
+                       ("history_page_ms", "history page (ms)")):
+        print(f"{label:24} {before[key]:12.3f} {after[key]:12.3f} {after[key] / before[key]:8.2f}x")
+    print(f"\nScratch databases in {_workdir}\n")
+
+if __name__ == "__main__":
+    main_bench()
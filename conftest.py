@@ -0,0 +1,5 @@
+"""Tests run against a throwaway database rather than backend/app.db"""
+import os
+import tempfile
+
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "test.db"))
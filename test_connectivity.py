@@ -2,6 +2,7 @@
 import sys
 import os
 import sqlite3
+import asyncio
 from pathlib import Path
 
 # Add backend to path
@@ -51,7 +52,7 @@ try:
     jira_service = JiraService(domain, email, api_token)
     
     if api_token != 'test_token':
-        result = jira_service.test_connection()
+        result = asyncio.run(jira_service.test_connection())
         if result['status'] == 'connected':
             print(f"✅ Jira: CONNECTED")
             print(f"   Domain: {domain}")
@@ -84,7 +85,7 @@ try:
                                   grok_max_tokens=2000,
                                   ollama_url='',
                                   ollama_model='')
-        result = llm_service.test_connection()
+        result = asyncio.run(llm_service.test_connection())
         if result['status'] == 'connected':
             print(f"✅ Grok: CONNECTED")
             print(f"   Model: grok-1")
@@ -116,7 +117,7 @@ try:
                               grok_max_tokens=2000,
                               ollama_url=ollama_url,
                               ollama_model='llama2')
-    result = llm_service.test_connection()
+    result = asyncio.run(llm_service.test_connection())
     if result['status'] == 'connected':
         print(f"✅ Ollama: CONNECTED")
         print(f"   URL: {ollama_url}")
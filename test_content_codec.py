@@ -0,0 +1,95 @@
+"""Plan content compression - dictionary training and codec round-trips"""
+import sys
+import os
+import zlib
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+import pytest
+
+import database
+from database import (
+    init_db, get_db, ContentCodec, CODEC_ZLIB, train_dictionary, train_content_dictionary,
+    compress_content, compress_history, decompress_content
+)
+
+PLANS = [
+    f"# Test Plan: Story {i}\n## Objectives\nVerify that the feature works as specified.\n"
+    f"## Test Scenarios\n| ID | Scenario | Expected Result |\n| TC-{i} | Case {i} | Passes |\n"
+    for i in range(5)
+]
+
+def setup_function():
+    init_db()
+    conn = get_db()
+    conn.execute("DELETE FROM generation_history")
+    conn.execute("DELETE FROM content_dictionaries")
+    conn.commit()
+    conn.close()
+    database.db_manager.codec.reset()
+
+def _add_dictionary(dictionary: bytes) -> int:
+    conn = get_db()
+    cursor = conn.execute("INSERT INTO content_dictionaries (dictionary, sample_count) VALUES (?, 1)", (dictionary,))
+    conn.commit()
+    conn.close()
+    return cursor.lastrowid
+
+def test_dictionary_keeps_lines_shared_by_plans():
+    dictionary = train_dictionary(PLANS)
+    assert b"## Objectives\n" in dictionary
+    assert b"| ID | Scenario | Expected Result |\n" in dictionary
+    assert b"Story 3" not in dictionary
+    assert len(train_dictionary(PLANS, size=20)) <= 20
+
+def test_round_trip_without_dictionary():
+    codec = ContentCodec(database.DB_PATH)
+    value = codec.compress(PLANS[0])
+    assert value[0] == CODEC_ZLIB and int.from_bytes(value[1:5], "big") == 0
+    assert codec.decompress(value) == PLANS[0]
+
+def test_round_trip_with_each_dictionary_version():
+    first = _add_dictionary(train_dictionary(PLANS[:3]))
+    older = ContentCodec(database.DB_PATH).compress(PLANS[4])
+    second = _add_dictionary(train_dictionary(PLANS))
+    codec = ContentCodec(database.DB_PATH)
+    newer = codec.compress(PLANS[4])
+    assert int.from_bytes(older[1:5], "big") == first
+    assert int.from_bytes(newer[1:5], "big") == second
+    assert len(newer) - 5 < len(zlib.compress(PLANS[4].encode(), 9))
+    assert codec.decompress(older) == codec.decompress(newer) == PLANS[4]
+
+def test_legacy_text_passes_through():
+    codec = ContentCodec(database.DB_PATH)
+    assert codec.decompress("plain text plan") == "plain text plan"
+    assert codec.decompress(None) is None
+    with pytest.raises(ValueError):
+        codec.decompress(bytes([99]) + b"\0\0\0\0data")
+
+def test_compress_history_migrates_text_rows():
+    conn = get_db()
+    conn.executemany("INSERT INTO generation_history (id, jira_issue_id, generated_content) VALUES (?, ?, ?)",
+                     [(f"g{i}", f"AB-{i}", plan) for i, plan in enumerate(PLANS)])
+    conn.commit()
+    assert compress_history(batch_size=2) == len(PLANS)
+    rows = conn.execute("SELECT typeof(generated_content), generated_content FROM generation_history ORDER BY id").fetchall()
+    conn.close()
+    assert {row[0] for row in rows} == {"blob"}
+    assert [decompress_content(row[1]) for row in rows] == PLANS
+
+def test_first_dictionary_waits_for_enough_plans(monkeypatch):
+    monkeypatch.setattr(database, "CONTENT_DICT_MIN_SAMPLES", 3)
+    conn = get_db()
+    insert = "INSERT INTO generation_history (id, jira_issue_id, generated_content) VALUES (?, ?, ?)"
+    conn.executemany(insert, [(f"g{i}", f"AB-{i}", compress_content(PLANS[i])) for i in range(2)])
+    conn.commit()
+    assert not train_content_dictionary()
+    conn.execute(insert, ("g2", "AB-2", compress_content(PLANS[2])))
+    conn.commit()
+    assert train_content_dictionary()
+    assert not train_content_dictionary()  # already trained, and no retraining asked for
+    conn.close()
+    value = compress_content(PLANS[3])
+    assert int.from_bytes(value[1:5], "big") > 0
+    assert decompress_content(value) == PLANS[3]
@@ -0,0 +1,77 @@
+"""History API - keyset pagination and full-text search over saved plans"""
+import sys
+import os
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+from database import init_db, get_db
+from models import JiraIssue
+from generation import save_generation
+from history import list_generations, search_generations, fts_query
+
+def _story(key, summary):
+    return JiraIssue(key=key, summary=summary, description="", priority="Medium",
+                     issueType="Story", acceptanceCriteria="")
+
+def setup_function():
+    init_db()
+    conn = get_db()
+    conn.execute("DELETE FROM generation_history")
+    conn.commit()
+    conn.close()
+    for i in range(7):
+        topic = "checkout payment" if i % 2 else "login password"
+        save_generation(f"g{i}", _story(f"AB-{i}", f"Story {i} {topic}"),
+                        f"# Test Plan\nVerify the {topic} flow, case {i}.", "ollama", 1.0)
+
+def _pages(fetch, **kwargs):
+    pages, cursor = [], None
+    while True:
+        page = fetch(cursor=cursor, **kwargs)
+        pages.append([item["id"] for item in page["items"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+def test_pages_cover_every_row_once_newest_first():
+    pages = _pages(list_generations, limit=3)
+    assert [len(page) for page in pages] == [3, 3, 1]
+    ids = [generation_id for page in pages for generation_id in page]
+    assert sorted(ids) == [f"g{i}" for i in range(7)]
+    everything = list_generations(limit=10)["items"]
+    assert ids == [item["id"] for item in everything]
+    assert "generated_content" not in everything[0]
+
+def test_filters_apply_across_pages():
+    assert _pages(list_generations, limit=1, jira_issue_id="AB-3") == [["g3"]]
+
+def test_invalid_cursor_is_rejected():
+    try:
+        list_generations(cursor="not a cursor")
+    except ValueError as e:
+        assert str(e) == "Invalid cursor"
+    else:
+        raise AssertionError("expected ValueError")
+
+def test_search_matches_content_and_summary():
+    ids = {item["id"] for item in search_generations("payment", limit=10)["items"]}
+    assert ids == {"g1", "g3", "g5"}
+    pages = _pages(search_generations, query="login", limit=2)
+    assert sorted(generation_id for page in pages for generation_id in page) == ["g0", "g2", "g4", "g6"]
+
+def test_search_prefix_and_snippet():
+    items = search_generations("pass*", limit=10)["items"]
+    assert len(items) == 4
+    assert "[" in items[0]["snippet"]
+
+def test_search_forgets_deleted_rows():
+    conn = get_db()
+    conn.execute("DELETE FROM generation_history WHERE id = 'g1'")
+    conn.commit()
+    conn.close()
+    assert {item["id"] for item in search_generations("payment")["items"]} == {"g3", "g5"}
+
+def test_fts_query_quotes_terms():
+    assert fts_query('login "OR" pass*') == '"login" """OR""" "pass"*'
+    assert fts_query("  ") == ""
@@ -0,0 +1,88 @@
+"""Idempotency keys - stored replays, single-flight coalescing and stale takeover"""
+import sys
+import os
+import asyncio
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+import pytest
+
+import idempotency
+from database import init_db, get_db
+from idempotency import IdempotencyMismatch, IdempotencyStore, request_fingerprint, run_idempotent
+
+def setup_function():
+    init_db()
+    conn = get_db()
+    conn.execute("DELETE FROM idempotency_keys")
+    conn.commit()
+    conn.close()
+
+class Counter:
+    def __init__(self, delay=0.0, error=None):
+        self.calls = 0
+        self.delay = delay
+        self.error = error
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return {"call": self.calls}
+
+def test_stored_key_is_replayed():
+    call = Counter()
+    assert asyncio.run(run_idempotent("test", {"a": 1}, call, "k1")) == ({"call": 1}, False)
+    assert asyncio.run(run_idempotent("test", {"a": 1}, call, "k1")) == ({"call": 1}, True)
+    assert call.calls == 1
+
+def test_key_reused_with_another_body_is_rejected():
+    asyncio.run(run_idempotent("test", {"a": 1}, Counter(), "k1"))
+    with pytest.raises(IdempotencyMismatch):
+        asyncio.run(run_idempotent("test", {"a": 2}, Counter(), "k1"))
+
+def test_failed_call_releases_its_key():
+    with pytest.raises(RuntimeError):
+        asyncio.run(run_idempotent("test", {"a": 1}, Counter(error=RuntimeError("down")), "k1"))
+    assert asyncio.run(run_idempotent("test", {"a": 1}, Counter(), "k1")) == ({"call": 1}, False)
+
+def test_identical_requests_without_a_key_share_one_call_but_are_not_replays():
+    call = Counter(delay=0.05)
+
+    async def both():
+        return await asyncio.gather(run_idempotent("test", {"a": 1}, call), run_idempotent("test", {"a": 1}, call))
+
+    assert asyncio.run(both()) == [({"call": 1}, False), ({"call": 1}, False)]
+    assert call.calls == 1
+
+def test_concurrent_retry_with_the_key_joins_the_call():
+    call = Counter(delay=0.05)
+
+    async def both():
+        return await asyncio.gather(run_idempotent("test", {"a": 1}, call, "k1"),
+                                    run_idempotent("test", {"a": 1}, call, "k1"))
+
+    assert sorted(replayed for _, replayed in asyncio.run(both())) == [False, True]
+    assert call.calls == 1
+
+def test_stale_in_progress_key_is_taken_over():
+    store = IdempotencyStore(stale_seconds=0)
+    fingerprint = request_fingerprint({"a": 1})
+    assert store.begin("test", "k1", fingerprint) == ("new", None)
+    assert store.begin("test", "k1", fingerprint) == ("new", None)
+    assert IdempotencyStore().begin("test", "k1", fingerprint) == ("in_progress", None)
+
+def test_running_call_keeps_its_key_fresh(monkeypatch):
+    monkeypatch.setattr(idempotency, "idempotency_store", IdempotencyStore(stale_seconds=0.15))
+    fingerprint = request_fingerprint({"a": 1})
+
+    async def retry_meanwhile():
+        task = asyncio.create_task(run_idempotent("test", {"a": 1}, Counter(delay=0.4), "k1"))
+        await asyncio.sleep(0.3)
+        state = await asyncio.to_thread(idempotency.idempotency_store.begin, "test", "k1", fingerprint)
+        await task
+        return state
+
+    assert asyncio.run(retry_meanwhile())[0] == "in_progress"
@@ -0,0 +1,110 @@
+"""Generation job queue - claiming, lease expiry, requeue and retry with backoff"""
+import sys
+import os
+import time
+import asyncio
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+import job_queue as jobs
+from database import init_db, get_db
+from models import GenerateTestPlanRequest, JiraIssue
+
+def _request(key="AB-1"):
+    story = JiraIssue(key=key, summary="Login", description="", priority="Medium",
+                      issueType="Story", acceptanceCriteria="")
+    return GenerateTestPlanRequest(jira_issue_id=key, jira_details=story, template_content="", provider="ollama")
+
+def _job(job_id):
+    conn = get_db()
+    row = dict(conn.execute("SELECT * FROM generation_jobs WHERE id = ?", (job_id,)).fetchone())
+    conn.close()
+    return row
+
+def setup_function():
+    init_db()
+    conn = get_db()
+    conn.execute("DELETE FROM generation_jobs")
+    conn.commit()
+    conn.close()
+
+def test_claims_highest_priority_first_and_only_once():
+    queue = jobs.JobQueue()
+    low = queue._insert(_request("AB-1"), 0)
+    high = queue._insert(_request("AB-2"), 5)
+    assert queue._claim("w1")["id"] == high
+    assert queue._claim("w2")["id"] == low
+    assert queue._claim("w3") is None
+    assert _job(high)["status"] == "running" and _job(high)["worker_id"] == "w1"
+
+def test_lapsed_lease_is_claimed_again():
+    queue = jobs.JobQueue()
+    job_id = queue._insert(_request(), 0)
+    assert queue._claim("w1")["attempts"] == 1
+    assert queue._claim("w2") is None
+    conn = get_db()
+    conn.execute("UPDATE generation_jobs SET lease_expires_at = ? WHERE id = ?", (time.time() - 1, job_id))
+    conn.commit()
+    conn.close()
+    claimed = queue._claim("w2")
+    assert (claimed["id"], claimed["attempts"]) == (job_id, 2)
+    assert not queue._renew_lease("missing")
+    assert queue._renew_lease(job_id)
+
+def test_stopping_requeues_own_running_jobs():
+    queue = jobs.JobQueue()
+    job_id = queue._insert(_request(), 0)
+    queue._claim(f"worker-{os.getpid()}-0")
+    queue._requeue_own()
+    job = _job(job_id)
+    assert (job["status"], job["attempts"], job["lease_expires_at"]) == ("queued", 0, None)
+
+def test_retry_waits_for_its_backoff():
+    queue = jobs.JobQueue()
+    job_id = queue._insert(_request(), 0)
+    queue._claim("w1")
+    queue._retry_later(job_id, "provider down", 60)
+    assert _job(job_id)["status"] == "queued"
+    assert queue._claim("w1") is None
+    queue._retry_later(job_id, "ignored", 0)  # only running jobs are handed back
+    conn = get_db()
+    conn.execute("UPDATE generation_jobs SET not_before = ? WHERE id = ?", (time.time() - 1, job_id))
+    conn.commit()
+    conn.close()
+    assert queue._claim("w1")["id"] == job_id
+
+def _run_attempts(monkeypatch, error, attempts):
+    async def failing(request):
+        raise error
+
+    monkeypatch.setattr(jobs, "run_generation", failing)
+    monkeypatch.setattr(jobs, "JOB_RETRY_BACKOFF_SECONDS", 0)
+    queue = jobs.JobQueue()
+    job_id = queue._insert(_request(), 0)
+    for _ in range(attempts):
+        claimed = queue._claim("w1")
+        if claimed is None:
+            break
+        asyncio.run(queue._run(claimed["id"], claimed["request_json"], claimed["attempts"]))
+    return _job(job_id)
+
+def test_failures_retry_until_max_attempts(monkeypatch):
+    job = _run_attempts(monkeypatch, RuntimeError("provider down"), jobs.JOB_MAX_ATTEMPTS + 1)
+    assert (job["status"], job["attempts"], job["error"]) == ("failed", jobs.JOB_MAX_ATTEMPTS, "provider down")
+
+def test_invalid_input_is_not_retried(monkeypatch):
+    job = _run_attempts(monkeypatch, ValueError("bad template"), jobs.JOB_MAX_ATTEMPTS)
+    assert (job["status"], job["attempts"]) == ("failed", 1)
+
+def test_success_records_the_result(monkeypatch):
+    async def generated(request):
+        return {"id": "g1", "content": "plan"}
+
+    monkeypatch.setattr(jobs, "run_generation", generated)
+    queue = jobs.JobQueue()
+    job_id = queue._insert(_request(), 0)
+    claimed = queue._claim("w1")
+    asyncio.run(queue._run(claimed["id"], claimed["request_json"], claimed["attempts"]))
+    job = _job(job_id)
+    assert (job["status"], job["generation_id"]) == ("completed", "g1")
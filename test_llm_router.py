@@ -0,0 +1,97 @@
+"""LLM routing - failover between providers, hedging slow starters and cooldown"""
+import sys
+import os
+import time
+import asyncio
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+import llm_router as routing
+from llm_router import LLMRouter
+
+class FakeService:
+    """Streams a fixed answer after `delay` seconds, or fails"""
+
+    def __init__(self, name, delay=0.0, fail=False):
+        self.provider = "grok"
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.last_usage = {}
+        self.calls = 0
+        self.cancelled = False
+
+    async def stream_test_plan(self, prompt):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise RuntimeError(f"{self.name} down")
+        for token in (f"{self.name} ", "plan"):
+            yield token
+
+class FakeRouter(LLMRouter):
+    def __init__(self, services, hedge_seconds=0.0):
+        super().__init__(hedge_seconds)
+        self.services = {service.name: service for service in services}
+
+    def targets(self):
+        return [(name, 1.0, None) for name in self.services]
+
+    def service_for(self, target):
+        return self.services[target[0]]
+
+    def order(self):
+        return self.targets()  # deterministic: in the order given
+
+def test_fails_over_to_next_provider():
+    router = FakeRouter([FakeService("a", fail=True), FakeService("b")])
+    result = asyncio.run(router.generate("prompt"))
+    assert (result.name, result.content) == ("b", "b plan")
+    assert router.health("a").failures == 1
+    assert router.health("b").successes == 1
+
+def test_all_providers_failing_raises():
+    router = FakeRouter([FakeService("a", fail=True), FakeService("b", fail=True)])
+    try:
+        asyncio.run(router.generate("prompt"))
+    except RuntimeError as e:
+        assert "a: a down" in str(e) and "b: b down" in str(e)
+    else:
+        raise AssertionError("expected RuntimeError")
+
+def test_hedge_wins_over_slow_provider():
+    slow, fast = FakeService("slow", delay=1.0), FakeService("fast")
+    router = FakeRouter([slow, fast], hedge_seconds=0.05)
+    result = asyncio.run(router.generate("prompt"))
+    assert result.name == "fast"
+    assert slow.cancelled
+
+def test_no_hedge_without_hedge_seconds():
+    slow, fast = FakeService("slow", delay=0.1), FakeService("fast")
+    result = asyncio.run(FakeRouter([slow, fast]).generate("prompt"))
+    assert result.name == "slow"
+    assert fast.calls == 0
+
+def test_stream_fails_over_before_first_token():
+    router = FakeRouter([FakeService("a", fail=True), FakeService("b")])
+
+    async def collect():
+        stream = router.stream("prompt")
+        return [token async for token in stream], stream.name
+
+    assert asyncio.run(collect()) == (["b ", "plan"], "b")
+
+def test_repeated_failures_cool_a_provider_down():
+    router = FakeRouter([FakeService("a", fail=True), FakeService("b")])
+    for _ in range(routing.LLM_FAILURE_THRESHOLD):
+        asyncio.run(router.generate("prompt"))
+    now = time.monotonic()
+    assert not router.health("a").available(now)
+    assert router.health("b").available(now)
+    # Routing order puts providers in cooldown last
+    assert [name for name, _, _ in LLMRouter.order(router)] == ["b", "a"]
@@ -0,0 +1,51 @@
+"""Sectioned generation - template outlines split into the sections generated concurrently"""
+import sys
+import os
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+from services.template_service import TemplateService
+from generation import plan_sections, DEFAULT_SECTIONS
+
+MARKDOWN_TEMPLATE = """# Test Plan: Checkout Service
+
+Document owner: QA Lead
+
+## Objectives
+Release:
+Owner:
+
+## Scope
+### In Scope
+### Out of Scope
+
+## Test Scenarios
+| ID | Scenario | Expected Result |
+|----|----------|-----------------|
+| TC-1 | | |
+
+## Exit Criteria
+"""
+
+def test_h1_title_with_h2_sections():
+    outline = TemplateService.extract_outline(MARKDOWN_TEMPLATE)
+    sections = plan_sections(outline)
+
+    assert [title for title, _ in sections] == ["Objectives", "Scope", "Test Scenarios", "Exit Criteria"]
+    blocks = dict(sections)
+    assert blocks["Objectives"] == "- Objectives\n  Fields: Release, Owner"
+    assert blocks["Scope"] == "- Scope\n  - In Scope\n  - Out of Scope"
+    assert "Table columns: ID | Scenario | Expected Result" in blocks["Test Scenarios"]
+
+def test_top_level_sections_are_kept():
+    outline = TemplateService.extract_outline("## Overview\n## Risks\n### Schedule\n## Sign-off\n")
+    assert [title for title, _ in plan_sections(outline)] == ["Overview", "Risks", "Sign-off"]
+
+def test_lone_title_gives_way_to_its_child():
+    outline = TemplateService.extract_outline("# Test Plan\n## Approach\n")
+    assert plan_sections(outline) == [("Approach", "- Approach")]
+
+def test_unstructured_template_uses_default_sections():
+    sections = plan_sections(TemplateService.extract_outline("Write a thorough plan for the story."))
+    assert [title for title, _ in sections] == DEFAULT_SECTIONS
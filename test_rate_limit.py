@@ -0,0 +1,84 @@
+"""Upstream rate limiting - token buckets, Retry-After and retrying 429/5xx"""
+import sys
+import os
+import asyncio
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+from services import rate_limit
+from services.rate_limit import TokenBucket, RateLimiter, retry_after, send_with_retry
+
+def test_bucket_refills_at_the_per_minute_rate():
+    bucket = TokenBucket(60)
+    bucket.take(60)
+    assert bucket.wait_time(1, bucket.updated) == 1.0
+    assert bucket.wait_time(1, bucket.updated + 1) == 0.0
+    assert bucket.wait_time(100, bucket.updated) > 0  # capped at one full bucket
+
+def test_bucket_settles_token_estimates():
+    limiter = RateLimiter("test", tokens_per_minute=6000)
+    limiter.tokens.take(1000)
+    limiter.settle(1000, 400)
+    assert round(limiter.tokens.level) == 5600
+
+def test_server_headers_correct_the_token_budget():
+    limiter = RateLimiter("test", tokens_per_minute=6000)
+    limiter.observe(httpx.Headers({"x-ratelimit-limit-tokens": "12000", "x-ratelimit-remaining-tokens": "500"}))
+    assert limiter.tokens.capacity == 12000
+    assert limiter.tokens.level <= 501
+
+def test_retry_after_seconds_and_http_date():
+    assert retry_after(httpx.Headers({"retry-after": "7"})) == 7.0
+    assert retry_after(httpx.Headers({})) is None
+    assert retry_after(httpx.Headers({"retry-after": "soon"})) is None
+    when = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < retry_after(httpx.Headers({"retry-after": when})) <= 30
+
+def _client(statuses, headers=None):
+    responses = iter(statuses)
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(next(responses), headers=headers or {})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler)), seen
+
+def test_retries_until_success(monkeypatch):
+    monkeypatch.setattr(rate_limit, "backoff_delay", lambda attempt: 0)
+    client, seen = _client([503, 429, 200])
+
+    async def send():
+        async with client:
+            return await send_with_retry(client, client.build_request("GET", "https://example.test/"))
+
+    assert asyncio.run(send()).status_code == 200
+    assert len(seen) == 3
+
+def test_long_retry_after_is_returned_and_pauses_the_limiter():
+    client, seen = _client([429], {"retry-after": str(rate_limit.HTTP_RETRY_MAX_SECONDS + 60)})
+    limiter = RateLimiter("test", requests_per_minute=60)
+
+    async def send():
+        async with client:
+            return await send_with_retry(client, client.build_request("GET", "https://example.test/"), limiter)
+
+    assert asyncio.run(send()).status_code == 429
+    assert len(seen) == 1
+    assert limiter.snapshot()["paused_seconds"] > rate_limit.HTTP_RETRY_MAX_SECONDS
+
+def test_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(rate_limit, "backoff_delay", lambda attempt: 0)
+    client, seen = _client([500] * 10)
+
+    async def send():
+        async with client:
+            return await send_with_retry(client, client.build_request("GET", "https://example.test/"), retries=2)
+
+    assert asyncio.run(send()).status_code == 500
+    assert len(seen) == 3
@@ -0,0 +1,55 @@
+"""LLM response cache - TTL expiry and least-recently-used eviction"""
+import sys
+import os
+import time
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+from database import init_db, get_db
+from response_cache import ResponseCache
+
+IDENTITY = {"provider": "ollama", "model": "llama3", "temperature": 0.7}
+
+def setup_function():
+    init_db()
+    conn = get_db()
+    conn.execute("DELETE FROM llm_response_cache")
+    conn.commit()
+    conn.close()
+
+def test_key_depends_on_identity_and_prompt():
+    key = ResponseCache.key_for(IDENTITY, "prompt")
+    assert key == ResponseCache.key_for(dict(reversed(list(IDENTITY.items()))), "prompt")
+    assert key != ResponseCache.key_for(IDENTITY, "other prompt")
+    assert key != ResponseCache.key_for({**IDENTITY, "model": "mistral"}, "prompt")
+
+def test_hit_and_miss():
+    cache = ResponseCache()
+    cache.put("a", IDENTITY, "plan a")
+    assert cache.get("a") == "plan a"
+    assert cache.get("b") is None
+
+def test_expired_entry_is_dropped():
+    cache = ResponseCache(ttl_seconds=60)
+    cache.put("a", IDENTITY, "plan a")
+    conn = get_db()
+    conn.execute("UPDATE llm_response_cache SET created_at = ?", (time.time() - 120,))
+    conn.commit()
+    assert cache.get("a") is None
+    assert conn.execute("SELECT COUNT(*) FROM llm_response_cache").fetchone()[0] == 0
+    conn.close()
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", IDENTITY, "plan a")
+    cache.put("b", IDENTITY, "plan b")
+    conn = get_db()
+    conn.execute("UPDATE llm_response_cache SET last_used_at = last_used_at - 10 WHERE cache_key IN ('a', 'b')")
+    conn.commit()
+    conn.close()
+    assert cache.get("a") == "plan a"  # now more recent than b
+    cache.put("c", IDENTITY, "plan c")
+    assert cache.get("b") is None
+    assert cache.get("a") == "plan a"
+    assert cache.get("c") == "plan c"
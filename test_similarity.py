@@ -0,0 +1,60 @@
+"""Similarity index - nearest past plans, one per issue, and bounded memory"""
+import sys
+import os
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+import numpy as np
+
+from similarity import SimilarityIndex, vectorize, trim_example
+
+STORIES = [
+    ("g1", "AB-1", "Reset password by email link"),
+    ("g2", "AB-2", "Checkout with saved credit card"),
+    ("g3", "AB-3", "Export monthly sales report as PDF"),
+]
+
+def _index(max_documents=100):
+    index = SimilarityIndex(max_documents=max_documents, dimensions=256)
+    index._loaded = True  # tests add documents directly instead of loading history
+    index.add([(generation_id, key, summary, f"# Plan\n{summary}") for generation_id, key, summary in STORIES])
+    return index
+
+def test_vectorize_ignores_stopwords_and_case():
+    assert np.array_equal(vectorize("Reset the PASSWORD", 256), vectorize("reset password", 256))
+    assert not vectorize("the and of", 256).any()
+
+def test_nearest_plan_ranks_first():
+    matches = _index().search("Reset my password via email", "User resets a forgotten password")
+    assert matches[0]["id"] == "g1"
+    assert matches[0]["score"] > matches[1]["score"]
+
+def test_one_match_per_issue():
+    index = _index()
+    index.add([("g4", "AB-1", "Reset password by email link", "# Plan\nnewer plan")])
+    matches = index.search("Reset password by email link", "")
+    keys = [match["jira_issue_id"] for match in matches]
+    assert len(keys) == len(set(keys))
+
+def test_same_generation_is_indexed_once():
+    index = _index()
+    index.add([("g1", "AB-1", "Reset password by email link", "# Plan\nagain")])
+    assert index.stats()["documents"] == len(STORIES)
+
+def test_own_issue_is_excluded():
+    matches = _index().search("Reset password by email link", "", exclude_issue="AB-1")
+    assert "AB-1" not in [match["jira_issue_id"] for match in matches]
+
+def test_rows_grow_on_demand_and_recycle_the_oldest():
+    index = SimilarityIndex(max_documents=100, dimensions=64)
+    assert index._summaries.rows.shape[0] == 0
+    index._loaded = True
+    index.add([(f"g{i}", f"AB-{i}", f"story {i}", "") for i in range(150)])
+    assert index._summaries.rows.shape == (100, 64)
+    assert index.stats()["documents"] == 100
+    assert "g0" not in index._ids and "g149" in index._ids
+
+def test_trim_example_cuts_at_a_line():
+    assert trim_example("line one\nline two\nline three", max_chars=15) == "line one"
+    assert trim_example("short", max_chars=15) == "short"